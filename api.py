@@ -0,0 +1,210 @@
+"""Local HTTP API serving the dashboard aggregates as JSON.
+
+    python api.py --port 8502
+
+``GET /aggregates`` returns the header KPIs, the match counts and funnel
+(fuzzy linkage matches counted apart, as on the Match tab), and the
+conversion per corso and per provider, for the filters in the query string
+(all optional, applied as the sidebar applies them)::
+
+    /aggregates?corso=<corso>&corso=...&provider=...&start=2025-01-01&end=2025-03-31
+
+With several datasets (see datasets.py) ``dataset=<name>`` picks one;
+``GET /datasets`` lists them, with the version of those already loaded.
+
+Each dataset is loaded by a watcher (see watcher.py) that reloads it in the
+background when new exports arrive, building the cubes and indexes of
+``metrics.Engine`` once per load. Response bodies are kept in memory by
+data version and filters and carry an ETag derived from both: a client
+that sends it back in ``If-None-Match`` gets a 304, with nothing computed,
+until the data changes. The server listens on 127.0.0.1 unless told
+otherwise: it is meant for tools running on the same host.
+"""
+import argparse
+import json
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import cube
+import dataset
+import datasets
+import export
+import figures
+import metrics
+import report
+import watcher
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _engine(source):
+    """Watcher build function of ``source``: its version and Engine."""
+    def build(deal_file, lead_file):
+        parsed = dataset.read_exports(
+            dataset.pending({"deals": deal_file, "leads": lead_file}, False, source.cache_dir)
+        )
+        deals = dataset.load_export(deal_file, "deals", source.cache_dir, parsed.get("deals"))
+        leads = dataset.load_export(lead_file, "leads", source.cache_dir, parsed.get("leads"))
+        version = dataset.data_version(deal_file, lead_file, source.cache_dir)
+        return version, metrics.Engine(deals, leads)
+    return build
+
+
+def parse_filters(query):
+    """Corsi, providers and whole-day start/end of a parsed query string;
+    lists are sorted so that the same filters give the same key."""
+    def day(name):
+        values = query.get(name)
+        if not values:
+            return None
+        try:
+            return pd.Timestamp(values[-1]).floor("D")
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"data non valida per {name}: {values[-1]!r}")
+
+    start, end = day("start"), day("end")
+    if (start is None) != (end is None):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "start ed end vanno indicati insieme")
+    if start is not None and end < start:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "end precede start")
+    return sorted(set(query.get("corso", []))), sorted(set(query.get("provider", []))), start, end
+
+
+def aggregates(engine, corsi, providers, start, end):
+    """The metrics of one filter set, JSON-ready."""
+    out = engine.report(corsi, providers, start, end)
+    deal_cells = cube.select(engine.deal_cube, corsi, providers, start, end)
+    out["conversione_provider"] = metrics.conversion_by_corso(deal_cells, "PROVIDER")
+    out["filtri"] = {"corso": corsi, "provider": providers, "start": start, "end": end}
+    return report.json_value(out)
+
+
+class Api:
+    """Aggregates of the datasets under ``data_dir``; ``interval`` is the
+    watchers' polling period and ``max_bytes`` bounds the cached bodies."""
+
+    def __init__(self, data_dir=dataset.DATA_DIR, interval=10.0, max_bytes=64 * 2**20):
+        self.data_dir = data_dir
+        self.interval = interval
+        self.cache = export.ExportCache(max_bytes)
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def sources(self):
+        return datasets.discover(self.data_dir)
+
+    def watcher(self, name=None):
+        sources = self.sources()
+        if not sources:
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "nessun export trovato")
+        source = sources.get(name) if name else next(iter(sources.values()))
+        if source is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"dataset sconosciuto: {name!r}")
+        with self._lock:
+            w = self._watchers.get(source.name)
+            if w is None:
+                w = self._watchers[source.name] = watcher.Watcher(
+                    _engine(source), [dataset.DEAL_PATTERN, dataset.LEAD_PATTERN],
+                    source.data_dir, self.interval,
+                ).start()
+        return source, w
+
+    def datasets(self):
+        out = []
+        for name in self.sources():
+            w = self._watchers.get(name)
+            out.append({"dataset": name, "version": w.data[0] if w and w.data else None})
+        return out
+
+    def aggregates(self, query, if_none_match=None):
+        """``(etag, body)`` for a parsed query string; body is None when
+        ``if_none_match`` already names the current ETag."""
+        filters = parse_filters(query)
+        source, w = self.watcher((query.get("dataset") or [None])[-1])
+        try:
+            version, engine = w.get()
+        except FileNotFoundError:
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "export non trovati")
+        etag = '"' + figures.fingerprint(source.name, version, filters) + '"'
+        if if_none_match and etag in (t.strip() for t in if_none_match.split(",")):
+            return etag, None
+        body = self.cache.get(etag, lambda: json.dumps(
+            {"dataset": source.name, "version": version, **aggregates(engine, *filters)},
+            ensure_ascii=False,
+        ).encode("utf-8"))
+        return etag, body
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "dealandlead-api"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        api = self.server.api
+        try:
+            if url.path == "/aggregates":
+                etag, body = api.aggregates(parse_qs(url.query), self.headers.get("If-None-Match"))
+            elif url.path == "/datasets":
+                etag, body = None, json.dumps(api.datasets(), ensure_ascii=False).encode("utf-8")
+            else:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"percorso sconosciuto: {url.path}")
+        except ApiError as exc:
+            return self._send(exc.status, json.dumps({"errore": str(exc)}, ensure_ascii=False).encode("utf-8"))
+        if body is None:
+            return self._send(HTTPStatus.NOT_MODIFIED, None, etag)
+        self._send(HTTPStatus.OK, body, etag)
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            # Revalidate on every poll: a 304 until the data changes.
+            self.send_header("Cache-Control", "no-cache")
+        if body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+
+def serve(api, host="127.0.0.1", port=8502):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.api = api
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--data-dir", type=Path, default=dataset.DATA_DIR)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--watch", type=float, default=10.0,
+                        help="secondi tra i controlli di nuovi export (0: mai)")
+    parser.add_argument("--cache-mb", type=float, default=64, help="memoria per le risposte in cache")
+    args = parser.parse_args(argv)
+
+    api = Api(str(args.data_dir), args.watch, int(args.cache_mb * 2**20))
+    server = serve(api, args.host, args.port)
+    print(f"API su http://{args.host}:{server.server_port}/aggregates", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,27 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import numpy as np
 import os
-import glob
+import dataclasses
+
+import cube
+import cohort
+import dataset
+import datasets
+import export
+import figures
+import filters
+import history
+import join
+import linkage
+import metrics
+import perf
+import search
+import shared
+import sketch
+import sqlstore
+import table
+import watcher
 
 # ── Config ──────────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -13,10 +30,16 @@ st.set_page_config(
     layout="wide",
 )
 
+# Opt-in stage timings (see perf.py): DASHBOARD_PERF=time|memory, or
+# ?perf=time in the URL (memory tracing is process-wide: operator only).
+# Runs are appended to PERF_LOG.
+PERF_LOG = os.environ.get("DASHBOARD_PERF_LOG", os.path.join(dataset.CACHE_DIR, "perf.jsonl"))
+perf_rec = perf.Recorder(
+    perf.request_level(st.query_params.get("perf"), os.environ.get("DASHBOARD_PERF"))
+)
+
 # ── Helpers ─────────────────────────────────────────────────────────────────
-DATA_DIR = os.path.dirname(os.path.abspath(__file__))
-DEAL_FILE = max(glob.glob(os.path.join(DATA_DIR, "DealDatatable*.xlsx")), key=os.path.getmtime)
-LEAD_FILE = max(glob.glob(os.path.join(DATA_DIR, "LeadArchiveDatatable*.xlsx")), key=os.path.getmtime)
+DATA_DIR = dataset.DATA_DIR
 
 COLORS = {
     "concluso": "#2ecc71",
@@ -38,72 +61,274 @@ LEAD_COLORS = {
 }
 
 
-@st.cache_data
-def load_data():
-    deals = pd.read_excel(DEAL_FILE)
-    leads = pd.read_excel(LEAD_FILE)
+# "incremental" keeps one stored dataset per kind and applies only the rows
+# that changed in each new export; "full" converts every export on its own.
+INGEST_MODE = os.environ.get("DASHBOARD_INGEST", "incremental")
+
+
+# The loaded frames are published as memory-mapped files (see shared.py)
+# that every server process on the host maps instead of holding its own copy.
+SHARED_DATA = os.environ.get("DASHBOARD_SHARED", "1").strip().lower() not in ("0", "false", "off")
+
+
+# "sqlite" runs the sidebar filters and chart aggregations as SQL on a local
+# database (see sqlstore.py) instead of on the in-memory cubes.
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "memory")
+
+# Seconds between checks of DATA_DIR for new exports (0: only on refresh).
+WATCH_INTERVAL = float(os.environ.get("DASHBOARD_WATCH", "10"))
+
+# Time allowed from the start of a rerun until the sidebar and KPI row are
+# drawn; the perf panel (DASHBOARD_PERF) reports runs that go over it.
+STARTUP_BUDGET_MS = float(os.environ.get("DASHBOARD_STARTUP_BUDGET_MS", "300"))
+
+# Memory for the datasets kept loaded (see datasets.py), in MB: switching
+# back to one of them is immediate, the least recently used go first.
+DATASET_BUDGET_MB = float(os.environ.get("DASHBOARD_DATASET_BUDGET_MB", "1024"))
+
+
+def load_data(deal_file, lead_file, cache_dir=dataset.CACHE_DIR):
+    # Parsed exports are kept as Parquet next to the data (see dataset.py),
+    # so Excel is only read again when a file's content changes. The frames
+    # are shared by every session without copies: never mutate them.
+    version = dataset.data_version(deal_file, lead_file, cache_dir)
+    shared_dir = os.path.join(cache_dir, "shared")
+    if SHARED_DATA:
+        # Another process already loaded this version: map it.
+        frames = shared.attach(version, ["deals", "leads"], shared_dir)
+        if frames is not None:
+            meta = shared.read_meta(version, shared_dir)
+            if meta is None:
+                meta = dataset.sidebar_meta(frames["deals"], frames["leads"])
+            # The ingest's changesets come with it, so that this process
+            # updates the stored cohorts instead of rebuilding them.
+            changes = [dataset.Changeset(**ch) for ch in meta.get("changes", [])]
+            return frames["deals"], frames["leads"], changes, version, meta
+    # Exports with new content are parsed first, both at once.
+    parsed = dataset.read_exports(
+        dataset.pending({"deals": deal_file, "leads": lead_file}, INGEST_MODE != "full", cache_dir)
+    )
+    if INGEST_MODE == "full":
+        deals = dataset.load_export(deal_file, "deals", cache_dir, parsed.get("deals"))
+        leads = dataset.load_export(lead_file, "leads", cache_dir, parsed.get("leads"))
+        changes = []
+    else:
+        deals, deal_changes = dataset.ingest(deal_file, "deals", cache_dir, parsed.get("deals"))
+        leads, lead_changes = dataset.ingest(lead_file, "leads", cache_dir, parsed.get("leads"))
+        changes = [deal_changes, lead_changes]
+    # What the sidebar offers, worked out here once rather than per session
+    meta = dataset.sidebar_meta(deals, leads)
+    meta["changes"] = [dataclasses.asdict(ch) for ch in changes]
+    if SHARED_DATA:
+        frames = shared.publish(version, {"deals": deals, "leads": leads}, shared_dir, meta)
+        if frames is not None:
+            deals, leads = frames["deals"], frames["leads"]
+    return deals, leads, changes, version, meta
+
+
+@st.cache_data(ttl=60)
+def data_sources():
+    # The datasets under DATA_DIR (see datasets.py), looked up once a minute.
+    return datasets.discover(DATA_DIR)
+
+
+@st.cache_resource
+def dataset_cache():
+    # One watcher per loaded dataset, within DATASET_BUDGET_MB; an evicted
+    # dataset stops being watched and is reloaded when selected again.
+    return datasets.DatasetCache(
+        DATASET_BUDGET_MB * 2**20,
+        sizeof=lambda w: datasets.frames_nbytes(w.data or ()),
+        on_evict=release,
+    )
+
+
+def release(w):
+    # The indexes built from an evicted dataset reference its frames: drop
+    # them too, or the frames would stay in memory past the budget. Not
+    # when the watcher was a duplicate of a dataset still loaded.
+    w.stop()
+    if not w.data:
+        return
+    version = w.data[3]
+    if any(v.data and v.data[3] == version for v in dataset_cache().values()):
+        return
+    cache_dirs = [s.cache_dir for s in data_sources().values() if s.data_dir == w.data_dir]
+    for kind in ("deals", "leads"):
+        search_index.clear(None, version, kind)
+        sort_index.clear(None, version, kind)
+    for loader in (load_cubes, load_filters, load_join, load_linkage):
+        loader.clear(None, None, version)
+    load_sketches.clear(None, version)
+    memory_report.clear(version)
+    for cache_dir in cache_dirs:
+        load_store.clear(None, None, version, cache_dir)
+        load_cohorts.clear(None, None, None, version, cache_dir)
+
+
+def data_watcher():
+    # Reloads in a background thread when new exports land in the dataset's
+    # directory and swaps the result in (see watcher.py): reruns never wait
+    # on a reload.
+    def start():
+        w = watcher.Watcher(
+            lambda deal_file, lead_file: load_data(deal_file, lead_file, source.cache_dir),
+            [dataset.DEAL_PATTERN, dataset.LEAD_PATTERN], source.data_dir, WATCH_INTERVAL,
+        ).start()
+        try:
+            w.get()  # first load, so that the cache can weigh it
+        except BaseException:
+            w.stop()  # not cached: a retry starts a watcher of its own
+            raise
+        return w
+
+    return dataset_cache().get(source.name, start)
+
+
+@st.cache_data(max_entries=2)
+def memory_report(version):
+    return dataset.memory_report({"Deal": deals, "Lead": leads})
+
+
+@st.cache_resource
+def figure_cache():
+    # Built tab figures, shared by sessions drawing from the same data.
+    return figures.FigureCache()
+
+
+@st.cache_resource
+def export_cache():
+    # Generated downloads, shared by sessions with the same data and filters.
+    return export.ExportCache()
+
+
+@st.cache_resource(max_entries=4)
+def search_index(_df, version, kind):
+    # Built once per data load; ``version`` identifies the load.
+    return search.SearchIndex(_df)
+
+
+@st.cache_resource(max_entries=4)
+def sort_index(_df, version, kind):
+    # Column ranks for server-side table sorting, filled in column by column.
+    return table.SortIndex(_df)
+
+
+@st.cache_resource(max_entries=2)
+def load_cubes(_deals, _leads, version):
+    # Count/sum cubes the charts are rolled up from, one build per data load.
+    return cube.build_deals(_deals, f"{version}/deals"), cube.build_leads(_leads, f"{version}/leads")
+
+
+@st.cache_resource(max_entries=2)
+def load_sketches(_deals, version):
+    # Quantile sketch cells of the concluded deals, one build per data load.
+    return sketch.build(_deals, f"{version}/sketches")
+
+
+@st.cache_resource(max_entries=2)
+def load_store(_deals, _leads, version, cache_dir):
+    # SQLite copy of the aggregated columns, written once per data version.
+    return sqlstore.open_store(
+        version, {"deals": _deals, "leads": _leads}, os.path.join(cache_dir, "sqlite")
+    )
+
+
+@st.cache_resource(max_entries=2)
+def load_filters(_deals, _leads, version):
+    # Value postings and date order for the sidebar filters (see filters.py).
+    return filters.build(_deals, _leads)
+
+
+@st.cache_resource(max_entries=2)
+def load_join(_leads, _deals, version):
+    # Lead ↔ Deal pairs by ID LEAD / LEAD_ID; filtered joins derive from it.
+    return join.JoinIndex(_leads, _deals)
 
-    # Normalize column names
-    deals.columns = deals.columns.str.strip()
-    leads.columns = leads.columns.str.strip()
 
-    # Parse dates
-    for col in ["DATA INGRESSO LEAD", "DATA APPUNTAMENTI", "DATA ESITO"]:
-        if col in deals.columns:
-            deals[col] = pd.to_datetime(deals[col], errors="coerce")
-    for col in ["DATA ENTRATA", "DATA USCITA"]:
-        if col in leads.columns:
-            leads[col] = pd.to_datetime(leads[col], errors="coerce")
+@st.cache_resource(max_entries=2)
+def load_linkage(_leads, _deals, version):
+    # Name/email/phone pairs among rows the LEAD_ID join leaves unmatched.
+    index = load_join(_leads, _deals, version)
+    return linkage.Linkage(_leads, _deals, index.pair_lead, index.pair_deal)
 
-    # Clean stato
-    deals["STATO"] = deals["STATO"].astype(str).str.strip().str.lower()
-    leads["STATO"] = leads["STATO"].astype(str).str.strip()
 
-    # Flag vendite concluse
-    deals["IS_CONCLUSO"] = deals["STATO"] == "concluso"
+@st.cache_resource(max_entries=2)
+def load_cohorts(_deals, _leads, _changes, version, cache_dir):
+    # Stored weekly cohorts, updated with the rows this load's ingest changed.
+    return cohort.load(_leads, _deals, _changes, version, cache_dir)
 
-    return deals, leads
+
+@st.cache_resource(max_entries=2)
+def load_history(_snapshots, key, cache_dir):
+    # STATO changes across every deal export; ``key`` lists the exports. The
+    # stored history only reads exports it does not cover yet.
+    return history.load(_snapshots, cache_dir)
 
 
 # ── Load data ───────────────────────────────────────────────────────────────
+sources = data_sources()
+if not sources:
+    st.error(
+        "File non trovati. Assicurati che i file Excel siano nella cartella `data/`."
+    )
+    st.stop()
+st.sidebar.image(
+    "https://img.icons8.com/fluency/96/combo-chart.png", width=64
+)
+if len(sources) > 1:
+    # One deployment, several academies: each has its exports in a subfolder
+    source = sources[st.sidebar.selectbox("Dataset", list(sources), key="dataset")]
+else:
+    source = next(iter(sources.values()))
+
 try:
-    deals, leads = load_data()
+    with perf_rec.stage("caricamento dati"):
+        loader = data_watcher()
+        deals, leads, changes, data_version, sidebar_meta = loader.get()
 except FileNotFoundError:
     st.error(
         "File non trovati. Assicurati che i file Excel siano nella cartella `data/`."
     )
     st.stop()
 
+
 # ── Sidebar filters ────────────────────────────────────────────────────────
-st.sidebar.image(
-    "https://img.icons8.com/fluency/96/combo-chart.png", width=64
-)
 st.sidebar.title("Filtri")
 
-# Pulsante per aggiornare i dati
+# I nuovi export vengono caricati in automatico; il pulsante forza una
+# ricarica in background
 if st.sidebar.button("🔄 Aggiorna dati", key="refresh_button"):
-        st.cache_data.clear()
-        st.rerun()
+    loader.refresh()
+    st.sidebar.caption("Aggiornamento avviato: i nuovi dati compaiono alla prossima interazione.")
+if loader.error is not None:
+    st.sidebar.warning(f"Ultimo caricamento non riuscito: {loader.error}")
+if len(sources) > 1:
+    dc = dataset_cache()
+    st.sidebar.caption(
+        f"Dataset in memoria: {len(dc.names)} ({dc.nbytes / 2**20:,.0f} di "
+        f"{DATASET_BUDGET_MB:,.0f} MB) · {dc.hits:,} riusi, {dc.misses:,} caricamenti, "
+        f"{dc.evictions:,} rimossi"
+    )
+
+for ch in changes:
+    if not ch.empty and not ch.full:
+        st.sidebar.caption(
+            f"Ultimo import {ch.kind}: +{len(ch.inserted)} nuovi, "
+            f"{len(ch.updated)} modificati, −{len(ch.deleted)} rimossi"
+        )
 
 # Corso filter
-all_corsi = sorted(
-    set(deals["CORSI"].dropna().unique()) | set(leads["CORSI"].dropna().unique())
-)
+all_corsi = sidebar_meta["corsi"]
 sel_corsi = st.sidebar.multiselect("Corso", all_corsi, default=[])
 
 # Provider filter (deal only)
-all_providers = sorted(deals["PROVIDER"].dropna().unique())
+all_providers = sidebar_meta["providers"]
 sel_providers = st.sidebar.multiselect("Provider", all_providers, default=[])
 
 # Date range
-min_date = min(
-    deals["DATA INGRESSO LEAD"].min(),
-    leads["DATA ENTRATA"].min(),
-)
-max_date = max(
-    deals["DATA INGRESSO LEAD"].max(),
-    leads["DATA ENTRATA"].max(),
-)
+min_date = pd.Timestamp(sidebar_meta["min_date"])
+max_date = pd.Timestamp(sidebar_meta["max_date"])
 if pd.isna(min_date):
     min_date = pd.Timestamp("2025-01-01")
 if pd.isna(max_date):
@@ -115,28 +340,49 @@ date_range = st.sidebar.date_input(
     max_value=max_date.date(),
 )
 
-# Apply filters
-df_deals = deals.copy()
-df_leads = leads.copy()
-
-if sel_corsi:
-    df_deals = df_deals[df_deals["CORSI"].isin(sel_corsi)]
-    df_leads = df_leads[df_leads["CORSI"].isin(sel_corsi)]
-if sel_providers:
-    df_deals = df_deals[df_deals["PROVIDER"].isin(sel_providers)]
+start = end = None
 if len(date_range) == 2:
+    # Whole days, both ends included
     start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
-    df_deals = df_deals[
-        df_deals["DATA INGRESSO LEAD"].between(start, end, inclusive="both")
-        | df_deals["DATA INGRESSO LEAD"].isna()
-    ]
-    df_leads = df_leads[
-        df_leads["DATA ENTRATA"].between(start, end, inclusive="both")
-        | df_leads["DATA ENTRATA"].isna()
-    ]
-
-conclusi = df_deals[df_deals["IS_CONCLUSO"]]
-non_conclusi = df_deals[~df_deals["IS_CONCLUSO"]]
+
+filter_key = (data_version, tuple(sel_corsi), tuple(sel_providers), start, end)
+
+
+def memo(name, build, *args, key=(), share=None):
+    """``build(*args)``, kept in the session until the filters, data or
+    ``key`` change. With ``share`` (the data the result is drawn from), it
+    is also shared with every session drawing from the same data."""
+    cache = st.session_state.setdefault("_memo", {})
+    hit = cache.get(name)
+    if hit is None or hit[0] != (filter_key, key):
+        with perf_rec.stage(f"calcolo {name}"):
+            if share is None:
+                value = build(*args)
+            else:
+                value = figure_cache().get(name, figures.fingerprint(*share), build, *args)
+            hit = cache[name] = ((filter_key, key), value)
+    return hit[1]
+
+
+def filter_rows():
+    """Positions of the deal and lead rows passing the sidebar filters."""
+    indexes = load_filters(deals, leads, data_version)
+    return filters.select_rows(indexes, sel_corsi, sel_providers, start, end)
+
+
+# Charts and KPIs read the same filters off the pre-aggregated cubes
+with perf_rec.stage("filtri"):
+    if BACKEND == "sqlite":
+        # Stand-ins for the cells: every rollup below runs as a SQL query.
+        store = load_store(deals, leads, data_version, source.cache_dir)
+        deal_cells = store.cells("deals", sel_corsi, sel_providers, start, end)
+        lead_cells = store.cells("leads", sel_corsi, None, start, end)
+    else:
+        deal_cube, lead_cube = load_cubes(deals, leads, data_version)
+        deal_cells = cube.select(deal_cube, sel_corsi, sel_providers, start, end)
+        lead_cells = cube.select(lead_cube, sel_corsi, None, start, end)
+    conclusi = metrics.concluded(deal_cells)
+    non_conclusi = cube.equal(deal_cells, "STATO", metrics.CONCLUSO, keep=False)
 
 # ── Header ──────────────────────────────────────────────────────────────────
 st.title("📊 Click Academy – Lead & Vendite")
@@ -144,88 +390,81 @@ st.markdown("Dashboard di confronto tra lead in ingresso e trattative commercial
 
 # ── KPI row ─────────────────────────────────────────────────────────────────
 k1, k2, k3, k4, k5 = st.columns(5)
-k1.metric("Lead totali", f"{len(df_leads):,}")
-k2.metric("Deal totali", f"{len(df_deals):,}")
-k3.metric("Vendite concluse", f"{len(conclusi):,}")
-tasso = (len(conclusi) / len(df_deals) * 100) if len(df_deals) > 0 else 0
-k4.metric("Tasso conversione", f"{tasso:.1f}%")
-fatturato = conclusi["IMPORTO CONTRATTO"].sum()
-k5.metric("Fatturato concluso", f"€ {fatturato:,.0f}")
+with perf_rec.stage("KPI"):
+    kpi = memo("kpi", metrics.kpis, deal_cells, lead_cells)
+n_leads = kpi["n_leads"]
+k1.metric("Lead totali", f"{n_leads:,}")
+k2.metric("Deal totali", f"{kpi['n_deals']:,}")
+k3.metric("Vendite concluse", f"{kpi['n_conclusi']:,}")
+k4.metric("Tasso conversione", f"{kpi['tasso']:.1f}%")
+k5.metric("Fatturato concluso", f"€ {kpi['fatturato']:,.0f}")
+startup_ms = perf_rec.mark("avvio (sidebar e KPI)") * 1000
 
 st.divider()
 
 # ════════════════════════════════════════════════════════════════════════════
 # TAB LAYOUT
 # ════════════════════════════════════════════════════════════════════════════
-tab_overview, tab_deals, tab_leads, tab_match, tab_detail = st.tabs(
+# Tabs track which one is open and only the open tab is computed. What a tab
+# builds is kept in the session (see memo) until the filters or data change.
+tab_overview, tab_deals, tab_leads, tab_match, tab_detail, tab_history = st.tabs(
     [
         "📈 Overview",
         "💼 Deal / Vendite",
         "📋 Lead Archive",
         "🔗 Match Lead ↔ Deal",
         "🔍 Dettaglio dati",
-    ]
+        "🕓 Storico stati",
+    ],
+    key="active_tab",
+    on_change="rerun",
 )
 
+# The build_* functions import plotly themselves: it is loaded when a tab
+# first draws a chart, after the sidebar and KPI row are on screen.
+def plotly_chart(fig, **kwargs):
+    """``st.plotly_chart``, timed per figure when instrumentation is on."""
+    with perf_rec.stage(f"grafico {fig.layout.title.text or ''}".strip()):
+        st.plotly_chart(fig, **kwargs)
+
+
 # ════════════════════════════════════════════════════════════════════════════
 # TAB 1 – OVERVIEW
 # ════════════════════════════════════════════════════════════════════════════
-with tab_overview:
-    st.subheader("Panoramica generale")
+def build_overview(deal_cells, lead_cells):
+    import plotly.express as px
+    import plotly.graph_objects as go
 
-    col1, col2 = st.columns(2)
+    figs = {}
 
     # --- Deal per stato ---
-    with col1:
-        stato_counts = (
-            df_deals["STATO"]
-            .value_counts()
-            .reset_index()
-            .rename(columns={"STATO": "Stato", "count": "N"})
-        )
-        colors_mapped = [COLORS.get(s, "#bdc3c7") for s in stato_counts["Stato"]]
-        fig = px.bar(
-            stato_counts,
-            x="Stato",
-            y="N",
-            color="Stato",
-            color_discrete_map=COLORS,
-            title="Deal per Stato",
-        )
-        fig.update_layout(showlegend=False)
-        st.plotly_chart(fig, use_container_width=True)
+    stato_counts = cube.counts(deal_cells, "STATO").rename(columns={"STATO": "Stato"})
+    fig = px.bar(
+        stato_counts,
+        x="Stato",
+        y="N",
+        color="Stato",
+        color_discrete_map=COLORS,
+        title="Deal per Stato",
+    )
+    fig.update_layout(showlegend=False)
+    figs["deal_stato"] = fig
 
     # --- Lead per stato ---
-    with col2:
-        lead_stato = (
-            df_leads["STATO"]
-            .value_counts()
-            .reset_index()
-            .rename(columns={"STATO": "Stato", "count": "N"})
-        )
-        fig2 = px.bar(
-            lead_stato,
-            x="Stato",
-            y="N",
-            color="Stato",
-            color_discrete_map=LEAD_COLORS,
-            title="Lead per Stato",
-        )
-        fig2.update_layout(showlegend=False)
-        st.plotly_chart(fig2, use_container_width=True)
+    lead_stato = cube.counts(lead_cells, "STATO").rename(columns={"STATO": "Stato"})
+    fig2 = px.bar(
+        lead_stato,
+        x="Stato",
+        y="N",
+        color="Stato",
+        color_discrete_map=LEAD_COLORS,
+        title="Lead per Stato",
+    )
+    fig2.update_layout(showlegend=False)
+    figs["lead_stato"] = fig2
 
     # --- Confronto Lead vs Conclusi per Corso ---
-    st.subheader("Lead vs Vendite Concluse per Corso")
-
-    lead_per_corso = (
-        df_leads.groupby("CORSI").size().reset_index(name="Lead")
-    )
-    deal_conclusi_per_corso = (
-        conclusi.groupby("CORSI").size().reset_index(name="Conclusi")
-    )
-    confronto = lead_per_corso.merge(deal_conclusi_per_corso, on="CORSI", how="outer").fillna(0)
-    confronto["Conclusi"] = confronto["Conclusi"].astype(int)
-    confronto["Lead"] = confronto["Lead"].astype(int)
+    confronto = metrics.leads_vs_conclusi(lead_cells, deal_cells)
     confronto = confronto.sort_values("Lead", ascending=True)
 
     fig3 = go.Figure()
@@ -254,14 +493,10 @@ with tab_overview:
         xaxis_title="Conteggio",
         yaxis_title="",
     )
-    st.plotly_chart(fig3, use_container_width=True)
+    figs["confronto"] = fig3
 
     # --- Tasso conversione per corso ---
-    st.subheader("Tasso di conversione per Corso")
-    deal_per_corso_all = df_deals.groupby("CORSI").size().reset_index(name="Deal Totali")
-    conv = deal_per_corso_all.merge(deal_conclusi_per_corso, on="CORSI", how="left").fillna(0)
-    conv["Conclusi"] = conv["Conclusi"].astype(int)
-    conv["Tasso %"] = (conv["Conclusi"] / conv["Deal Totali"] * 100).round(1)
+    conv = metrics.conversion_by_corso(deal_cells)
     conv = conv.sort_values("Tasso %", ascending=True)
 
     fig_conv = px.bar(
@@ -274,44 +509,59 @@ with tab_overview:
         title="Tasso di conversione Deal → Concluso per Corso",
     )
     fig_conv.update_layout(height=450)
-    st.plotly_chart(fig_conv, use_container_width=True)
+    figs["conv"] = fig_conv
+    return figs
+
+
+with tab_overview:
+    if tab_overview.open:
+        with perf_rec.stage("tab Overview"):
+            figs = memo("overview", build_overview, deal_cells, lead_cells, share=(deal_cells, lead_cells))
+            st.subheader("Panoramica generale")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                plotly_chart(figs["deal_stato"], use_container_width=True)
+            with col2:
+                plotly_chart(figs["lead_stato"], use_container_width=True)
+
+            st.subheader("Lead vs Vendite Concluse per Corso")
+            plotly_chart(figs["confronto"], use_container_width=True)
+
+            st.subheader("Tasso di conversione per Corso")
+            plotly_chart(figs["conv"], use_container_width=True)
 
 # ════════════════════════════════════════════════════════════════════════════
 # TAB 2 – DEAL / VENDITE
 # ════════════════════════════════════════════════════════════════════════════
-with tab_deals:
-    st.subheader("Vendite Concluse")
-
-    c1, c2 = st.columns(2)
-    with c1:
-        # Conclusi per corso
-        conc_corso = conclusi.groupby("CORSI").size().reset_index(name="N")
-        fig_cc = px.pie(
-            conc_corso,
-            names="CORSI",
-            values="N",
-            title="Vendite concluse per Corso",
-            hole=0.4,
-        )
-        st.plotly_chart(fig_cc, use_container_width=True)
-
-    with c2:
-        # Conclusi per provider
-        conc_prov = conclusi.groupby("PROVIDER").size().reset_index(name="N")
-        fig_cp = px.pie(
-            conc_prov,
-            names="PROVIDER",
-            values="N",
-            title="Vendite concluse per Provider",
-            hole=0.4,
-        )
-        st.plotly_chart(fig_cp, use_container_width=True)
+def build_deals(conclusi, non_conclusi):
+    import plotly.express as px
+
+    figs = {}
+
+    # Conclusi per corso
+    conc_corso = cube.rollup(conclusi, "CORSI")
+    figs["conc_corso"] = px.pie(
+        conc_corso,
+        names="CORSI",
+        values="N",
+        title="Vendite concluse per Corso",
+        hole=0.4,
+    )
+
+    # Conclusi per provider
+    conc_prov = cube.rollup(conclusi, "PROVIDER")
+    figs["conc_prov"] = px.pie(
+        conc_prov,
+        names="PROVIDER",
+        values="N",
+        title="Vendite concluse per Provider",
+        hole=0.4,
+    )
 
     # Fatturato per corso
     fatt_corso = (
-        conclusi.groupby("CORSI")["IMPORTO CONTRATTO"]
-        .sum()
-        .reset_index()
+        cube.rollup(conclusi, "CORSI", "IMPORTO CONTRATTO")
         .sort_values("IMPORTO CONTRATTO", ascending=True)
     )
     fig_fatt = px.bar(
@@ -324,54 +574,36 @@ with tab_deals:
         color_continuous_scale="Greens",
     )
     fig_fatt.update_layout(height=400)
-    st.plotly_chart(fig_fatt, use_container_width=True)
+    figs["fatturato"] = fig_fatt
 
     # Modalità di pagamento
-    c3, c4 = st.columns(2)
-    with c3:
-        pag = conclusi.groupby("MODALITÀ PAGAMENTO").size().reset_index(name="N")
-        fig_pag = px.pie(pag, names="MODALITÀ PAGAMENTO", values="N",
-                         title="Modalità di pagamento (conclusi)", hole=0.4)
-        st.plotly_chart(fig_pag, use_container_width=True)
-
-    with c4:
-        # Commerciale performance
-        comm = conclusi.groupby("COMMERCIALE").size().reset_index(name="N").sort_values("N", ascending=True)
-        fig_comm = px.bar(comm, y="COMMERCIALE", x="N", orientation="h",
-                          title="Vendite concluse per Commerciale", color="N",
-                          color_continuous_scale="Blues")
-        st.plotly_chart(fig_comm, use_container_width=True)
-
-    st.divider()
-    st.subheader("Deal NON conclusi (altri stati)")
-
-    c5, c6 = st.columns(2)
-    with c5:
-        nc_stato = non_conclusi["STATO"].value_counts().reset_index()
-        nc_stato.columns = ["Stato", "N"]
-        fig_nc = px.pie(nc_stato, names="Stato", values="N",
-                        title="Distribuzione stati non conclusi",
-                        color="Stato", color_discrete_map=COLORS, hole=0.4)
-        st.plotly_chart(fig_nc, use_container_width=True)
-
-    with c6:
-        # Sottostato dei non conclusi
-        nc_sotto = (
-            non_conclusi["SOTTOSTATO"]
-            .dropna()
-            .value_counts()
-            .head(15)
-            .reset_index()
-        )
-        nc_sotto.columns = ["Sottostato", "N"]
-        fig_sotto = px.bar(nc_sotto, x="N", y="Sottostato", orientation="h",
-                           title="Top 15 Sotto-stati (deal non conclusi)",
-                           color="N", color_continuous_scale="Reds")
-        fig_sotto.update_layout(height=450)
-        st.plotly_chart(fig_sotto, use_container_width=True)
+    pag = cube.rollup(conclusi, "MODALITÀ PAGAMENTO")
+    figs["pagamento"] = px.pie(pag, names="MODALITÀ PAGAMENTO", values="N",
+                               title="Modalità di pagamento (conclusi)", hole=0.4)
+
+    # Commerciale performance
+    comm = cube.rollup(conclusi, "COMMERCIALE").sort_values("N", ascending=True)
+    figs["commerciale"] = px.bar(comm, y="COMMERCIALE", x="N", orientation="h",
+                                 title="Vendite concluse per Commerciale", color="N",
+                                 color_continuous_scale="Blues")
+
+    nc_stato = cube.counts(non_conclusi, "STATO")
+    nc_stato.columns = ["Stato", "N"]
+    figs["nc_stato"] = px.pie(nc_stato, names="Stato", values="N",
+                              title="Distribuzione stati non conclusi",
+                              color="Stato", color_discrete_map=COLORS, hole=0.4)
+
+    # Sottostato dei non conclusi
+    nc_sotto = cube.counts(non_conclusi, "SOTTOSTATO").head(15)
+    nc_sotto.columns = ["Sottostato", "N"]
+    fig_sotto = px.bar(nc_sotto, x="N", y="Sottostato", orientation="h",
+                       title="Top 15 Sotto-stati (deal non conclusi)",
+                       color="N", color_continuous_scale="Reds")
+    fig_sotto.update_layout(height=450)
+    figs["nc_sotto"] = fig_sotto
 
     # Non conclusi per corso
-    nc_corso = non_conclusi.groupby(["CORSI", "STATO"]).size().reset_index(name="N")
+    nc_corso = cube.rollup(non_conclusi, ["CORSI", "STATO"])
     fig_nc_corso = px.bar(
         nc_corso,
         x="CORSI",
@@ -382,152 +614,265 @@ with tab_deals:
         barmode="stack",
     )
     fig_nc_corso.update_layout(xaxis_tickangle=-45, height=500)
-    st.plotly_chart(fig_nc_corso, use_container_width=True)
+    figs["nc_corso"] = fig_nc_corso
+    return figs
+
+
+QUANTILE_BREAKDOWNS = {"Totale": None, "Commerciale": "COMMERCIALE", "Provider": "PROVIDER", "Corso": "CORSI"}
+QUANTILE_METRICS = {sketch.DAYS: "Giorni", sketch.AMOUNT: "Importo €"}
+
+
+def build_quantiles(by):
+    cells = cube.select(load_sketches(deals, data_version), sel_corsi, sel_providers, start, end)
+    q = sketch.quantiles(cells, by).rename(columns={cube.N: "Vendite"})
+    q[sketch.METRIC] = q[sketch.METRIC].map(QUANTILE_METRICS)
+    stats = ["Vendite"] + [c for c in q.columns if c.startswith("p")]
+    q[stats[1:]] = q[stats[1:]].round(0)
+    if by is None or q.empty:
+        return q.rename(columns={sketch.METRIC: ""})
+    wide = q.pivot(index=by, columns=sketch.METRIC, values=stats)
+    wide.columns = [f"{metric} {stat}" for stat, metric in wide.columns]
+    order = [f"{m} {s}" for m in QUANTILE_METRICS.values() for s in stats]
+    wide = wide[[c for c in order if c in wide.columns]]
+    counts = [c for c in wide.columns if c.endswith("Vendite")]
+    wide[counts] = wide[counts].astype("Int64")
+    return wide.sort_values(counts[0], ascending=False).reset_index()
+
+
+with tab_deals:
+    if tab_deals.open:
+        with perf_rec.stage("tab Deal / Vendite"):
+            figs = memo("deals", build_deals, conclusi, non_conclusi, share=(deal_cells,))
+            st.subheader("Vendite Concluse")
+
+            c1, c2 = st.columns(2)
+            with c1:
+                plotly_chart(figs["conc_corso"], use_container_width=True)
+            with c2:
+                plotly_chart(figs["conc_prov"], use_container_width=True)
+
+            plotly_chart(figs["fatturato"], use_container_width=True)
+
+            c3, c4 = st.columns(2)
+            with c3:
+                plotly_chart(figs["pagamento"], use_container_width=True)
+            with c4:
+                plotly_chart(figs["commerciale"], use_container_width=True)
+
+            st.subheader("Distribuzione: giorni alla conclusione e importo")
+            st.caption(
+                "Mediana (p50), p90 e p99 delle vendite concluse: giorni dall'ingresso "
+                "del lead all'esito e importo del contratto (approssimati entro l'1%)."
+            )
+            quantile_by = QUANTILE_BREAKDOWNS[st.radio(
+                "Suddividi per", list(QUANTILE_BREAKDOWNS), horizontal=True, key="quantile_by"
+            )]
+            quant = memo(
+                "quantili", build_quantiles, quantile_by, key=quantile_by,
+                share=(data_version, quantile_by, tuple(sel_corsi), tuple(sel_providers), start, end),
+            )
+            st.dataframe(quant, use_container_width=True, hide_index=True)
+
+            st.divider()
+            st.subheader("Deal NON conclusi (altri stati)")
+
+            c5, c6 = st.columns(2)
+            with c5:
+                plotly_chart(figs["nc_stato"], use_container_width=True)
+            with c6:
+                plotly_chart(figs["nc_sotto"], use_container_width=True)
+
+            plotly_chart(figs["nc_corso"], use_container_width=True)
 
 
 # ════════════════════════════════════════════════════════════════════════════
 # TAB 3 – LEAD ARCHIVE
 # ════════════════════════════════════════════════════════════════════════════
-with tab_leads:
-    st.subheader("Analisi Lead Archive")
-
-    c1, c2 = st.columns(2)
-
-    with c1:
-        # Lead per stato
-        ls = df_leads["STATO"].value_counts().reset_index()
-        ls.columns = ["Stato", "N"]
-        fig_ls = px.pie(ls, names="Stato", values="N",
-                        title="Lead per Stato",
-                        color="Stato", color_discrete_map=LEAD_COLORS, hole=0.4)
-        st.plotly_chart(fig_ls, use_container_width=True)
-
-    with c2:
-        # Lead per provider
-        lp = df_leads["PROVIDER"].value_counts().reset_index()
-        lp.columns = ["Provider", "N"]
-        fig_lp = px.pie(lp, names="Provider", values="N",
-                        title="Lead per Provider", hole=0.4)
-        st.plotly_chart(fig_lp, use_container_width=True)
+def build_leads(lead_cells):
+    import plotly.express as px
+
+    figs = {}
+
+    # Lead per stato
+    ls = cube.counts(lead_cells, "STATO")
+    ls.columns = ["Stato", "N"]
+    figs["stato"] = px.pie(ls, names="Stato", values="N",
+                           title="Lead per Stato",
+                           color="Stato", color_discrete_map=LEAD_COLORS, hole=0.4)
+
+    # Lead per provider
+    lp = cube.counts(lead_cells, "PROVIDER")
+    lp.columns = ["Provider", "N"]
+    figs["provider"] = px.pie(lp, names="Provider", values="N",
+                              title="Lead per Provider", hole=0.4)
 
     # Lead per corso
-    st.subheader("Lead per Corso")
-    lc = df_leads.groupby("CORSI").size().reset_index(name="N").sort_values("N", ascending=True)
+    lc = cube.rollup(lead_cells, "CORSI").sort_values("N", ascending=True)
     fig_lc = px.bar(lc, y="CORSI", x="N", orientation="h",
                     title="Numero di Lead per Corso", color="N",
                     color_continuous_scale="Blues")
     fig_lc.update_layout(height=500)
-    st.plotly_chart(fig_lc, use_container_width=True)
+    figs["corso"] = fig_lc
 
     # Lead per corso e stato (stacked)
-    st.subheader("Lead per Corso e Stato")
-    lcs = df_leads.groupby(["CORSI", "STATO"]).size().reset_index(name="N")
+    lcs = cube.rollup(lead_cells, ["CORSI", "STATO"])
     fig_lcs = px.bar(lcs, x="CORSI", y="N", color="STATO",
                      color_discrete_map=LEAD_COLORS,
                      title="Distribuzione stati Lead per Corso",
                      barmode="stack")
     fig_lcs.update_layout(xaxis_tickangle=-45, height=500)
-    st.plotly_chart(fig_lcs, use_container_width=True)
+    figs["corso_stato"] = fig_lcs
 
     # Sotto-stato lead
-    st.subheader("Sotto-stati Lead")
-    lss = df_leads["SOTTOSTATO"].dropna().value_counts().head(20).reset_index()
+    lss = cube.counts(lead_cells, "SOTTOSTATO").head(20)
     lss.columns = ["Sottostato", "N"]
     fig_lss = px.bar(lss, x="N", y="Sottostato", orientation="h",
                      title="Top 20 Sotto-stati Lead", color="N",
                      color_continuous_scale="Oranges")
     fig_lss.update_layout(height=500)
-    st.plotly_chart(fig_lss, use_container_width=True)
+    figs["sottostato"] = fig_lss
 
     # Costo lead per provider
-    st.subheader("Costo Lead per Provider")
-    cost = df_leads.groupby("PROVIDER").agg(
-        Costo_Totale=("COSTO LEAD", "sum"),
-        N_Lead=("COSTO LEAD", "count"),
-        Costo_Medio=("COSTO LEAD", "mean"),
-    ).reset_index().sort_values("Costo_Totale", ascending=True)
-
-    fig_cost = px.bar(cost, y="PROVIDER", x="Costo_Totale", orientation="h",
-                      title="Costo totale Lead per Provider",
-                      color="Costo_Medio",
-                      color_continuous_scale="YlOrRd",
-                      hover_data=["N_Lead", "Costo_Medio"])
-    st.plotly_chart(fig_cost, use_container_width=True)
+    cost = cube.rollup(lead_cells, "PROVIDER", "COSTO LEAD").merge(
+        cube.rollup(lead_cells, "PROVIDER", cube.count_col("COSTO LEAD")), on="PROVIDER"
+    ).rename(columns={"COSTO LEAD": "Costo_Totale", cube.count_col("COSTO LEAD"): "N_Lead"})
+    cost["Costo_Medio"] = cost["Costo_Totale"] / cost["N_Lead"]
+    cost = cost.sort_values("Costo_Totale", ascending=True)
+
+    figs["costo"] = px.bar(cost, y="PROVIDER", x="Costo_Totale", orientation="h",
+                           title="Costo totale Lead per Provider",
+                           color="Costo_Medio",
+                           color_continuous_scale="YlOrRd",
+                           hover_data=["N_Lead", "Costo_Medio"])
 
     # Timeline lead entrata
-    st.subheader("Andamento Lead nel tempo")
-    leads_time = df_leads.dropna(subset=["DATA ENTRATA"]).copy()
-    leads_time["Settimana"] = leads_time["DATA ENTRATA"].dt.to_period("W").dt.start_time
-    lt = leads_time.groupby("Settimana").size().reset_index(name="N")
-    fig_lt = px.line(lt, x="Settimana", y="N", title="Lead in ingresso per settimana",
-                     markers=True)
-    st.plotly_chart(fig_lt, use_container_width=True)
+    lt, period = figures.coarsen(cube.weekly(lead_cells), "Settimana", "N")
+    figs["timeline"] = px.line(lt, x="Settimana", y="N", title=f"Lead in ingresso per {period}",
+                               labels={"Settimana": period.capitalize()},
+                               **figures.line_style(len(lt)))
+    return figs
+
+
+with tab_leads:
+    if tab_leads.open:
+        with perf_rec.stage("tab Lead Archive"):
+            figs = memo("leads", build_leads, lead_cells, share=(lead_cells,))
+            st.subheader("Analisi Lead Archive")
+
+            c1, c2 = st.columns(2)
+            with c1:
+                plotly_chart(figs["stato"], use_container_width=True)
+            with c2:
+                plotly_chart(figs["provider"], use_container_width=True)
+
+            st.subheader("Lead per Corso")
+            plotly_chart(figs["corso"], use_container_width=True)
+
+            st.subheader("Lead per Corso e Stato")
+            plotly_chart(figs["corso_stato"], use_container_width=True)
+
+            st.subheader("Sotto-stati Lead")
+            plotly_chart(figs["sottostato"], use_container_width=True)
+
+            st.subheader("Costo Lead per Provider")
+            plotly_chart(figs["costo"], use_container_width=True)
+
+            st.subheader("Andamento Lead nel tempo")
+            plotly_chart(figs["timeline"], use_container_width=True)
+
+
+# ── Paged tables ────────────────────────────────────────────────────────────
+PAGE_SIZES = [50, 100, 500, 1000]
+
+
+def frame_keys(df, kind):
+    """Sort keys of rows of ``df``, for :func:`paged_table`."""
+    return lambda col, rows: sort_index(df, data_version, kind).keys(col, rows)
+
+
+def join_keys(sel):
+    """Sort keys of rows of the join ``sel``, for :func:`paged_table`."""
+    def keys(col, rows):
+        side, src, pos = sel.source(col)
+        df, kind = (leads, "leads") if side == "lead" else (deals, "deals")
+        return sort_index(df, data_version, kind).keys(src, pos[rows])
+    return keys
+
+
+def paged_table(name, rows, columns, sort_keys, take, query="", height=500):
+    """One page of ``take(rows)``: sorting and paging run on row positions
+    here, and only the visible rows are built and sent to the browser."""
+    c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
+    sort_col = c1.selectbox(
+        "Ordina per", [None] + list(columns),
+        format_func=lambda c: "—" if c is None else c, key=f"{name}_sort",
+    )
+    descending = c2.toggle("Decrescente", key=f"{name}_desc")
+    page_size = c3.selectbox("Righe per pagina", PAGE_SIZES, key=f"{name}_size")
+    n_pages = max(1, -(-len(rows) // page_size))
+    if st.session_state.get(f"{name}_page", 1) > n_pages:
+        st.session_state[f"{name}_page"] = n_pages
+    page = c4.number_input("Pagina", 1, n_pages, key=f"{name}_page")
+
+    if sort_col is not None:
+        rows = memo(
+            f"{name}_order",
+            lambda: rows[table.sort_order(sort_keys(sort_col, rows), descending)],
+            key=(query, sort_col, descending),
+        )
+    lo = (page - 1) * page_size
+    hi = min(lo + page_size, len(rows))
+    with perf_rec.stage(f"tabella {name}"):
+        st.dataframe(take(rows[lo:hi]), use_container_width=True, height=height)
+    st.caption(f"Righe {lo + 1 if hi else 0:,}–{hi:,} di {len(rows):,} · pagina {page} di {n_pages}")
 
 
 # ════════════════════════════════════════════════════════════════════════════
 # TAB 4 – MATCH LEAD ↔ DEAL
 # ════════════════════════════════════════════════════════════════════════════
-with tab_match:
-    st.subheader("Unione Lead ↔ Deal tramite LEAD_ID (colonna B)")
-    st.markdown(
-        "Questa sezione unisce i dati dei due file utilizzando **LEAD_ID** "
-        "(colonna B di entrambi i file) come chiave di collegamento."
-    )
+def build_join():
+    deal_pos, lead_pos = memo("rows", filter_rows)
+    return load_join(leads, deals, data_version).select(lead_pos, deal_pos)
 
-    # Merge
-    merged = df_leads.merge(
-        df_deals,
-        left_on="ID LEAD",
-        right_on="LEAD_ID",
-        how="outer",
-        suffixes=("_lead", "_deal"),
-        indicator=True,
-    )
 
-    # Stats
-    both = merged[merged["_merge"] == "both"]
-    only_lead = merged[merged["_merge"] == "left_only"]
-    only_deal = merged[merged["_merge"] == "right_only"]
+def build_match(sel, n_leads_tot):
+    import plotly.express as px
+    import plotly.graph_objects as go
 
-    m1, m2, m3 = st.columns(3)
-    m1.metric("Match (entrambi)", f"{len(both):,}")
-    m2.metric("Solo in Lead Archive", f"{len(only_lead):,}")
-    m3.metric("Solo in Deal", f"{len(only_deal):,}")
+    # Stats; unmatched rows that are likely the same person (re-created
+    # leads) count as fuzzy matches
+    fuzzy = load_linkage(leads, deals, data_version).select(sel.lead_pos, sel.deal_pos)
+    both = metrics.matched(sel)
+    out = metrics.match(sel, n_leads_tot, both, fuzzy)
+    out["fuzzy"] = fuzzy
+    n_fuzzy, n_only_lead, n_only_deal = out["n_fuzzy"], out["n_only_lead"], out["n_only_deal"]
 
     # Venn-like chart
     fig_venn = go.Figure()
     fig_venn.add_trace(go.Bar(
-        x=["Solo Lead Archive", "Match", "Solo Deal"],
-        y=[len(only_lead), len(both), len(only_deal)],
-        marker_color=["#3498db", "#2ecc71", "#e74c3c"],
-        text=[len(only_lead), len(both), len(only_deal)],
+        x=["Solo Lead Archive", "Match", "Match fuzzy", "Solo Deal"],
+        y=[n_only_lead, len(both), n_fuzzy, n_only_deal],
+        marker_color=["#3498db", "#2ecc71", "#f1c40f", "#e74c3c"],
+        text=[n_only_lead, len(both), n_fuzzy, n_only_deal],
         textposition="auto",
     ))
     fig_venn.update_layout(title="Distribuzione Match Lead ↔ Deal")
-    st.plotly_chart(fig_venn, use_container_width=True)
+    out["venn"] = fig_venn
 
     # Matched records: lead stato vs deal stato
     if len(both) > 0:
-        st.subheader("Stato Lead vs Stato Deal (record matchati)")
-
-        c1, c2 = st.columns(2)
-        with c1:
-            stato_lead_m = both["STATO_lead"].value_counts().reset_index()
-            stato_lead_m.columns = ["Stato Lead", "N"]
-            fig_slm = px.pie(stato_lead_m, names="Stato Lead", values="N",
-                             title="Stato Lead (matchati)", hole=0.4)
-            st.plotly_chart(fig_slm, use_container_width=True)
-
-        with c2:
-            stato_deal_m = both["STATO_deal"].value_counts().reset_index()
-            stato_deal_m.columns = ["Stato Deal", "N"]
-            fig_sdm = px.pie(stato_deal_m, names="Stato Deal", values="N",
-                             title="Stato Deal (matchati)", hole=0.4,
-                             color="Stato Deal", color_discrete_map=COLORS)
-            st.plotly_chart(fig_sdm, use_container_width=True)
+        stato_lead_m = both["STATO_lead"].value_counts().reset_index()
+        stato_lead_m.columns = ["Stato Lead", "N"]
+        out["stato_lead"] = px.pie(stato_lead_m, names="Stato Lead", values="N",
+                                   title="Stato Lead (matchati)", hole=0.4)
+
+        stato_deal_m = both["STATO_deal"].value_counts().reset_index()
+        stato_deal_m.columns = ["Stato Deal", "N"]
+        out["stato_deal"] = px.pie(stato_deal_m, names="Stato Deal", values="N",
+                                   title="Stato Deal (matchati)", hole=0.4,
+                                   color="Stato Deal", color_discrete_map=COLORS)
 
         # Heatmap Lead Stato → Deal Stato
-        st.subheader("Matrice Stato Lead → Stato Deal")
         cross = pd.crosstab(both["STATO_lead"], both["STATO_deal"])
         fig_heat = px.imshow(
             cross,
@@ -537,105 +882,317 @@ with tab_match:
             labels=dict(x="Stato Deal", y="Stato Lead", color="Conteggio"),
         )
         fig_heat.update_layout(height=400)
-        st.plotly_chart(fig_heat, use_container_width=True)
+        out["heatmap"] = fig_heat
 
         # Funnel: lead → deal → concluso
-        st.subheader("Funnel: Lead → Deal → Vendita Conclusa")
-        n_leads_tot = len(df_leads)
-        n_matched = len(both)
-        n_conclusi_match = len(both[both["STATO_deal"] == "concluso"])
-
+        funnel = out["funnel"]
         fig_funnel = go.Figure(go.Funnel(
-            y=["Lead Totali", "Lead con Deal", "Vendite Concluse"],
-            x=[n_leads_tot, n_matched, n_conclusi_match],
+            y=list(funnel),
+            x=list(funnel.values()),
             textinfo="value+percent initial",
             marker_color=["#3498db", "#f39c12", "#2ecc71"],
         ))
         fig_funnel.update_layout(title="Funnel di conversione")
-        st.plotly_chart(fig_funnel, use_container_width=True)
-
-        # Tempo medio dal lead alla vendita
-        if "DATA ENTRATA" in both.columns and "DATA ESITO" in both.columns:
-            both_conclusi = both[both["STATO_deal"] == "concluso"].copy()
-            if len(both_conclusi) > 0:
-                both_conclusi["Giorni"] = (
-                    both_conclusi["DATA ESITO"] - both_conclusi["DATA ENTRATA"]
-                ).dt.days
-                valid = both_conclusi.dropna(subset=["Giorni"])
-                if len(valid) > 0:
-                    avg_days = valid["Giorni"].mean()
-                    st.metric("Tempo medio Lead → Conclusione", f"{avg_days:.0f} giorni")
-
-    # Tabella matchata
-    st.subheader("Tabella dati uniti")
-    show_cols = [
-        "ID LEAD", "COGNOME_lead", "NOME_lead", "CORSI_lead",
-        "STATO_lead", "PROVIDER_lead", "STATO_deal", "CORSI_deal",
-        "IMPORTO CONTRATTO", "COMMERCIALE", "_merge",
-    ]
-    available_cols = [c for c in show_cols if c in merged.columns]
-    st.dataframe(
-        merged[available_cols].rename(columns={"_merge": "Presenza"}),
-        use_container_width=True,
-        height=400,
-    )
+        out["funnel_chart"] = fig_funnel
+    return out
+
+
+COHORT_BREAKDOWNS = {"Settimana di ingresso": cohort.WEEK, "Provider": "PROVIDER", "Corso": "CORSI"}
+
+
+def build_cohorts(by):
+    import plotly.express as px
+
+    cohorts = load_cohorts(deals, leads, changes, data_version, source.cache_dir)
+    m = cohorts.matrix(by, sel_corsi, sel_providers, start, end)
+    rates = m.drop(columns=cohort.LEADS)
+    out = {"n_cohorts": len(m)}
+    if rates.empty:
+        return out
+    if by == cohort.WEEK:
+        # Weeks along x: one row per horizon keeps the map readable
+        rates.index = rates.index.strftime("%Y-%m-%d")
+        fig = px.imshow(
+            rates.T, aspect="auto", color_continuous_scale="Greens",
+            labels=dict(x="Settimana di ingresso", y="Entro", color="% conclusi"),
+            title="Conversione a vendita per coorte settimanale",
+        )
+        fig.update_layout(height=320)
+    else:
+        rates = rates.loc[m[cohort.LEADS].sort_values(ascending=False).index].head(30)
+        fig = px.imshow(
+            rates, aspect="auto", text_auto=True, color_continuous_scale="Greens",
+            labels=dict(x="Entro", y=by, color="% conclusi"),
+            title=f"Conversione a vendita per {by} (lead entrati nel periodo)",
+        )
+        fig.update_layout(height=max(320, 28 * len(rates)))
+    out["heatmap"] = fig
+    return out
+
+
+with tab_match:
+    if tab_match.open:
+        with perf_rec.stage("tab Match Lead ↔ Deal"):
+            st.subheader("Unione Lead ↔ Deal tramite LEAD_ID (colonna B)")
+            st.markdown(
+                "Questa sezione unisce i dati dei due file utilizzando **LEAD_ID** "
+                "(colonna B di entrambi i file) come chiave di collegamento."
+            )
+
+            sel = memo("join", build_join)
+            match = memo(
+                "match", build_match, sel, n_leads,
+                share=(data_version, sel.lead_pos, sel.deal_pos, n_leads),
+            )
+
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Match (entrambi)", f"{match['n_both']:,}")
+            m2.metric("Match fuzzy", f"{match['n_fuzzy']:,}",
+                      help="Stessa persona (nome, email o telefono) ma LEAD_ID diverso")
+            m3.metric("Solo in Lead Archive", f"{match['n_only_lead']:,}")
+            m4.metric("Solo in Deal", f"{match['n_only_deal']:,}")
+
+            plotly_chart(match["venn"], use_container_width=True)
+
+            if match["n_both"] > 0:
+                st.subheader("Stato Lead vs Stato Deal (record matchati)")
+
+                c1, c2 = st.columns(2)
+                with c1:
+                    plotly_chart(match["stato_lead"], use_container_width=True)
+                with c2:
+                    plotly_chart(match["stato_deal"], use_container_width=True)
+
+                st.subheader("Matrice Stato Lead → Stato Deal")
+                plotly_chart(match["heatmap"], use_container_width=True)
+
+                st.subheader("Funnel: Lead → Deal → Vendita Conclusa")
+                plotly_chart(match["funnel_chart"], use_container_width=True)
+
+                if match["avg_days"] is not None:
+                    st.metric("Tempo medio Lead → Conclusione", f"{match['avg_days']:.0f} giorni")
+
+            st.subheader("Coorti: conversione entro 7 / 14 / 30 / 60 giorni")
+            st.caption(
+                "Lead raggruppati per settimana di ingresso: quota con un deal concluso "
+                "entro N giorni dall'ingresso. Le coorti troppo recenti per un orizzonte "
+                "restano vuote."
+            )
+            breakdown = COHORT_BREAKDOWNS[st.radio(
+                "Raggruppa per", list(COHORT_BREAKDOWNS), horizontal=True, key="cohort_by"
+            )]
+            coh = memo(
+                "cohorts", build_cohorts, breakdown, key=breakdown,
+                share=(data_version, breakdown, tuple(sel_corsi), tuple(sel_providers), start, end),
+            )
+            if "heatmap" in coh:
+                plotly_chart(coh["heatmap"], use_container_width=True)
+            else:
+                st.info("Nessuna coorte con i filtri selezionati.")
+
+            if match["n_fuzzy"] > 0:
+                st.subheader("Match fuzzy (da verificare)")
+                st.caption(
+                    "Lead e deal senza LEAD_ID in comune ma con email, telefono o nome "
+                    "coincidenti: probabilmente lead ricreati nel CRM. Primi 1.000, "
+                    "punteggio più alto per primo."
+                )
+                fuzzy = match["fuzzy"].sort_values("score", ascending=False, kind="stable").head(1000)
+                st.dataframe(
+                    load_linkage(leads, deals, data_version).frame(fuzzy),
+                    use_container_width=True, hide_index=True, height=300,
+                )
+
+            # Tabella matchata
+            st.subheader("Tabella dati uniti")
+            show_cols = [
+                "ID LEAD", "COGNOME_lead", "NOME_lead", "CORSI_lead",
+                "STATO_lead", "PROVIDER_lead", "STATO_deal", "CORSI_deal",
+                "IMPORTO CONTRATTO", "COMMERCIALE", "_merge",
+            ]
+            paged_table(
+                "match_table", np.arange(len(sel)), show_cols[:-1], join_keys(sel),
+                lambda r: sel.frame(show_cols, rows=r).rename(columns={"_merge": "Presenza"}),
+                height=400,
+            )
 
 
 # ════════════════════════════════════════════════════════════════════════════
 # TAB 5 – DETTAGLIO DATI
 # ════════════════════════════════════════════════════════════════════════════
-with tab_detail:
-    st.subheader("Esplora i dati grezzi")
+def export_buttons(label, name, query, take, rows):
+    """CSV and Parquet downloads of ``take(rows)``, generated on click only."""
+    key = (name, filter_key, query)
+    cache = export_cache()
+
+    def generate(fmt):
+        # Runs on the download request, outside the rerun: logged on its own.
+        rec = perf.Recorder(perf_rec.level, kind="download")
+        with rec.stage(f"export {name} {fmt}"):
+            data = export.export(cache, key, fmt, take, rows)
+        rec.finish(PERF_LOG, rows=len(rows), bytes=len(data))
+        return data
+
+    for col, fmt in zip(st.columns(len(export.FORMATS)), export.FORMATS):
+        fmt_label, ext, mime = export.FORMATS[fmt]
+        col.download_button(
+            f"Scarica {fmt_label} {label}",
+            data=lambda fmt=fmt: generate(fmt),
+            file_name=name + ext,
+            mime=mime,
+            on_click="ignore",
+            key=f"download_{name}_{fmt}",
+        )
 
-    data_choice = st.radio(
-        "Dataset", ["Deal (DealDatatable)", "Lead (LeadArchiveDatatable)", "Dati uniti"],
-        horizontal=True,
-    )
 
-    if data_choice == "Deal (DealDatatable)":
-        search = st.text_input("Cerca (cognome, email, corso...)", key="search_deal")
-        display = df_deals.copy()
-        if search:
-            mask = display.apply(
-                lambda row: row.astype(str).str.contains(search, case=False).any(),
-                axis=1,
+with tab_detail:
+    if tab_detail.open:
+        with perf_rec.stage("tab Dettaglio dati"):
+            st.subheader("Esplora i dati grezzi")
+
+            with st.expander("📦 Memoria dei dataset"):
+                mem_totals, mem_columns = memory_report(data_version)
+                st.dataframe(mem_totals, use_container_width=True, hide_index=True)
+                st.dataframe(mem_columns, use_container_width=True, hide_index=True, height=300)
+
+            data_choice = st.radio(
+                "Dataset", ["Deal (DealDatatable)", "Lead (LeadArchiveDatatable)", "Dati uniti"],
+                horizontal=True,
             )
-            display = display[mask]
-        st.dataframe(display, use_container_width=True, height=500)
-        st.download_button(
-            "Scarica CSV Deal filtrati",
-            display.to_csv(index=False).encode("utf-8"),
-            "deal_filtrati.csv",
-        )
 
-    elif data_choice == "Lead (LeadArchiveDatatable)":
-        search = st.text_input("Cerca (cognome, email, corso...)", key="search_lead")
-        display = df_leads.copy()
-        if search:
-            mask = display.apply(
-                lambda row: row.astype(str).str.contains(search, case=False).any(),
-                axis=1,
+            search_help = (
+                "Cerca per prefisso in cognome, nome, email, telefono, corso e commerciale. "
+                "Più termini vanno tutti trovati; usa `campo:valore` per cercare in un "
+                "solo campo, es. `commerciale:rossi corso:web`."
             )
-            display = display[mask]
-        st.dataframe(display, use_container_width=True, height=500)
-        st.download_button(
-            "Scarica CSV Lead filtrati",
-            display.to_csv(index=False).encode("utf-8"),
-            "lead_filtrati.csv",
-        )
+            deal_pos, lead_pos = memo("rows", filter_rows)
+
+            if data_choice == "Deal (DealDatatable)":
+                query = st.text_input("Cerca (cognome, email, corso...)", key="search_deal", help=search_help)
+                rows = deal_pos
+                if query:
+                    index = search_index(deals, data_version, "deals")
+                    rows = np.intersect1d(rows, index.positions(query), assume_unique=True)
+                paged_table("table_deal", rows, deals.columns, frame_keys(deals, "deals"), deals.take, query)
+                export_buttons("Deal filtrati", "deal_filtrati", query, deals.take, rows)
+
+            elif data_choice == "Lead (LeadArchiveDatatable)":
+                query = st.text_input("Cerca (cognome, email, corso...)", key="search_lead", help=search_help)
+                rows = lead_pos
+                if query:
+                    index = search_index(leads, data_version, "leads")
+                    rows = np.intersect1d(rows, index.positions(query), assume_unique=True)
+                paged_table("table_lead", rows, leads.columns, frame_keys(leads, "leads"), leads.take, query)
+                export_buttons("Lead filtrati", "lead_filtrati", query, leads.take, rows)
+
+            else:
+                query = st.text_input("Cerca", key="search_merged", help=search_help)
+                sel = memo("join", build_join)
+                rows = np.arange(len(sel))
+                if query:
+                    rows = rows[search.join_mask(query, [
+                        (search_index(leads, data_version, "leads"), sel.lead_pos),
+                        (search_index(deals, data_version, "deals"), sel.deal_pos),
+                    ])]
+                paged_table(
+                    "table_merged", rows, sel.columns, join_keys(sel),
+                    lambda r: sel.frame(rows=r), query,
+                )
+                export_buttons("dati uniti", "dati_uniti", query, lambda r: sel.frame(rows=r), rows)
 
-    else:
-        search = st.text_input("Cerca", key="search_merged")
-        display = merged.copy()
-        if search:
-            mask = display.apply(
-                lambda row: row.astype(str).str.contains(search, case=False).any(),
-                axis=1,
+
+# ════════════════════════════════════════════════════════════════════════════
+# TAB 6 – STORICO STATI
+# ════════════════════════════════════════════════════════════════════════════
+def build_history(hist):
+    import plotly.express as px
+
+    out = {"n_deals": hist.events[history.KEY].nunique()}
+    trans = hist.transitions()
+    out["n_transitions"] = len(trans)
+    if len(trans) == 0:
+        return out
+
+    vel, period = figures.coarsen(hist.velocity("W"), "Periodo", "N", by=["A"])
+    out["velocity"] = px.bar(
+        vel, x="Periodo", y="N", color="A",
+        title=f"Cambi di stato per {period} (stato di arrivo)",
+        color_discrete_map=COLORS,
+    )
+
+    dwell = hist.dwell()
+    out["dwell_table"] = dwell
+    fig_dwell = px.bar(
+        dwell.sort_values("Mediana giorni"), y="STATO", x="Mediana giorni", orientation="h",
+        title="Permanenza mediana in ogni stato (giorni)", hover_data=["Uscite", "P90 giorni"],
+        color="STATO", color_discrete_map=COLORS,
+    )
+    fig_dwell.update_layout(showlegend=False)
+    out["dwell"] = fig_dwell
+
+    cross = pd.crosstab(trans["DA"], trans["A"])
+    out["matrix"] = px.imshow(
+        cross, text_auto=True, color_continuous_scale="Blues",
+        title="Transizioni di stato (da → a)",
+        labels=dict(x="A", y="Da", color="Deal"),
+    )
+    out["recent"] = trans.sort_values("DATA", ascending=False, kind="stable").head(1000)
+    return out
+
+
+with tab_history:
+    if tab_history.open:
+        with perf_rec.stage("tab Storico stati"):
+            st.subheader("Storico degli stati dei Deal")
+            snaps = history.snapshots(dataset.DEAL_PATTERN, source.data_dir, source.cache_dir)
+            st.markdown(
+                f"Ogni export `DealDatatable*.xlsx` è una fotografia degli stati dei deal, "
+                f"datata con la modifica del file: **{len(snaps)}** export dal "
+                f"{snaps[0]['time'][:10]} al {snaps[-1]['time'][:10]}."
             )
-            display = display[mask]
-        st.dataframe(display, use_container_width=True, height=500)
-        st.download_button(
-            "Scarica CSV dati uniti",
-            display.to_csv(index=False).encode("utf-8"),
-            "dati_uniti.csv",
+            snap_key = tuple((s["path"], s["digest"], s["time"]) for s in snaps)
+            hist = load_history(snaps, snap_key, source.cache_dir)
+            deal_pos, _ = memo("rows", filter_rows)
+            if len(deal_pos) < len(deals):
+                # Sidebar filters: deals of the current export passing them
+                hist = hist.restrict(deals[history.KEY].to_numpy()[deal_pos])
+            res = memo("history", build_history, hist, key=snap_key, share=(hist.events,))
+
+            h1, h2 = st.columns(2)
+            h1.metric("Deal tracciati", f"{res['n_deals']:,}")
+            h2.metric("Cambi di stato", f"{res['n_transitions']:,}")
+
+            if res["n_transitions"] == 0:
+                st.info("Servono almeno due export con stati diversi per mostrare le transizioni.")
+            else:
+                plotly_chart(res["velocity"], use_container_width=True)
+                c1, c2 = st.columns(2)
+                with c1:
+                    plotly_chart(res["dwell"], use_container_width=True)
+                with c2:
+                    plotly_chart(res["matrix"], use_container_width=True)
+                st.dataframe(res["dwell_table"], use_container_width=True, hide_index=True)
+                st.subheader("Ultimi cambi di stato")
+                st.dataframe(res["recent"], use_container_width=True, hide_index=True, height=400)
+
+
+# ── Instrumentation panel ───────────────────────────────────────────────────
+if perf_rec.enabled:
+    run = perf_rec.finish(
+        PERF_LOG, version=data_version, tab=st.session_state.get("active_tab"),
+        startup_ms=startup_ms, over_budget=startup_ms > STARTUP_BUDGET_MS,
+    )
+    with st.sidebar.expander("⏱️ Prestazioni", expanded=True):
+        st.caption(f"Questa esecuzione: {run['seconds'] * 1000:,.0f} ms (livello: {perf_rec.level})")
+        startup = f"Sidebar e KPI in {startup_ms:,.0f} ms (budget {STARTUP_BUDGET_MS:,.0f} ms)"
+        if startup_ms > STARTUP_BUDGET_MS:
+            st.warning(f"{startup}: oltre il budget")
+        else:
+            st.caption(startup)
+        st.dataframe(perf.stages_frame(run["stages"]), use_container_width=True, hide_index=True)
+        fc = figure_cache()
+        st.caption(f"Cache grafici: {fc.hits:,} riusi, {fc.misses:,} costruzioni")
+        st.caption(f"Ultime esecuzioni registrate in `{PERF_LOG}`")
+        st.dataframe(
+            perf.percentiles(perf.read_log(PERF_LOG)), use_container_width=True, hide_index=True
         )
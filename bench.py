@@ -0,0 +1,385 @@
+"""Benchmarks of the dashboard hot paths on synthetic exports.
+
+    python bench.py --sizes 10k,100k,1M
+    python bench.py --sizes 10k,100k --compare .bench/20260101-120000.json
+
+For every size, synthetic.py generates a Deal and a Lead export of that many
+rows, and each stage below runs on them in the order the dashboard runs
+them: load, per-load indexes, sidebar filters, Lead ↔ Deal join, detail
+search and sorting, and the aggregations behind each tab. A stage is run
+once under tracemalloc for its peak memory, then timed ``--repeat`` times.
+
+Results are written as JSON (with versions and git commit) under
+``.bench/``; ``--compare`` prints the ratio to an earlier report and exits
+with status 1 when a stage got slower than ``--threshold``.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import cube
+import dataset
+import filters
+import join
+import metrics
+import search
+import sketch
+import sqlstore
+import synthetic
+import table
+
+BENCH_DIR = os.path.join(dataset.DATA_DIR, ".bench")
+
+# Slower than this (and by more than NOISE_S) counts as a regression.
+THRESHOLD = 1.25
+NOISE_S = 0.01
+
+# Sidebar selections replayed by the filter, join and tab stages.
+FILTERS = [
+    ([], [], None, None),
+    (["Blender", "Data Analyst"], [], None, None),
+    ([], ["Facebook", "Sito"], pd.Timestamp("2024-01-01"), pd.Timestamp("2024-12-31")),
+    (["Segreteria Amministrativa"], ["CULT ADV"], pd.Timestamp("2022-06-01"), pd.Timestamp("2025-05-31")),
+]
+QUERIES = ["ma", "rossi", "commerciale:commerciale corso:blender", "gmail", "ri lu"]
+
+STAGES = []
+
+
+def stage(name):
+    """Register ``fn(ctx)`` as a benchmark stage; it may store state in ``ctx``."""
+    def register(fn):
+        STAGES.append((name, fn))
+        return fn
+    return register
+
+
+class Context:
+    def __init__(self, deal_raw, lead_raw, excel_max):
+        self.deal_raw = deal_raw
+        self.lead_raw = lead_raw
+        self.n = len(deal_raw)
+        self.excel_max = excel_max
+        self.tmp = tempfile.mkdtemp(prefix="bench-")
+
+
+# ── Load ────────────────────────────────────────────────────────────────────
+@stage("load.excel")
+def load_excel(ctx):
+    # Cold load: Excel parse, normalization and Parquet copy. Only for
+    # sizes an xlsx can hold and that convert in reasonable time.
+    if ctx.n > ctx.excel_max:
+        return False
+    if not hasattr(ctx, "xlsx"):
+        ctx.xlsx = {}
+        for kind, raw in (("deals", ctx.deal_raw), ("leads", ctx.lead_raw)):
+            ctx.xlsx[kind] = os.path.join(ctx.tmp, f"{kind}.xlsx")
+            raw.to_excel(ctx.xlsx[kind], index=False)
+    cache = tempfile.mkdtemp(dir=ctx.tmp)
+    parsed = dataset.read_exports(ctx.xlsx)
+    for kind, path in ctx.xlsx.items():
+        dataset.load_export(path, kind, cache, parsed=parsed[kind])
+
+
+@stage("load.prepare")
+def load_prepare(ctx):
+    ctx.deals = dataset.prepare_deals(ctx.deal_raw.copy())
+    ctx.leads = dataset.prepare_leads(ctx.lead_raw.copy())
+
+
+@stage("load.parquet_write")
+def load_parquet_write(ctx):
+    ctx.deal_parquet = os.path.join(ctx.tmp, "deals.parquet")
+    ctx.lead_parquet = os.path.join(ctx.tmp, "leads.parquet")
+    ctx.deals.to_parquet(ctx.deal_parquet, index=False)
+    ctx.leads.to_parquet(ctx.lead_parquet, index=False)
+
+
+@stage("load.parquet_read")
+def load_parquet_read(ctx):
+    # What a restart costs once the exports are cached.
+    ctx.deals = pd.read_parquet(ctx.deal_parquet)
+    ctx.leads = pd.read_parquet(ctx.lead_parquet)
+
+
+# ── Per-load indexes ────────────────────────────────────────────────────────
+@stage("index.cubes")
+def index_cubes(ctx):
+    ctx.deal_cube = cube.build_deals(ctx.deals)
+    ctx.lead_cube = cube.build_leads(ctx.leads)
+
+
+@stage("index.sketches")
+def index_sketches(ctx):
+    ctx.sketches = sketch.build(ctx.deals)
+
+
+@stage("index.filters")
+def index_filters(ctx):
+    ctx.filters = filters.build(ctx.deals, ctx.leads)
+
+
+@stage("index.join")
+def index_join(ctx):
+    ctx.join = join.JoinIndex(ctx.leads, ctx.deals)
+
+
+@stage("index.search")
+def index_search(ctx):
+    ctx.deal_search = search.SearchIndex(ctx.deals)
+    ctx.lead_search = search.SearchIndex(ctx.leads)
+
+
+@stage("index.sqlite")
+def index_sqlite(ctx):
+    # DASHBOARD_BACKEND=sqlite: database written once per data load.
+    path = os.path.join(tempfile.mkdtemp(dir=ctx.tmp), "bench.db")
+    sqlstore.build(path, {"deals": ctx.deals, "leads": ctx.leads})
+    ctx.store = sqlstore.Store(path)
+
+
+# ── Per-rerun work ──────────────────────────────────────────────────────────
+@stage("filter.sidebar")
+def filter_sidebar(ctx):
+    ctx.selections = []
+    for corsi, providers, start, end in FILTERS:
+        deal_pos, lead_pos = filters.select_rows(ctx.filters, corsi, providers, start, end)
+        deal_cells = cube.select(ctx.deal_cube, corsi, providers, start, end)
+        lead_cells = cube.select(ctx.lead_cube, corsi, None, start, end)
+        ctx.selections.append((deal_pos, lead_pos, deal_cells, lead_cells))
+
+
+@stage("filter.quantiles")
+def filter_quantiles(ctx):
+    # Days-to-close / amount quantiles per commerciale from merged sketches.
+    for corsi, providers, start, end in FILTERS:
+        sketch.quantiles(cube.select(ctx.sketches, corsi, providers, start, end), "COMMERCIALE")
+
+
+@stage("filter.sqlite")
+def filter_sqlite(ctx):
+    # filter.sidebar plus the Overview aggregations, pushed down to SQLite.
+    for corsi, providers, start, end in FILTERS:
+        deal_cells = ctx.store.cells("deals", corsi, providers, start, end)
+        lead_cells = ctx.store.cells("leads", corsi, None, start, end)
+        metrics.kpis(deal_cells, lead_cells)
+        cube.counts(deal_cells, "STATO")
+        cube.counts(lead_cells, "STATO")
+        metrics.leads_vs_conclusi(lead_cells, deal_cells)
+        metrics.conversion_by_corso(deal_cells)
+
+
+@stage("join.select")
+def join_select(ctx):
+    ctx.joins = []
+    for deal_pos, lead_pos, _, _ in ctx.selections:
+        sel = ctx.join.select(lead_pos, deal_pos)
+        sel.frame(rows=slice(0, 100))
+        ctx.joins.append(sel)
+
+
+@stage("search.detail")
+def search_detail(ctx):
+    deal_pos, lead_pos, _, _ = ctx.selections[0]
+    sel = ctx.joins[0]
+    for query in QUERIES:
+        np.intersect1d(deal_pos, ctx.deal_search.positions(query), assume_unique=True)
+        np.intersect1d(lead_pos, ctx.lead_search.positions(query), assume_unique=True)
+        search.join_mask(query, [(ctx.lead_search, sel.lead_pos), (ctx.deal_search, sel.deal_pos)])
+
+
+@stage("table.sort")
+def table_sort(ctx):
+    index = table.SortIndex(ctx.deals)
+    rows = ctx.selections[0][0]
+    for col in ["COGNOME", "DATA ESITO", "IMPORTO CONTRATTO", "STATO"]:
+        order = rows[table.sort_order(index.keys(col, rows), descending=True)]
+        ctx.deals.take(order[:100])
+
+
+# ── Tab aggregations (as in app.py's build_* functions) ─────────────────────
+@stage("tab.overview")
+def tab_overview(ctx):
+    for _, _, deal_cells, lead_cells in ctx.selections:
+        metrics.kpis(deal_cells, lead_cells)
+        cube.counts(deal_cells, "STATO")
+        cube.counts(lead_cells, "STATO")
+        metrics.leads_vs_conclusi(lead_cells, deal_cells)
+        metrics.conversion_by_corso(deal_cells)
+
+
+@stage("tab.deals")
+def tab_deals(ctx):
+    for _, _, deal_cells, _ in ctx.selections:
+        conclusi = metrics.concluded(deal_cells)
+        non_conclusi = cube.equal(deal_cells, "STATO", metrics.CONCLUSO, keep=False)
+        for by in ["CORSI", "PROVIDER", "MODALITÀ PAGAMENTO", "COMMERCIALE"]:
+            cube.rollup(conclusi, by)
+        cube.rollup(conclusi, "CORSI", "IMPORTO CONTRATTO")
+        cube.counts(non_conclusi, "STATO")
+        cube.counts(non_conclusi, "SOTTOSTATO")
+        cube.rollup(non_conclusi, ["CORSI", "STATO"])
+
+
+@stage("tab.leads")
+def tab_leads(ctx):
+    for _, _, _, lead_cells in ctx.selections:
+        for by in ["STATO", "PROVIDER", "SOTTOSTATO"]:
+            cube.counts(lead_cells, by)
+        cube.rollup(lead_cells, "CORSI")
+        cube.rollup(lead_cells, ["CORSI", "STATO"])
+        cube.rollup(lead_cells, "PROVIDER", "COSTO LEAD").merge(
+            cube.rollup(lead_cells, "PROVIDER", cube.count_col("COSTO LEAD")), on="PROVIDER"
+        )
+        cube.weekly(lead_cells)
+
+
+@stage("tab.match")
+def tab_match(ctx):
+    for sel, (_, _, _, lead_cells) in zip(ctx.joins, ctx.selections):
+        both = metrics.matched(sel)
+        metrics.match(sel, cube.total(lead_cells), both)
+        pd.crosstab(both["STATO_lead"], both["STATO_deal"])
+
+
+# ── Runner ──────────────────────────────────────────────────────────────────
+def measure(fn, ctx, repeat):
+    """``(times_s, peak_mb)`` of ``fn(ctx)``, or None if it does not apply."""
+    tracemalloc.start()
+    try:
+        if fn(ctx) is False:
+            return None
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(ctx)
+        times.append(time.perf_counter() - t0)
+    return times, peak / 2**20
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 10**3, "m": 10**6}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=dataset.DATA_DIR,
+            capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat, excel_max, only=None):
+    results = []
+    for n in sizes:
+        deal_raw, lead_raw = synthetic.exports(n)
+        ctx = Context(deal_raw, lead_raw, excel_max)
+        try:
+            for name, fn in STAGES:
+                if only and not any(name == x or name.startswith(x + ".") for x in only):
+                    # Untimed: later stages read the state it leaves in ctx.
+                    if name != "load.excel":
+                        fn(ctx)
+                    continue
+                measured = measure(fn, ctx, repeat)
+                if measured is None:
+                    continue
+                times, peak_mb = measured
+                results.append({
+                    "size": n,
+                    "stage": name,
+                    "seconds": statistics.median(times),
+                    "min_seconds": min(times),
+                    "peak_mb": round(peak_mb, 2),
+                })
+                print(f"{n:>10,}  {name:<20} {results[-1]['seconds']:9.4f}s  {peak_mb:9.1f} MB",
+                      file=sys.stderr)
+        finally:
+            shutil.rmtree(ctx.tmp, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline per stage; return the regressed ones."""
+    old = {(r["size"], r["stage"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'righe':>10}  {'fase':<20} {'prima':>9} {'ora':>9} {'rapporto':>8}  {'MB prima':>9} {'MB ora':>9}")
+    for r in results:
+        base = old.get((r["size"], r["stage"]))
+        if base is None:
+            continue
+        # Best runs are compared: they are the least disturbed by noise.
+        now, before = r["min_seconds"], base["min_seconds"]
+        ratio = now / before if before else float("inf")
+        slower = ratio > threshold and now - before > NOISE_S
+        if slower:
+            regressions.append(r)
+        print(
+            f"{r['size']:>10,}  {r['stage']:<20} {before:9.4f} {now:9.4f} "
+            f"{ratio:8.2f}  {base['peak_mb']:9.1f} {r['peak_mb']:9.1f}" + ("  ← REGRESSIONE" if slower else "")
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10k,100k,1M", help="righe per export, es. 10k,100k,1M,10M")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--excel-max", type=parse_size, default=50_000,
+                        help="righe massime per la fase load.excel (lenta)")
+    parser.add_argument("--only", action="append", help="solo questa fase o il suo gruppo, es. load o table.sort (ripetibile)")
+    parser.add_argument("--out", help="file JSON del report (default: .bench/<data>.json)")
+    parser.add_argument("--compare", help="report precedente da confrontare")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    results = run(sizes, args.repeat, args.excel_max, args.only)
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(BENCH_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"Report: {out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Weekly lead cohorts and their conversion to a sale within 7/14/30/60 days.
+
+Leads are grouped by week of entry (``DATA ENTRATA``), PROVIDER and CORSI.
+A lead converts within ``h`` days when a deal with its ``LEAD_ID`` is
+``concluso`` with a ``DATA ESITO`` at most ``h`` days after the lead's entry
+(the earliest such deal counts).
+
+Two tables are kept in the cache directory:
+
+- one row per lead with its cohort and days to sale (``GIORNI``);
+- per cohort (week × PROVIDER × CORSI), the number of leads and of leads
+  converted within each horizon. The counts add up, so any breakdown is a
+  sum over these rows.
+
+A new export only changes the leads its :class:`dataset.Changeset` touched
+(leads by key, deals by ``LEAD_ID``): their old rows are subtracted from the
+cohort counts and their new rows added, instead of recomputing the whole
+history. The store is written the same way, like the export store of
+dataset.py: a base with both tables plus, per update, a part holding the
+touched keys, their new rows and the count changes, so an update writes
+what it changed rather than the whole history. Every ``MAX_PARTS`` parts
+the base is rewritten. When the stored tables do not match the exports the
+changesets were applied to, everything is rebuilt.
+
+Cohorts too recent for a horizon to have fully elapsed by the latest date
+in the data are left out of that horizon's rate.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import dataset
+
+HORIZONS = [7, 14, 30, 60]
+WEEK = "SETTIMANA"
+DIMS = ["PROVIDER", "CORSI"]
+KEY = dataset.KEYS["leads"]
+DAYS = "GIORNI"
+LEADS = "Lead"
+COHORT_VERSION = 2
+MAX_PARTS = dataset.MAX_DELTAS
+
+
+def horizon_col(h):
+    return f"Conclusi {h}g"
+
+
+def lead_rows(leads, deals, keys=None):
+    """Cohort and days to sale of each lead (only those in ``keys``, if given)."""
+    if keys is not None:
+        leads = leads[leads[KEY].isin(keys)]
+        deals = deals[deals[dataset.KEYS["deals"]].isin(keys)]
+    won = deals.loc[deals["IS_CONCLUSO"], [dataset.KEYS["deals"], "DATA ESITO"]].dropna()
+    first = won.groupby(dataset.KEYS["deals"])["DATA ESITO"].min()
+    entry = leads["DATA ENTRATA"]
+    days = (leads[KEY].map(first) - entry).dt.days
+    return pd.DataFrame({
+        KEY: leads[KEY].to_numpy(),
+        WEEK: entry.dt.to_period("W").dt.start_time.to_numpy(),
+        "PROVIDER": leads["PROVIDER"].astype("string").to_numpy(),
+        "CORSI": leads["CORSI"].astype("string").to_numpy(),
+        DAYS: days.to_numpy(dtype="float64", na_value=np.nan),
+    }).dropna(subset=[WEEK])
+
+
+def counts(rows, sign=1):
+    """Leads and conversions per cohort of ``rows``, times ``sign``."""
+    table = rows[[WEEK, *DIMS]].copy()
+    table[LEADS] = sign
+    for h in HORIZONS:
+        table[horizon_col(h)] = (rows[DAYS] <= h).astype("int64") * sign
+    return table.groupby([WEEK, *DIMS], dropna=False).sum().reset_index()
+
+
+def _sum(tables):
+    table = pd.concat(tables, ignore_index=True)
+    return table.groupby([WEEK, *DIMS], dropna=False).sum().reset_index()
+
+
+class Cohorts:
+    """Per-lead cohort rows and per-cohort counts of one data load."""
+
+    def __init__(self, rows, table, as_of):
+        self.rows = rows
+        self.table = table
+        self.as_of = as_of
+
+    @classmethod
+    def build(cls, leads, deals):
+        rows = lead_rows(leads, deals)
+        return cls(rows, counts(rows), _as_of(leads, deals))
+
+    def update(self, leads, deals, keys):
+        """The cohorts after the leads in ``keys`` changed: only their rows
+        are recomputed, and their old and new counts applied."""
+        return self.apply(*self.delta(leads, deals, keys), _as_of(leads, deals))
+
+    def delta(self, leads, deals, keys):
+        """``(keys, rows, counts)`` of the leads in ``keys`` after they
+        changed: their new rows and the change to the cohort counts."""
+        keys = pd.Index(keys).unique()
+        old = self.rows[self.rows[KEY].isin(keys)]
+        new = lead_rows(leads, deals, keys)
+        return keys, new, _sum([counts(old, -1), counts(new)])
+
+    def apply(self, keys, rows, delta, as_of):
+        """The cohorts with a :meth:`delta` applied."""
+        rows = pd.concat([self.rows[~self.rows[KEY].isin(keys)], rows], ignore_index=True)
+        table = _sum([self.table, delta])
+        return Cohorts(rows, table[table[LEADS] > 0].reset_index(drop=True), as_of)
+
+    def matrix(self, by=WEEK, corsi=(), providers=(), start=None, end=None):
+        """Conversion % within each horizon per value of ``by`` (``WEEK``,
+        PROVIDER or CORSI), over the cohorts matching the filters. Columns
+        are the horizons (as "7 giorni"...) plus ``Lead``."""
+        t = self.table
+        if corsi:
+            t = t[t["CORSI"].isin(corsi)]
+        if providers:
+            t = t[t["PROVIDER"].isin(providers)]
+        if start is not None and end is not None:
+            t = t[t[WEEK].between(pd.Timestamp(start) - pd.Timedelta(days=6), end)]
+        out = pd.DataFrame({LEADS: t.groupby(by, dropna=False)[LEADS].sum()})
+        # Lead age at the data's latest date, from the end of its week
+        age = (self.as_of - (t[WEEK] + pd.Timedelta(days=6))).dt.days
+        for h in HORIZONS:
+            mature = age >= h
+            n = t[LEADS].where(mature, 0).groupby(t[by], dropna=False).sum()
+            won = t[horizon_col(h)].where(mature, 0).groupby(t[by], dropna=False).sum()
+            out[f"{h} giorni"] = (won / n.replace(0, np.nan) * 100).round(1)
+        return out
+
+
+def _as_of(leads, deals):
+    return max(leads["DATA ENTRATA"].max(), deals["DATA ESITO"].max())
+
+
+def _store_dir(cache_dir):
+    return os.path.join(cache_dir, "cohorts")
+
+
+def _part(store, name, n=None):
+    return os.path.join(store, f"{name}.parquet" if n is None else f"{name}-{n:04d}.parquet")
+
+
+def _read_store(store, manifest):
+    as_of = pd.Timestamp(manifest["as_of"])
+    stored = Cohorts(pd.read_parquet(_part(store, "rows")), pd.read_parquet(_part(store, "table")), as_of)
+    for n in manifest["parts"]:
+        keys = pd.read_parquet(_part(store, "keys", n))[KEY]
+        part = pd.read_parquet(_part(store, "rows", n)), pd.read_parquet(_part(store, "table", n))
+        stored = stored.apply(keys, *part, as_of)
+    return stored
+
+
+def _write(df, path):
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def _write_base(store, cohorts, manifest):
+    _write(cohorts.rows, _part(store, "rows"))
+    _write(cohorts.table, _part(store, "table"))
+    for n in manifest.get("parts", []):
+        for name in ("keys", "rows", "table"):
+            stale = _part(store, name, n)
+            if os.path.exists(stale):
+                os.remove(stale)
+    manifest["parts"] = []
+
+
+def load(leads, deals, changes=(), state=None, cache_dir=dataset.CACHE_DIR):
+    """:class:`Cohorts` of the frames; ``state`` identifies the data load
+    (e.g. its version) and ``changes`` are the :class:`dataset.Changeset`
+    that produced it, which allow an incremental update of the stored
+    cohorts."""
+    store = _store_dir(cache_dir)
+    manifest = dataset._read_manifest(store)
+    usable = manifest and manifest.get("version") == COHORT_VERSION
+    stored = None
+    if usable:
+        try:
+            stored = _read_store(store, manifest)
+        except (OSError, ValueError, KeyError):
+            stored = None
+    if stored is not None and state is not None and manifest.get("state") == state:
+        return stored
+
+    by_kind = {ch.kind: ch for ch in changes}
+    sources = manifest.get("sources", {}) if manifest else {}
+    incremental = (
+        stored is not None
+        and set(by_kind) == {"leads", "deals"}
+        and all(not ch.full and ch.base and ch.base == sources.get(k) for k, ch in by_kind.items())
+    )
+    keys = [k for ch in changes for k in ch.touched] if incremental else []
+    part = None
+    if keys:
+        part = stored.delta(leads, deals, keys)
+        cohorts = stored.apply(*part, _as_of(leads, deals))
+    elif incremental:
+        cohorts = Cohorts(stored.rows, stored.table, _as_of(leads, deals))
+    else:
+        cohorts = Cohorts.build(leads, deals)
+
+    try:
+        os.makedirs(store, exist_ok=True)
+        if not incremental or len(manifest["parts"]) >= MAX_PARTS:
+            manifest = manifest if usable else {}
+            _write_base(store, cohorts, manifest)
+        elif part is not None:
+            n = max(manifest["parts"], default=0) + 1
+            part_keys, part_rows, part_table = part
+            _write(pd.DataFrame({KEY: part_keys}), _part(store, "keys", n))
+            _write(part_rows, _part(store, "rows", n))
+            _write(part_table, _part(store, "table", n))
+            manifest["parts"].append(n)
+        dataset._write_manifest(store, {
+            "version": COHORT_VERSION,
+            "state": state,
+            "sources": {k: ch.sha256 for k, ch in by_kind.items()},
+            "as_of": str(cohorts.as_of),
+            "incremental": bool(incremental),
+            "parts": manifest["parts"],
+        })
+    except OSError:
+        pass  # read-only deployment: rebuilt on next start
+    return cohorts
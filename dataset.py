@@ -0,0 +1,507 @@
+"""Loading of the CRM Excel exports with a persistent columnar cache.
+
+Parsing the xlsx exports with openpyxl takes seconds, so every export is
+converted once into a Parquet copy that already holds the normalized
+columns, the parsed dates and ``IS_CONCLUSO``. The copy is keyed by the
+content hash of the source file; path and mtime are only used to skip
+re-hashing files that did not change.
+
+When an export does have to be parsed, only the schema columns are read,
+with the Rust calamine reader when ``python-calamine`` is installed (several
+times faster than openpyxl), dates are parsed with their declared format
+instead of being guessed, and :func:`read_exports` parses large deal and
+lead workbooks at the same time in worker processes. The workers are fresh
+interpreters importing this module only, which hand their frame back as a
+Parquet file: a multiprocessing pool would re-run the main module in each
+worker (under Streamlit, the dashboard script itself), and forking the
+threaded Streamlit server is not safe.
+"""
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+
+DEAL_PATTERN = "DealDatatable*.xlsx"
+LEAD_PATTERN = "LeadArchiveDatatable*.xlsx"
+
+# Text dates in the exports are "YYYY-MM-DD hh:mm:ss" (date cells come
+# parsed already); anything else, such as several appointments in one
+# cell, becomes NaT.
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEAL_DATE_COLS = ["DATA INGRESSO LEAD", "DATA APPUNTAMENTI", "DATA ESITO"]
+LEAD_DATE_COLS = ["DATA ENTRATA", "DATA USCITA"]
+
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+# Bump when the normalization below changes, so old cached copies are ignored.
+CACHE_VERSION = 2
+
+# Exports are parsed in worker processes only when each is at least this
+# large: a worker takes about half a second to start, as long as parsing
+# a couple of MB of xlsx.
+PARALLEL_MIN_BYTES = 8 * 2**20
+
+# index.json is read, changed and rewritten by loader threads of one process
+# (history snapshots, the data watcher); other processes see whole files.
+_index_lock = threading.Lock()
+
+# Load schema: only the columns the dashboard reads (charts, tables, search)
+# are kept, low-cardinality text is stored as categoricals and amounts as
+# explicit floats. Columns missing from an export are skipped.
+SCHEMA = {
+    "deals": {
+        "columns": [
+            "ID", "LEAD_ID", "COGNOME", "NOME", "EMAIL", "TELEFONO",
+            "STATO", "SOTTOSTATO", "OPERATORE", "COMMERCIALE",
+            "DATA INGRESSO LEAD", "DATA APPUNTAMENTI", "DATA ESITO",
+            "PROVIDER", "CORSI", "IMPORTO CONTRATTO", "MODALITÀ PAGAMENTO",
+            "RATE", "IMPORTO ISCRIZIONE", "IS_CONCLUSO",
+        ],
+        "category": [
+            "STATO", "SOTTOSTATO", "OPERATORE", "COMMERCIALE",
+            "PROVIDER", "CORSI", "MODALITÀ PAGAMENTO",
+        ],
+        "float": ["IMPORTO CONTRATTO", "RATE", "IMPORTO ISCRIZIONE"],
+    },
+    "leads": {
+        "columns": [
+            "ID", "ID LEAD", "COGNOME", "NOME", "EMAIL", "TELEFONO",
+            "STATO", "SOTTOSTATO", "PROVIDER", "CORSI", "COSTO LEAD",
+            "DATA ENTRATA", "DATA USCITA",
+        ],
+        "category": ["STATO", "SOTTOSTATO", "PROVIDER", "CORSI"],
+        "float": ["COSTO LEAD"],
+    },
+}
+
+
+# ── Normalization ───────────────────────────────────────────────────────────
+def _clean_mixed_text(df):
+    """Store mixed str/number object columns (NOME, TELEFONO...) as text."""
+    for col in df.columns:
+        if df[col].dtype == object:
+            notna = df[col].notna()
+            df.loc[notna, col] = df.loc[notna, col].astype(str)
+    return df
+
+
+def apply_schema(df, kind):
+    """Keep the schema columns of ``kind`` and give them their dtypes."""
+    schema = SCHEMA[kind]
+    df = df[[c for c in schema["columns"] if c in df.columns]].copy()
+    df = _clean_mixed_text(df)
+    for col in schema["float"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    for col in schema["category"]:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _parse_dates(values):
+    return pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+
+
+def _clean_stato(stato, lower):
+    stato = stato.astype("string").str.strip()
+    return stato.str.lower() if lower else stato
+
+
+def prepare_deals(deals):
+    deals.columns = deals.columns.str.strip()
+    for col in DEAL_DATE_COLS:
+        if col in deals.columns:
+            deals[col] = _parse_dates(deals[col])
+    deals["STATO"] = _clean_stato(deals["STATO"], lower=True)
+    deals["IS_CONCLUSO"] = (deals["STATO"] == "concluso").fillna(False).astype(bool)
+    return apply_schema(deals, "deals")
+
+
+def prepare_leads(leads):
+    leads.columns = leads.columns.str.strip()
+    for col in LEAD_DATE_COLS:
+        if col in leads.columns:
+            leads[col] = _parse_dates(leads[col])
+    leads["STATO"] = _clean_stato(leads["STATO"], lower=False)
+    return apply_schema(leads, "leads")
+
+
+PREPARE = {"deals": prepare_deals, "leads": prepare_leads}
+
+
+# ── Excel parsing ───────────────────────────────────────────────────────────
+def read_export(path, kind):
+    """Prepared frame of the export at ``path``, reading only the columns
+    of the ``kind`` schema."""
+    wanted = set(SCHEMA[kind]["columns"])
+    raw = pd.read_excel(path, engine=EXCEL_ENGINE, usecols=lambda c: str(c).strip() in wanted)
+    return PREPARE[kind](raw)
+
+
+def _convert(path, kind, out):
+    """Worker entry point: the export at ``path`` parsed into the Parquet
+    file ``out``."""
+    read_export(path, kind).to_parquet(out, index=False)
+
+
+def _read_in_worker(path, kind, tmp_dir):
+    out = os.path.join(tmp_dir, f"{kind}.parquet")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [DATA_DIR, env.get("PYTHONPATH")]))
+    try:
+        subprocess.run(
+            [sys.executable, "-c", "import sys, dataset; dataset._convert(*sys.argv[1:])", path, kind, out],
+            env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        return pd.read_parquet(out)
+    except (OSError, ImportError, subprocess.CalledProcessError):
+        # No worker, no pyarrow or an unreadable export: parse it here,
+        # which raises the actual error if there is one.
+        return read_export(path, kind)
+
+
+def read_exports(paths, workers=None, min_bytes=PARALLEL_MIN_BYTES):
+    """Prepared frames of ``paths`` (kind → path), parsed in parallel
+    worker processes when there are several exports and cores and every
+    export has at least ``min_bytes``."""
+    kinds = list(paths)
+    workers = min(workers or os.cpu_count() or 1, len(kinds))
+    if workers <= 1 or min(os.path.getsize(p) for p in paths.values()) < min_bytes:
+        return {kind: read_export(paths[kind], kind) for kind in kinds}
+    # The threads only wait on the worker processes.
+    with tempfile.TemporaryDirectory() as tmp, ThreadPoolExecutor(workers) as pool:
+        return dict(zip(kinds, pool.map(lambda k: _read_in_worker(paths[k], k, tmp), kinds)))
+
+
+def pending(paths, incremental=True, cache_dir=CACHE_DIR):
+    """The exports of ``paths`` (kind → path) whose content is not stored
+    yet, so that :func:`ingest` (or, with ``incremental`` false,
+    :func:`load_export`) would parse them."""
+    out = {}
+    for kind, path in paths.items():
+        digest = source_digest(os.path.abspath(path), cache_dir)
+        if incremental:
+            manifest = _read_manifest(_store_dir(cache_dir, kind))
+            stored = manifest and manifest["sha256"] == digest and manifest["version"] == CACHE_VERSION
+        else:
+            stored = os.path.exists(_cache_path(cache_dir, kind, digest))
+        if not stored:
+            out[kind] = path
+    return out
+
+
+# ── Source files ────────────────────────────────────────────────────────────
+def latest_export(pattern, data_dir=DATA_DIR):
+    """Newest file matching ``pattern`` in ``data_dir``."""
+    files = glob.glob(os.path.join(data_dir, pattern))
+    if not files:
+        raise FileNotFoundError(os.path.join(data_dir, pattern))
+    return max(files, key=os.path.getmtime)
+
+
+def data_version(deal_file, lead_file, cache_dir=CACHE_DIR):
+    """Identifier of the data loaded from these exports: it changes with
+    their content and with ``CACHE_VERSION``."""
+    return (
+        f"v{CACHE_VERSION}-"
+        + source_digest(deal_file, cache_dir)[:12]
+        + source_digest(lead_file, cache_dir)[:12]
+    )
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ── Columnar cache ──────────────────────────────────────────────────────────
+def _writer():
+    """Temp file tag of this process and thread, so concurrent writers
+    never share a temp file."""
+    return f"{os.getpid()}.{threading.get_ident()}"
+
+
+def _read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "index.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(cache_dir, index):
+    tmp = os.path.join(cache_dir, f"index.json.{_writer()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, os.path.join(cache_dir, "index.json"))
+
+
+def _cache_path(cache_dir, kind, digest):
+    return os.path.join(cache_dir, f"{kind}-{digest[:32]}-v{CACHE_VERSION}.parquet")
+
+
+def source_digest(path, cache_dir=CACHE_DIR):
+    """Content hash of ``path``, reusing the stored one if mtime and size match."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    entry = _read_index(cache_dir).get(path)
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["sha256"]
+    return file_digest(path)
+
+
+def _remember_source(cache_dir, path, kind, digest):
+    """Record path/mtime/size -> digest; return the previous entry for path."""
+    stat = os.stat(path)
+    with _index_lock:
+        index = _read_index(cache_dir)
+        old = index.get(path)
+        index[path] = {
+            "kind": kind,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": digest,
+        }
+        if old != index[path]:
+            os.makedirs(cache_dir, exist_ok=True)
+            _write_index(cache_dir, index)
+    return old, index
+
+
+def load_export(path, kind, cache_dir=CACHE_DIR, parsed=None):
+    """Normalized frame for the export at ``path`` (``kind`` is deals/leads).
+
+    Excel is parsed only when no cached copy exists for the file content;
+    ``parsed`` is the export already read by :func:`read_exports`.
+    """
+    path = os.path.abspath(path)
+    digest = source_digest(path, cache_dir)
+    cached = _cache_path(cache_dir, kind, digest)
+    if os.path.exists(cached):
+        df = pd.read_parquet(cached)
+    else:
+        df = parsed if parsed is not None else read_export(path, kind)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{cached}.{_writer()}.tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, cached)
+        except (ImportError, OSError):
+            # No pyarrow or read-only deployment: serve the parsed frame.
+            return df
+
+    old, index = _remember_source(cache_dir, path, kind, digest)
+    # Drop the copy of the previous content unless another file shares it.
+    if old and old["sha256"] != digest:
+        if not any(e["sha256"] == old["sha256"] for e in index.values()):
+            stale = _cache_path(cache_dir, old.get("kind", kind), old["sha256"])
+            if os.path.exists(stale):
+                os.remove(stale)
+    return df
+
+
+# ── Incremental store ───────────────────────────────────────────────────────
+# The CRM drops a new full export several times a day, mostly identical to
+# the previous one. In incremental mode every kind keeps one stored dataset
+# (a base Parquet plus a log of deltas); a new export is diffed against it by
+# key and per-row hash, and only inserted/updated/deleted rows are written.
+KEYS = {"deals": "LEAD_ID", "leads": "ID LEAD"}
+ROW_HASH = "_ROW_HASH"
+MAX_DELTAS = 8
+
+
+@dataclass
+class Changeset:
+    """Keys touched by the last ingest of one kind."""
+
+    kind: str
+    inserted: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+    full: bool = False  # True when the store was rebuilt from scratch
+    base: str = None  # sha256 of the export the stored dataset had before
+    sha256: str = None  # sha256 of the export it has now
+
+    @property
+    def empty(self):
+        return not (self.full or self.inserted or self.updated or self.deleted)
+
+    @property
+    def touched(self):
+        return self.inserted + self.updated + self.deleted
+
+
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df.drop(columns=ROW_HASH, errors="ignore"), index=False)
+
+
+def _store_dir(cache_dir, kind):
+    return os.path.join(cache_dir, "store", kind)
+
+
+def _read_manifest(store):
+    try:
+        with open(os.path.join(store, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(store, manifest):
+    tmp = os.path.join(store, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(store, "manifest.json"))
+
+
+def _apply_delta(df, key, upserts, deleted):
+    drop = pd.concat([upserts[key], pd.Series(deleted, dtype=upserts[key].dtype)])
+    kept = df[~df[key].isin(drop)]
+    return pd.concat([kept, upserts], ignore_index=True)
+
+
+def _read_store(store, manifest, key):
+    df = pd.read_parquet(os.path.join(store, "base.parquet"))
+    for n in manifest["deltas"]:
+        upserts = pd.read_parquet(os.path.join(store, f"delta-{n:04d}.parquet"))
+        deleted = pd.read_parquet(os.path.join(store, f"delta-{n:04d}-deleted.parquet"))
+        df = _apply_delta(df, key, upserts, deleted[key])
+    return df
+
+
+def _write_base(store, df, manifest):
+    df.to_parquet(os.path.join(store, "base.parquet.tmp"), index=False)
+    os.replace(os.path.join(store, "base.parquet.tmp"), os.path.join(store, "base.parquet"))
+    for n in manifest.get("deltas", []):
+        for suffix in ("", "-deleted"):
+            stale = os.path.join(store, f"delta-{n:04d}{suffix}.parquet")
+            if os.path.exists(stale):
+                os.remove(stale)
+    manifest["deltas"] = []
+
+
+def diff_export(stored, new, key):
+    """Changeset turning ``stored`` into ``new`` (both carry ``ROW_HASH``)."""
+    old_hash = stored.set_index(key)[ROW_HASH]
+    new_hash = new.set_index(key)[ROW_HASH]
+    common = new_hash.index.intersection(old_hash.index)
+    changed = old_hash.loc[common] != new_hash.loc[common]
+    return (
+        new_hash.index.difference(old_hash.index).tolist(),
+        common[changed.to_numpy()].tolist(),
+        old_hash.index.difference(new_hash.index).tolist(),
+    )
+
+
+def ingest(path, kind, cache_dir=CACHE_DIR, parsed=None):
+    """Bring the stored ``kind`` dataset in line with the export at ``path``.
+
+    Returns the current frame and the :class:`Changeset` that was applied.
+    An unchanged export costs one manifest lookup; a changed one is parsed
+    (unless ``parsed`` holds it, from :func:`read_exports`), diffed by key
+    and row hash, and only the changed rows are written.
+    """
+    path = os.path.abspath(path)
+    key = KEYS[kind]
+    store = _store_dir(cache_dir, kind)
+    digest = source_digest(path, cache_dir)
+    manifest = _read_manifest(store)
+
+    if manifest and manifest["sha256"] == digest and manifest["version"] == CACHE_VERSION:
+        df = _read_store(store, manifest, key)
+        return apply_schema(df, kind), Changeset(kind, base=digest, sha256=digest)
+    base = manifest.get("sha256") if manifest else None
+
+    new = parsed if parsed is not None else read_export(path, kind)
+    new[ROW_HASH] = row_hashes(new)
+    os.makedirs(store, exist_ok=True)
+
+    if (
+        not manifest
+        or manifest["version"] != CACHE_VERSION
+        or not new[key].is_unique
+    ):
+        # No usable stored dataset (or keys we cannot diff on): start over.
+        manifest = {"deltas": []} if not manifest else manifest
+        _write_base(store, new, manifest)
+        changes = Changeset(kind, full=True)
+        df = new
+    else:
+        stored = _read_store(store, manifest, key)
+        inserted, updated, deleted = diff_export(stored, new, key)
+        changes = Changeset(kind, inserted, updated, deleted)
+        upserts = new[new[key].isin(inserted + updated)]
+        df = _apply_delta(stored, key, upserts, deleted)
+        if len(manifest["deltas"]) >= MAX_DELTAS:
+            _write_base(store, df, manifest)
+        elif not changes.empty:
+            n = max(manifest["deltas"], default=0) + 1
+            upserts.to_parquet(os.path.join(store, f"delta-{n:04d}.parquet"), index=False)
+            pd.DataFrame({key: pd.Series(deleted, dtype=new[key].dtype)}).to_parquet(
+                os.path.join(store, f"delta-{n:04d}-deleted.parquet"), index=False
+            )
+            manifest["deltas"].append(n)
+
+    changes.base, changes.sha256 = base, digest
+    manifest.update(source=path, sha256=digest, version=CACHE_VERSION)
+    _write_manifest(store, manifest)
+    _remember_source(cache_dir, path, kind, digest)
+    # Concatenated deltas may widen categoricals to text; restore the schema.
+    return apply_schema(df, kind), changes
+
+
+# ── Sidebar metadata ────────────────────────────────────────────────────────
+def sidebar_meta(deals, leads):
+    """What the sidebar filters offer, as JSON-ready values: every CORSI of
+    both frames, the deal PROVIDERs and the first and last entry dates
+    (ISO text, None without dates)."""
+    dates = pd.concat([deals["DATA INGRESSO LEAD"], leads["DATA ENTRATA"]]).dropna()
+
+    def values(*cols):
+        return sorted({str(v) for col in cols for v in col.dropna().unique()})
+
+    return {
+        "corsi": values(deals["CORSI"], leads["CORSI"]),
+        "providers": values(deals["PROVIDER"]),
+        "min_date": dates.min().isoformat() if len(dates) else None,
+        "max_date": dates.max().isoformat() if len(dates) else None,
+    }
+
+
+# ── Memory report ───────────────────────────────────────────────────────────
+def memory_report(frames):
+    """Memory per frame and per column of ``{name: DataFrame}``, in MB."""
+    rows = []
+    for name, df in frames.items():
+        usage = df.memory_usage(deep=True, index=False)
+        for col, nbytes in usage.items():
+            rows.append({
+                "Dataset": name,
+                "Colonna": col,
+                "Tipo": str(df[col].dtype),
+                "Valori distinti": df[col].nunique(),
+                "MB": nbytes / 1e6,
+            })
+    columns = pd.DataFrame(rows)
+    totals = columns.groupby("Dataset", sort=False).agg(
+        Colonne=("Colonna", "size"),
+        MB=("MB", "sum"),
+    ).reset_index()
+    totals.insert(1, "Righe", [len(frames[n]) for n in totals["Dataset"]])
+    return totals, columns.sort_values("MB", ascending=False, ignore_index=True)
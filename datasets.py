@@ -0,0 +1,132 @@
+"""Several datasets (one per academy or business unit) in one deployment.
+
+A dataset is a directory holding its own ``DealDatatable`` /
+``LeadArchiveDatatable`` exports: the data directory itself and each of its
+subdirectories that has both. Each keeps its caches (Parquet stores, shared
+maps, SQLite copy, cohorts, history) in a directory of its own, so that
+datasets never overwrite each other's.
+
+:class:`DatasetCache` keeps the loaded datasets of the last sessions in
+memory, up to a budget in bytes: when a newly loaded one brings the total
+over it, the least recently used ones are dropped. Going back to a dataset
+still in the cache is immediate; the counters show how often that happens.
+Sizes count the memory the process owns: pages mapped from the shared
+files of shared.py belong to the OS page cache, whoever maps them.
+"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import dataset
+import shared
+
+DATASETS_CACHE = "datasets"
+
+
+@dataclass(frozen=True)
+class Source:
+    """Where a dataset's exports are read from and its caches kept."""
+    name: str
+    data_dir: str
+    cache_dir: str
+
+
+def _has_exports(data_dir):
+    try:
+        for pattern in (dataset.DEAL_PATTERN, dataset.LEAD_PATTERN):
+            dataset.latest_export(pattern, data_dir)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def discover(data_dir=dataset.DATA_DIR, cache_dir=dataset.CACHE_DIR):
+    """:class:`Source` of every dataset under ``data_dir``, by name: the
+    directory itself (named after it) first, then its subdirectories in
+    name order. The first keeps ``cache_dir``; the others get a
+    subdirectory of it."""
+    out = {}
+    if _has_exports(data_dir):
+        name = os.path.basename(os.path.normpath(data_dir))
+        out[name] = Source(name, data_dir, cache_dir)
+    for entry in sorted(os.scandir(data_dir), key=lambda e: e.name):
+        if entry.name.startswith(".") or not entry.is_dir() or entry.name in out:
+            continue
+        if _has_exports(entry.path):
+            out[entry.name] = Source(
+                entry.name, entry.path, os.path.join(cache_dir, DATASETS_CACHE, entry.name)
+            )
+    return out
+
+
+def frames_nbytes(frames):
+    """Memory held by the DataFrames among ``frames``, without the pages
+    they map from shared files (see shared.py)."""
+    return sum(shared.owned_nbytes(df) for df in frames if hasattr(df, "memory_usage"))
+
+
+class DatasetCache:
+    """Loaded datasets by name, least recently used evicted once their
+    ``sizeof`` adds up to more than ``budget`` bytes; the one just loaded is
+    always kept. ``on_evict`` is called with each dropped value. Shared by
+    the sessions' threads, hence the lock."""
+
+    def __init__(self, budget, sizeof, on_evict=None):
+        self.budget = budget
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, load):
+        """The value of ``name``, ``load()`` when it is not cached."""
+        with self._lock:
+            if name in self._items:
+                self._items.move_to_end(name)
+                self.hits += 1
+                return self._items[name]
+        value = load()
+        with self._lock:
+            if name in self._items:
+                # Another session loaded it meanwhile: keep that one.
+                dropped, value = value, self._items[name]
+                self._items.move_to_end(name)
+            else:
+                self.misses += 1
+                self._items[name] = value
+                dropped = None
+            evicted = self._evict()
+        for old in ([dropped] if dropped is not None else []) + evicted:
+            if self.on_evict:
+                self.on_evict(old)
+        return value
+
+    def _evict(self):
+        sizes = {name: self.sizeof(value) for name, value in self._items.items()}
+        total = sum(sizes.values())
+        evicted = []
+        while total > self.budget and len(self._items) > 1:
+            name, value = self._items.popitem(last=False)
+            total -= sizes[name]
+            evicted.append(value)
+            self.evictions += 1
+        return evicted
+
+    def values(self):
+        """Cached values, least recently used first."""
+        with self._lock:
+            return list(self._items.values())
+
+    @property
+    def names(self):
+        """Cached names, least recently used first."""
+        return list(self._items)
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(self.sizeof(value) for value in self._items.values())
@@ -0,0 +1,88 @@
+"""On-demand CSV / Parquet exports of the detail tables.
+
+Exports are generated only when a download is requested, written chunk by
+chunk (never as one giant string), and kept in a small in-process cache
+keyed by dataset, filters and search, so repeated downloads are free.
+"""
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CHUNK_ROWS = 50_000
+
+FORMATS = {
+    "csv": ("CSV", ".csv", "text/csv"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def _chunks(take, rows):
+    for i in range(0, max(len(rows), 1), CHUNK_ROWS):
+        yield take(rows[i:i + CHUNK_ROWS])
+
+
+def write_csv(take, rows):
+    """UTF-8 CSV of ``take(rows)``, encoded one chunk at a time."""
+    buf = io.BytesIO()
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    for i, chunk in enumerate(_chunks(take, rows)):
+        chunk.to_csv(text, index=False, header=(i == 0))
+    text.flush()
+    return text.detach().getvalue()
+
+
+def write_parquet(take, rows):
+    """Parquet of ``take(rows)``, one row group per chunk."""
+    buf = io.BytesIO()
+    writer = None
+    for chunk in _chunks(take, rows):
+        if writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            # An all-empty text column in the first chunk has no type yet.
+            schema = pa.schema(
+                [f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema],
+                metadata=table.schema.metadata,
+            )
+            writer = pq.ParquetWriter(buf, schema)
+            table = table.cast(schema)
+        else:
+            table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+        writer.write_table(table)
+    writer.close()
+    return buf.getvalue()
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+
+class ExportCache:
+    """Bytes of recent exports, least recently used dropped beyond ``max_bytes``.
+
+    Downloads are generated on a separate thread, hence the lock.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        data = build()
+        with self._lock:
+            self._items[key] = data
+            while len(self._items) > 1 and sum(map(len, self._items.values())) > self.max_bytes:
+                self._items.popitem(last=False)
+        return data
+
+
+def export(cache, key, fmt, take, rows):
+    """Cached ``fmt`` export of ``take(rows)``; ``rows`` are row positions."""
+    return cache.get((key, fmt), lambda: WRITERS[fmt](take, np.asarray(rows)))
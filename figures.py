@@ -0,0 +1,102 @@
+"""Figure reuse and payload limits for the dashboard charts.
+
+Building the Plotly figures of a tab costs far more than serializing them,
+and the same inputs come back often: other sessions on the same filters,
+filters that select the same cells, a filter set and reset. A
+:class:`FigureCache` keeps the built figures of each tab by a
+:func:`fingerprint` of the data they are drawn from, whoever asked first.
+
+Date series grow with the history of the exports: :func:`coarsen` sums them
+over longer periods (week, month, quarter, year) until each trace fits
+``MAX_POINTS``, and :func:`line_style` draws the long ones with WebGL and no
+markers.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 1000  # per trace of a date series
+WEBGL_POINTS = 300  # lines longer than this are drawn with WebGL, no markers
+
+PERIODS = [("W", "settimana"), ("M", "mese"), ("Q", "trimestre"), ("Y", "anno")]
+
+
+def _feed(h, part):
+    if isinstance(part, (pd.DataFrame, pd.Series, pd.Index)):
+        if isinstance(part, pd.DataFrame):
+            meta = (list(part.columns), [str(t) for t in part.dtypes])
+        else:
+            meta = (part.name, str(part.dtype))
+        h.update(repr((type(part).__name__, len(part), meta)).encode())
+        h.update(pd.util.hash_pandas_object(part, index=not isinstance(part, pd.Index)).to_numpy().tobytes())
+    elif isinstance(part, np.ndarray):
+        h.update(repr((part.dtype.str, part.shape)).encode())
+        h.update(np.ascontiguousarray(part).tobytes())
+    elif isinstance(part, (tuple, list)):
+        h.update(b"(")
+        for p in part:
+            _feed(h, p)
+        h.update(b")")
+    else:
+        h.update(repr(part).encode())
+
+
+def fingerprint(*parts):
+    """Hash of the values of ``parts``: frames, series, arrays, scalars and
+    tuples or lists of them."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        _feed(h, part)
+    return h.hexdigest()
+
+
+class FigureCache:
+    """Built figures by name and input fingerprint, least recently used
+    dropped beyond ``max_entries``. Shared by the sessions' threads, hence
+    the lock; the cached figures must not be modified."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, key, build, *args):
+        """``build(*args)``, built once per ``(name, key)``."""
+        with self._lock:
+            if (name, key) in self._items:
+                self._items.move_to_end((name, key))
+                self.hits += 1
+                return self._items[(name, key)]
+        value = build(*args)
+        with self._lock:
+            self.misses += 1
+            self._items[(name, key)] = value
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return value
+
+
+def coarsen(df, x, y, by=(), max_points=MAX_POINTS):
+    """``df`` (``y`` per week in date column ``x``, optionally split by the
+    ``by`` columns) summed over the shortest period of ``PERIODS`` that
+    keeps every series within ``max_points``; returns the frame and the
+    period's name."""
+    by = list(by)
+    for (freq, label), coarser in zip(PERIODS, PERIODS[1:] + [None]):
+        longest = df.groupby(by, observed=True).size().max() if by else len(df)
+        if coarser is None or not longest or longest <= max_points:
+            return df, label
+        period = df[x].dt.to_period(coarser[0]).dt.start_time.rename(x)
+        df = df.groupby([period, *(df[c] for c in by)], observed=True)[y].sum().reset_index()
+
+
+def line_style(n_points):
+    """``px.line`` options for a trace of ``n_points``."""
+    if n_points > WEBGL_POINTS:
+        return {"markers": False, "render_mode": "webgl"}
+    return {"markers": True}
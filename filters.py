@@ -0,0 +1,99 @@
+"""Index-based evaluation of the sidebar filters.
+
+:class:`FilterIndex` is built once per data load. For every filter column it
+keeps the row positions of each value (rows sorted by value code), and for
+the date column the rows sorted by date. A selection starts from the
+smallest candidate set (the rows of the chosen values, or the date slice)
+and checks the remaining filters with per-row table lookups. The result is
+an array of row positions: nothing is copied until a view takes its rows.
+"""
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    def __init__(self, df, date_col, value_cols):
+        self.n = len(df)
+        self.values = {}
+        for col in value_cols:
+            codes, uniques = pd.factorize(df[col])
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            lookup = {value: code for code, value in enumerate(uniques)}
+            self.values[col] = (codes, lookup, order, bounds)
+
+        dates = df[date_col].to_numpy()
+        self.date_order = np.argsort(dates, kind="stable")  # NaT sorts last
+        self.n_dated = self.n - int(np.isnat(dates).sum())
+        self.sorted_dates = dates[self.date_order[:self.n_dated]]
+        self.date_rank = np.empty(self.n, dtype=np.int64)
+        self.date_rank[self.date_order] = np.arange(self.n)
+
+    def _value_filter(self, col, selected):
+        codes, lookup, order, bounds = self.values[col]
+        wanted = np.asarray([lookup[v] for v in selected if v in lookup], dtype=np.int64)
+        # One spare slot at the end, so missing values (code -1) read False.
+        accept = np.zeros(len(lookup) + 1, dtype=bool)
+        accept[wanted] = True
+        size = int((bounds[wanted + 1] - bounds[wanted]).sum())
+
+        def candidates():
+            starts = bounds[wanted]
+            lengths = bounds[wanted + 1] - starts
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            return order[offsets + np.arange(lengths.sum())]
+
+        return size, candidates, lambda pos: accept[codes[pos]]
+
+    def _date_filter(self, start, end_excl):
+        lo = int(np.searchsorted(self.sorted_dates, pd.Timestamp(start).to_datetime64(), "left"))
+        hi = int(np.searchsorted(self.sorted_dates, pd.Timestamp(end_excl).to_datetime64(), "left"))
+        size = hi - lo + self.n - self.n_dated
+
+        def candidates():
+            # Rows without a date always pass, as in the raw filters.
+            return np.concatenate([self.date_order[lo:hi], self.date_order[self.n_dated:]])
+
+        def check(pos):
+            rank = self.date_rank[pos]
+            return ((rank >= lo) & (rank < hi)) | (rank >= self.n_dated)
+
+        return size, candidates, check
+
+    def select(self, values, start=None, end_excl=None):
+        """Sorted positions of the rows passing every filter.
+
+        ``values`` maps a column to its selected values (empty: no filter);
+        rows dated in ``[start, end_excl)`` or undated pass the date filter.
+        """
+        preds = [self._value_filter(col, sel) for col, sel in values.items() if sel]
+        if start is not None:
+            preds.append(self._date_filter(start, end_excl))
+        if not preds:
+            return np.arange(self.n)
+        preds.sort(key=lambda p: p[0])
+        pos = preds[0][1]()
+        for _, _, check in preds[1:]:
+            pos = pos[check(pos)]
+        return np.sort(pos)
+
+
+def build(deals, leads):
+    """The ``(deals, leads)`` indexes behind the sidebar filters."""
+    return (
+        FilterIndex(deals, "DATA INGRESSO LEAD", ["CORSI", "PROVIDER"]),
+        FilterIndex(leads, "DATA ENTRATA", ["CORSI"]),
+    )
+
+
+def select_rows(indexes, corsi, providers, start=None, end=None):
+    """Positions ``(deal_pos, lead_pos)`` of the rows passing the filters.
+
+    ``start``/``end`` are whole days, both included; providers only apply
+    to deals.
+    """
+    deal_ix, lead_ix = indexes
+    end_excl = end + pd.Timedelta(days=1) if start is not None else None
+    deal_pos = deal_ix.select({"CORSI": corsi, "PROVIDER": providers}, start, end_excl)
+    lead_pos = lead_ix.select({"CORSI": corsi}, start, end_excl)
+    return deal_pos, lead_pos
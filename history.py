@@ -0,0 +1,176 @@
+"""Deal state history across every DealDatatable export.
+
+Each export is a snapshot of the deal states when it was taken, dated by
+the file's modification time. The history store keeps, per deal, only the
+snapshots where its ``STATO`` changed (including its first appearance and
+its removal from the exports): one (key, STATO, date) row per change, so
+it stays small however many snapshots pile up.
+
+The store lives in the cache directory with the list of snapshots it
+covers. Snapshots newer than the last covered one are appended; any other
+change to the list (an older file, an edited file) rebuilds it. Snapshots
+not yet in the store are read in parallel worker threads, through the
+Parquet copies of :func:`dataset.load_export`, so Excel is parsed at most
+once per file.
+"""
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import dataset
+
+KEY = dataset.KEYS["deals"]
+STATE = "STATO"
+TIME = "DATA SNAPSHOT"
+REMOVED = "(rimosso)"
+
+
+def snapshots(pattern=dataset.DEAL_PATTERN, data_dir=dataset.DATA_DIR, cache_dir=dataset.CACHE_DIR):
+    """Every export matching ``pattern``, oldest first, as dicts of
+    ``path``, ``digest`` and ``time`` (modification time, ISO format)."""
+    out = []
+    for path in glob.glob(os.path.join(data_dir, pattern)):
+        path = os.path.abspath(path)
+        out.append({
+            "path": path,
+            "digest": dataset.source_digest(path, cache_dir),
+            "time": pd.Timestamp(os.path.getmtime(path), unit="s").isoformat(),
+        })
+    return sorted(out, key=lambda s: (s["time"], s["path"]))
+
+
+def _states(path, cache_dir):
+    df = dataset.load_export(path, "deals", cache_dir)
+    return df[[KEY, STATE]].dropna(subset=[KEY]).drop_duplicates(KEY, keep="last")
+
+
+def read_states(paths, cache_dir=dataset.CACHE_DIR, workers=None):
+    """Key and STATO of each export in ``paths``, read in parallel."""
+    if len(paths) <= 1:
+        return [_states(p, cache_dir) for p in paths]
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    # Threads, not processes: a spawned worker would re-import the main
+    # module, the dashboard script under Streamlit.
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(_states, paths, [cache_dir] * len(paths)))
+
+
+def changes(last, states, time):
+    """Events of one snapshot: keys new or with another STATO than in
+    ``last`` (key → STATO), and keys of ``last`` no longer exported."""
+    current = states.set_index(KEY)[STATE].astype("string")
+    is_new = ~current.index.isin(last.index)
+    # A missing STATO compares equal to itself, so it is not a change.
+    differs = last.reindex(current.index).fillna("\0") != current.fillna("\0")
+    changed = current[is_new | differs.to_numpy()]
+    removed = last.index.difference(current.index)
+    removed = removed[(last.loc[removed] != REMOVED).fillna(True).to_numpy()]
+    events = pd.concat([
+        changed,
+        pd.Series(REMOVED, index=removed, dtype="string"),
+    ])
+    return pd.DataFrame({KEY: events.index, STATE: events.to_numpy(), TIME: pd.Timestamp(time)})
+
+
+class History:
+    """STATO change events of every deal, ordered by deal and date."""
+
+    def __init__(self, events, covered):
+        self.events = events.sort_values([KEY, TIME], kind="stable", ignore_index=True)
+        self.snapshots = covered
+
+    def last_states(self):
+        """STATO of each deal in the latest snapshot covered (key → STATO)."""
+        last = self.events.drop_duplicates(KEY, keep="last")
+        return pd.Series(last[STATE].to_numpy(), index=last[KEY].to_numpy(), dtype="string")
+
+    def restrict(self, keys):
+        """The history of the deals in ``keys`` only."""
+        return History(self.events[self.events[KEY].isin(keys)], self.snapshots)
+
+    def transitions(self):
+        """One row per STATO change of a known deal: ``DA`` → ``A`` on
+        ``DATA`` after ``GIORNI`` in the previous state."""
+        ev = self.events
+        same = ev[KEY].to_numpy()[1:] == ev[KEY].to_numpy()[:-1]
+        nxt = np.flatnonzero(same) + 1
+        prev = nxt - 1
+        days = (ev[TIME].to_numpy()[nxt] - ev[TIME].to_numpy()[prev]) / np.timedelta64(1, "D")
+        return pd.DataFrame({
+            KEY: ev[KEY].to_numpy()[nxt],
+            "DA": ev[STATE].to_numpy()[prev],
+            "A": ev[STATE].to_numpy()[nxt],
+            "DATA": ev[TIME].to_numpy()[nxt],
+            "GIORNI": days,
+        })
+
+    def dwell(self):
+        """Days spent in each STATO before leaving it: count, median, mean
+        and 90th percentile. Stays still open are not counted."""
+        t = self.transitions()
+        t = t[t["DA"] != REMOVED]
+        if t.empty:
+            return pd.DataFrame(columns=["STATO", "Uscite", "Mediana giorni", "Media giorni", "P90 giorni"])
+        out = t.groupby("DA")["GIORNI"].agg(
+            Uscite="count",
+            mediana="median",
+            media="mean",
+            p90=lambda s: s.quantile(0.9),
+        ).round(1)
+        out.columns = ["Uscite", "Mediana giorni", "Media giorni", "P90 giorni"]
+        return out.rename_axis("STATO").reset_index().sort_values("Mediana giorni", ascending=False)
+
+    def velocity(self, freq="W"):
+        """Transitions per period (``freq``) and ``A`` state."""
+        t = self.transitions()
+        if t.empty:
+            return pd.DataFrame(columns=["Periodo", "A", "N"])
+        period = t["DATA"].dt.to_period(freq).dt.start_time.rename("Periodo")
+        return t.groupby([period, "A"]).size().rename("N").reset_index()
+
+
+def _store_dir(cache_dir):
+    return os.path.join(cache_dir, "history")
+
+
+def load(covered=None, cache_dir=dataset.CACHE_DIR, workers=None):
+    """:class:`History` of the ``covered`` snapshots (default: all exports),
+    reading only the snapshots the stored history does not cover yet."""
+    covered = snapshots(cache_dir=cache_dir) if covered is None else list(covered)
+    store = _store_dir(cache_dir)
+    path = os.path.join(store, "events.parquet")
+    manifest = dataset._read_manifest(store)
+    known = manifest["snapshots"] if manifest else []
+    cols = {KEY: pd.Series(dtype="int64"), STATE: pd.Series(dtype="string"),
+            TIME: pd.Series(dtype="datetime64[us]")}
+
+    plain = [{k: s[k] for k in ("digest", "time")} for s in covered]
+    if known and plain[:len(known)] == known and os.path.exists(path):
+        events = pd.read_parquet(path)
+        todo = covered[len(known):]
+    else:
+        events = pd.DataFrame(cols)
+        todo = covered
+    if todo:
+        history = History(events, known)
+        last = history.last_states()
+        new = []
+        for snap, states in zip(todo, read_states([s["path"] for s in todo], cache_dir, workers)):
+            ev = changes(last, states, snap["time"])
+            new.append(ev)
+            last = pd.concat([last[~last.index.isin(ev[KEY])], ev.set_index(KEY)[STATE]])
+        events = pd.concat([events, *new], ignore_index=True).astype(
+            {KEY: "int64", STATE: "string", TIME: "datetime64[us]"}
+        )
+        try:
+            os.makedirs(store, exist_ok=True)
+            events.to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+            dataset._write_manifest(store, {"snapshots": plain})
+        except OSError:
+            pass  # read-only deployment: history is rebuilt on next start
+    events[STATE] = events[STATE].astype("category")
+    return History(events, covered)
@@ -0,0 +1,141 @@
+"""Lead ↔ Deal join computed once per data load.
+
+:class:`JoinIndex` stores, for the full lead and deal frames, the row
+positions of every pair with ``ID LEAD == LEAD_ID``. A filtered join is then
+derived from the two row selections without merging again: pairs whose
+lead and deal are both selected are matches, selected rows left without a
+selected partner are "only lead" / "only deal". Columns are gathered only
+for the rows and columns a view actually shows.
+"""
+import numpy as np
+import pandas as pd
+
+LEFT_ON = "ID LEAD"
+RIGHT_ON = "LEAD_ID"
+SUFFIXES = ("_lead", "_deal")
+
+# Values of the ``_merge`` indicator, as produced by ``DataFrame.merge``.
+BOTH, LEFT_ONLY, RIGHT_ONLY = "both", "left_only", "right_only"
+
+
+class JoinIndex:
+    def __init__(self, leads, deals):
+        self.leads = leads
+        self.deals = deals
+        pairs = pd.DataFrame(
+            {LEFT_ON: leads[LEFT_ON].to_numpy(), "_l": np.arange(len(leads))}
+        ).merge(
+            pd.DataFrame({LEFT_ON: deals[RIGHT_ON].to_numpy(), "_d": np.arange(len(deals))}),
+            on=LEFT_ON,
+        )
+        self.pair_lead = pairs["_l"].to_numpy()
+        self.pair_deal = pairs["_d"].to_numpy()
+
+    def select(self, lead_pos, deal_pos):
+        """:class:`JoinSelection` of the join restricted to the given rows.
+
+        ``lead_pos``/``deal_pos`` are positions of the selected rows.
+        """
+        lead_sel = np.zeros(len(self.leads), dtype=bool)
+        lead_sel[lead_pos] = True
+        deal_sel = np.zeros(len(self.deals), dtype=bool)
+        deal_sel[deal_pos] = True
+
+        ok = lead_sel[self.pair_lead] & deal_sel[self.pair_deal]
+        both_l, both_d = self.pair_lead[ok], self.pair_deal[ok]
+        lead_sel[both_l] = False
+        deal_sel[both_d] = False
+        only_l = np.flatnonzero(lead_sel)
+        only_d = np.flatnonzero(deal_sel)
+        return JoinSelection(self, both_l, both_d, only_l, only_d)
+
+
+class JoinSelection:
+    """Row positions of one filtered outer join, in lead/deal frame order.
+
+    ``lead_pos``/``deal_pos`` hold, per joined row, the position of the row
+    it came from in the full lead/deal frame, or -1 for the missing side.
+    """
+
+    def __init__(self, index, both_l, both_d, only_l, only_d):
+        self.index = index
+        self.n_both, self.n_only_lead, self.n_only_deal = len(both_l), len(only_l), len(only_d)
+        missing_l = np.full(len(only_d), -1)
+        missing_d = np.full(len(only_l), -1)
+        self.lead_pos = np.concatenate([both_l, only_l, missing_l])
+        self.deal_pos = np.concatenate([both_d, missing_d, only_d])
+        self.indicator = np.repeat(
+            [BOTH, LEFT_ONLY, RIGHT_ONLY],
+            [self.n_both, self.n_only_lead, self.n_only_deal],
+        )
+
+    def __len__(self):
+        return len(self.lead_pos)
+
+    @property
+    def columns(self):
+        """Merged column names, in frame order (``_merge`` excluded)."""
+        lead_names, deal_names = self._names()
+        return list(lead_names.values()) + list(deal_names.values())
+
+    def both(self, columns):
+        """Matched rows only, limited to ``columns`` (merged names)."""
+        return self.frame(columns, rows=slice(0, self.n_both))
+
+    def frame(self, columns=None, rows=slice(None)):
+        """The joined rows as ``DataFrame.merge(how="outer", indicator=True)``
+        would return them, optionally limited to ``columns`` (merged names).
+        """
+        lead_names, deal_names = self._names()
+        if columns is not None:
+            lead_names = {c: n for c, n in lead_names.items() if n in columns}
+            deal_names = {c: n for c, n in deal_names.items() if n in columns}
+        out = self._gather(rows, list(lead_names), list(deal_names))
+        out.columns = list(lead_names.values()) + list(deal_names.values())
+        if columns is None or "_merge" in columns:
+            out["_merge"] = pd.Categorical(
+                self.indicator[rows], categories=[LEFT_ONLY, RIGHT_ONLY, BOTH]
+            )
+        if columns is not None:
+            out = out[[c for c in columns if c in out.columns]]
+        return out
+
+    def source(self, name):
+        """``("lead" | "deal", column, positions)`` behind merged column ``name``."""
+        lead_names, deal_names = self._names()
+        for side, names, pos in (("lead", lead_names, self.lead_pos), ("deal", deal_names, self.deal_pos)):
+            for col, merged in names.items():
+                if merged == name:
+                    return side, col, pos
+        raise KeyError(name)
+
+    def _names(self):
+        leads, deals = self.index.leads, self.index.deals
+        shared = set(leads.columns) & set(deals.columns)
+        lead_names = {c: c + SUFFIXES[0] if c in shared else c for c in leads.columns}
+        deal_names = {c: c + SUFFIXES[1] if c in shared else c for c in deals.columns}
+        return lead_names, deal_names
+
+    def _gather(self, rows, lead_cols, deal_cols):
+        parts = []
+        for frame, pos, cols, has_missing in (
+            (self.index.leads, self.lead_pos[rows], lead_cols, self.n_only_deal > 0),
+            (self.index.deals, self.deal_pos[rows], deal_cols, self.n_only_lead > 0),
+        ):
+            present = pos >= 0
+            part = frame[cols].iloc[pos[present]].reset_index(drop=True)
+            if not present.all():
+                # Missing side: reindex on -1 fills the row with NaN.
+                labels = np.full(len(pos), -1)
+                labels[present] = np.arange(present.sum())
+                part = part.reindex(labels).reset_index(drop=True)
+            if has_missing:
+                # Same dtypes for any subset of rows (e.g. export chunks) as
+                # for the whole join: ints become float, bools object.
+                for col in part.columns:
+                    if pd.api.types.is_integer_dtype(part[col]):
+                        part[col] = part[col].astype("float64")
+                    elif pd.api.types.is_bool_dtype(part[col]):
+                        part[col] = part[col].astype(object)
+            parts.append(part)
+        return pd.concat(parts, axis=1)
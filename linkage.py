@@ -0,0 +1,192 @@
+"""Lead ↔ Deal linkage for the rows the ``LEAD_ID`` join leaves unmatched.
+
+When the CRM re-creates a lead, its deal keeps the old id and both rows end
+up "only lead" / "only deal", although the person's name, email or phone
+are the same. :class:`Linkage` proposes those pairs once per data load.
+
+Comparing every unmatched lead with every unmatched deal would be
+quadratic, so candidates come from blocks of rows sharing a key:
+
+- the normalized email;
+- the last 9 digits of the phone number;
+- the Soundex code of the surname plus the CORSI value.
+
+Blocks larger than ``MAX_BLOCK`` rows on a side (placeholder emails, very
+common surnames) are skipped. Each candidate pair is scored on email,
+phone, name and corso; pairs scoring at least ``THRESHOLD`` are kept, and
+each lead and deal is linked at most once, best scores first.
+"""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+LEAD_KEY = "ID LEAD"
+DEAL_KEY = "LEAD_ID"
+
+# Score of each agreeing field; a name agreeing only phonetically counts
+# NAME_PHONETIC of the name weight. Any contact plus a name, both contacts,
+# or the exact name plus the corso (the surname block, for rows without a
+# usable email or phone) reach the threshold; no single field does, nor a
+# contact plus the corso, nor a phonetic name plus the corso.
+WEIGHTS = {"email": 0.28, "telefono": 0.28, "nome": 0.32, "corso": 0.12}
+NAME_PHONETIC = 0.7
+THRESHOLD = 0.43
+MAX_BLOCK = 50
+PHONE_DIGITS = 9
+
+_SOUNDEX = {c: d for d, letters in enumerate(["aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"])
+            for c in letters}
+
+
+def _text(values):
+    """Lowercase ASCII letters only (accents folded, spaces removed)."""
+    def fold(s):
+        s = unicodedata.normalize("NFKD", s)
+        return "".join(c for c in s.lower() if "a" <= c <= "z")
+
+    codes, uniques = pd.factorize(values)
+    folded = np.array([fold(s) for s in uniques] + [""], dtype=object)
+    return folded[codes]
+
+
+def soundex(name):
+    """Soundex code of a folded name (``""`` for an empty one)."""
+    if not name:
+        return ""
+    out, last = name[0], _SOUNDEX.get(name[0])
+    for c in name[1:]:
+        d = _SOUNDEX.get(c)
+        if d and d != last:
+            out += str(d)
+        if c not in "hw":
+            last = d
+    return (out + "000")[:4]
+
+
+def normalize(df):
+    """Comparable identity fields of ``df``: folded surname and name,
+    surname Soundex, lowercase email without ``+tag`` and phone suffix."""
+    cognome = _text(df["COGNOME"])
+    email = df["EMAIL"].astype("string").str.strip().str.lower()
+    email = email.str.replace(r"\+[^@]*@", "@", regex=True)
+    phone = df["TELEFONO"].astype("string").str.replace(r"\D", "", regex=True)
+    phone = phone.where(phone.str.len() >= PHONE_DIGITS).str[-PHONE_DIGITS:]
+    codes, uniques = pd.factorize(cognome)
+    return pd.DataFrame({
+        "cognome": cognome,
+        "nome": _text(df["NOME"]),
+        "fonetico": np.array([soundex(s) for s in uniques], dtype=object)[codes],
+        "email": email.where(email.str.contains("@", regex=False).fillna(False)).to_numpy(dtype=object),
+        "telefono": phone.to_numpy(dtype=object),
+        "corso": df["CORSI"].astype("string").to_numpy(dtype=object),
+    })
+
+
+def _block(lead_keys, deal_keys):
+    """(lead, deal) index pairs sharing a key, skipping oversized blocks."""
+    left = pd.DataFrame({"k": lead_keys, "l": np.arange(len(lead_keys))}).dropna()
+    right = pd.DataFrame({"k": deal_keys, "d": np.arange(len(deal_keys))}).dropna()
+    left = left[left["k"] != ""]
+    right = right[right["k"] != ""]
+    left = left[left.groupby("k")["k"].transform("size") <= MAX_BLOCK]
+    right = right[right.groupby("k")["k"].transform("size") <= MAX_BLOCK]
+    pairs = left.merge(right, on="k")
+    return pairs["l"].to_numpy(), pairs["d"].to_numpy()
+
+
+def _surname_keys(norm):
+    """Surname Soundex plus CORSI; None without a surname."""
+    fon, corso = norm["fonetico"].to_numpy(), norm["corso"].to_numpy()
+    return np.array([f"{f}|{c}" if f else None for f, c in zip(fon, corso)], dtype=object)
+
+
+def _one_to_one(pairs):
+    """Each lead and deal at most once: repeatedly keep the pairs that are
+    the best for both their lead and their deal."""
+    pairs = pairs.sort_values(["score", "lead", "deal"], ascending=[False, True, True])
+    kept = []
+    while len(pairs):
+        best = pairs.drop_duplicates("deal").drop_duplicates("lead")
+        mutual = best[best.index.isin(pairs.drop_duplicates("lead").index)]
+        kept.append(mutual)
+        pairs = pairs[~pairs["lead"].isin(mutual["lead"]) & ~pairs["deal"].isin(mutual["deal"])]
+    return pd.concat(kept, ignore_index=True) if kept else pairs.reset_index(drop=True)
+
+
+class Linkage:
+    """Proposed Lead ↔ Deal pairs among rows without an exact partner.
+
+    ``pairs`` holds one row per pair: ``lead`` and ``deal`` (row positions
+    in the full frames), ``score`` and ``criteri`` (the fields that agree).
+    Rows at positions ``linked_leads`` / ``linked_deals`` (the exact join)
+    are left out.
+    """
+
+    def __init__(self, leads, deals, linked_leads=(), linked_deals=()):
+        lead_rows = np.setdiff1d(np.arange(len(leads)), linked_leads)
+        deal_rows = np.setdiff1d(np.arange(len(deals)), linked_deals)
+        ln = normalize(leads.iloc[lead_rows])
+        dn = normalize(deals.iloc[deal_rows])
+
+        found = [
+            _block(ln["email"].to_numpy(), dn["email"].to_numpy()),
+            _block(ln["telefono"].to_numpy(), dn["telefono"].to_numpy()),
+            _block(_surname_keys(ln), _surname_keys(dn)),
+        ]
+        cand = pd.DataFrame({
+            "l": np.concatenate([l for l, _ in found]),
+            "d": np.concatenate([d for _, d in found]),
+        }).drop_duplicates()
+        li, di = cand["l"].to_numpy(), cand["d"].to_numpy()
+
+        def same(col):
+            a, b = ln[col].to_numpy()[li], dn[col].to_numpy()[di]
+            # Compared only where both are set: NA == NA is not a bool.
+            both = pd.notna(a) & pd.notna(b)
+            out = np.zeros(len(a), dtype=bool)
+            out[both] = (a[both] == b[both]) & (a[both] != "")
+            return out
+
+        email, phone = same("email"), same("telefono")
+        exact_name = same("cognome") & same("nome")
+        swapped = (
+            (ln["cognome"].to_numpy()[li] == dn["nome"].to_numpy()[di])
+            & (ln["nome"].to_numpy()[li] == dn["cognome"].to_numpy()[di])
+            & (ln["cognome"].to_numpy()[li] != "")
+        )
+        name = np.where(exact_name | swapped, 1.0,
+                        np.where(same("fonetico") & same("nome"), NAME_PHONETIC, 0.0))
+        corso = same("corso")
+        score = (
+            WEIGHTS["email"] * email + WEIGHTS["telefono"] * phone
+            + WEIGHTS["nome"] * name + WEIGHTS["corso"] * corso
+        )
+
+        ok = score >= THRESHOLD
+        criteri = np.array([
+            " + ".join(n for n, hit in (("email", e), ("telefono", p), ("nome", m > 0), ("corso", c)) if hit)
+            for e, p, m, c in zip(email[ok], phone[ok], name[ok], corso[ok])
+        ], dtype=object)
+        self.pairs = _one_to_one(pd.DataFrame({
+            "lead": lead_rows[li[ok]],
+            "deal": deal_rows[di[ok]],
+            "score": score[ok].round(2),
+            "criteri": criteri,
+        }))
+        self.leads = leads
+        self.deals = deals
+
+    def select(self, lead_pos, deal_pos):
+        """The pairs whose lead is in ``lead_pos`` and deal in ``deal_pos``."""
+        ok = np.isin(self.pairs["lead"], lead_pos) & np.isin(self.pairs["deal"], deal_pos)
+        return self.pairs[ok].reset_index(drop=True)
+
+    def frame(self, pairs, columns=("COGNOME", "NOME", "EMAIL", "TELEFONO", "CORSI")):
+        """``pairs`` side by side with the lead and deal ``columns``, for review."""
+        cols = list(columns)
+        lead = self.leads[[LEAD_KEY, *cols]].take(pairs["lead"]).reset_index(drop=True)
+        deal = self.deals[[DEAL_KEY, *cols]].take(pairs["deal"]).reset_index(drop=True)
+        lead.columns = [LEAD_KEY] + [f"{c}_lead" for c in cols]
+        deal.columns = [DEAL_KEY] + [f"{c}_deal" for c in cols]
+        return pd.concat([pairs[["score", "criteri"]].reset_index(drop=True), lead, deal], axis=1)
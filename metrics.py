@@ -0,0 +1,115 @@
+"""Dashboard metrics as plain functions of the filtered data.
+
+The header KPIs, the conversion per corso, the Lead → Deal → sale funnel and
+the days from lead to sale are computed here from cube cells (see cube.py),
+join selections (see join.py) and linkage pairs (see linkage.py), with no
+Streamlit involved: the dashboard draws them, report.py writes them for
+many slices at once and api.py serves them.
+"""
+import cube
+import filters
+import join
+import linkage
+
+CONCLUSO = cube.CONCLUSO
+
+
+def concluded(deal_cells):
+    return cube.equal(deal_cells, "STATO", CONCLUSO)
+
+
+def kpis(deal_cells, lead_cells):
+    """Lead/deal/sale totals, conversion rate (%) and revenue of sales."""
+    conclusi = concluded(deal_cells)
+    n_leads = int(cube.total(lead_cells))
+    n_deals = int(cube.total(deal_cells))
+    n_conclusi = int(cube.total(conclusi))
+    return {
+        "n_leads": n_leads,
+        "n_deals": n_deals,
+        "n_conclusi": n_conclusi,
+        "tasso": (n_conclusi / n_deals * 100) if n_deals > 0 else 0.0,
+        "fatturato": float(cube.total(conclusi, "IMPORTO CONTRATTO")),
+    }
+
+
+def leads_vs_conclusi(lead_cells, deal_cells):
+    """Leads and sales per corso (columns CORSI, Lead, Conclusi)."""
+    lead_per_corso = cube.rollup(lead_cells, "CORSI").rename(columns={cube.N: "Lead"})
+    conclusi = cube.rollup(concluded(deal_cells), "CORSI").rename(columns={cube.N: "Conclusi"})
+    out = lead_per_corso.merge(conclusi, on="CORSI", how="outer").fillna(0)
+    out["Conclusi"] = out["Conclusi"].astype(int)
+    out["Lead"] = out["Lead"].astype(int)
+    return out
+
+
+def conversion_by_corso(deal_cells, by="CORSI"):
+    """Deals, sales and Deal → sale rate (%) per corso (or per ``by``)."""
+    deals = cube.rollup(deal_cells, by).rename(columns={cube.N: "Deal Totali"})
+    conclusi = cube.rollup(concluded(deal_cells), by).rename(columns={cube.N: "Conclusi"})
+    out = deals.merge(conclusi, on=by, how="left").fillna(0)
+    out["Conclusi"] = out["Conclusi"].astype(int)
+    out["Tasso %"] = (out["Conclusi"] / out["Deal Totali"] * 100).round(1)
+    return out
+
+
+def matched(sel):
+    """States and dates of the matched Lead ↔ Deal rows of ``sel``."""
+    both = sel.both(["STATO_lead", "STATO_deal", "DATA ENTRATA", "DATA ESITO"])
+    for col in ["STATO_lead", "STATO_deal"]:
+        # Only the states present among the matches
+        both[col] = both[col].cat.remove_unused_categories()
+    return both
+
+
+def match(sel, n_leads, both=None, fuzzy=None):
+    """Match counts, funnel and mean days from lead entry to sale.
+
+    ``both`` is :func:`matched` of ``sel``, when the caller already has it.
+    ``fuzzy`` holds the linkage pairs among the unmatched rows of ``sel``
+    (``Linkage.select``): they count as ``n_fuzzy``, not as only-lead or
+    only-deal rows.
+    """
+    if both is None:
+        both = matched(sel)
+    n_fuzzy = 0 if fuzzy is None else len(fuzzy)
+    won = both[both["STATO_deal"] == CONCLUSO]
+    days = (won["DATA ESITO"] - won["DATA ENTRATA"]).dt.days.dropna()
+    return {
+        "n_both": len(both),
+        "n_fuzzy": n_fuzzy,
+        "n_only_lead": sel.n_only_lead - n_fuzzy,
+        "n_only_deal": sel.n_only_deal - n_fuzzy,
+        "funnel": {
+            "Lead Totali": n_leads,
+            "Lead con Deal": len(both),
+            "Vendite Concluse": len(won),
+        },
+        "avg_days": float(days.mean()) if len(days) else None,
+    }
+
+
+class Engine:
+    """Cubes, filter and join indexes and linkage of one data load, to
+    report slices."""
+
+    def __init__(self, deals, leads):
+        self.deal_cube = cube.build_deals(deals)
+        self.lead_cube = cube.build_leads(leads)
+        self.filters = filters.build(deals, leads)
+        self.join = join.JoinIndex(leads, deals)
+        self.linkage = linkage.Linkage(leads, deals, self.join.pair_lead, self.join.pair_deal)
+
+    def report(self, corsi=(), providers=(), start=None, end=None):
+        """Every metric for one slice; filters as in the sidebar."""
+        corsi, providers = list(corsi), list(providers)
+        deal_cells = cube.select(self.deal_cube, corsi, providers, start, end)
+        lead_cells = cube.select(self.lead_cube, corsi, None, start, end)
+        out = kpis(deal_cells, lead_cells)
+        deal_pos, lead_pos = filters.select_rows(self.filters, corsi, providers, start, end)
+        sel = self.join.select(lead_pos, deal_pos)
+        fuzzy = self.linkage.select(sel.lead_pos, sel.deal_pos)
+        out.update(match(sel, out["n_leads"], fuzzy=fuzzy))
+        out["conversione_corsi"] = conversion_by_corso(deal_cells)
+        out["lead_vs_conclusi"] = leads_vs_conclusi(lead_cells, deal_cells)
+        return out
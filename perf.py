@@ -0,0 +1,173 @@
+"""Opt-in timing and memory instrumentation of dashboard reruns.
+
+A :class:`Recorder` measures named stages of one rerun (load, filters, tab
+computations, figure serialization...) and appends the rerun as one JSON
+line to a local log, from which :func:`percentiles` derives p50/p95 per
+stage. Levels:
+
+- ``"time"``: wall time only, cheap enough to leave on in production;
+- ``"memory"``: wall time plus peak memory per stage via tracemalloc, which
+  slows the rerun down noticeably: use it to investigate, not to track
+  latency. tracemalloc traces the whole process and its peak is global,
+  so the peaks are only meaningful with a single session at a time; the
+  level is therefore set by the operator (``DASHBOARD_PERF``), never by a
+  viewer's URL (:func:`request_level`).
+
+Disabled recorders cost a context manager per stage and nothing else.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+_lock = threading.Lock()
+
+
+def parse_level(value):
+    """Instrumentation level for a setting such as ``"1"``, ``"time"``,
+    ``"memory"``; None when disabled."""
+    value = (value or "").strip().lower()
+    if value in ("1", "true", "on", "time"):
+        return "time"
+    if value in ("mem", "memory"):
+        return "memory"
+    return None
+
+
+def request_level(url_value, env_value):
+    """Level of one rerun: ``url_value`` (``?perf=``) may only turn on
+    "time"; "memory" comes from ``env_value`` (``DASHBOARD_PERF``) alone."""
+    if parse_level(url_value):
+        return "time"
+    return parse_level(env_value)
+
+
+class Recorder:
+    def __init__(self, level=None, kind="rerun"):
+        self.level = level
+        self.kind = kind
+        self.stages = []
+        self._stack = []
+        self._start = time.perf_counter()
+        # Started here, stopped by finish(); tracing started elsewhere
+        # (another recorder, a profiler) is left alone.
+        self._tracing = level == "memory" and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    @property
+    def enabled(self):
+        return self.level is not None
+
+    @contextmanager
+    def stage(self, name):
+        """Time (and with level "memory", peak-trace) the enclosed block."""
+        if not self.enabled:
+            yield
+            return
+        entry = {"stage": name, "depth": len(self._stack)}
+        memory = self.level == "memory" and tracemalloc.is_tracing()
+        if memory:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            entry["_max"] = 0
+        self._stack.append(entry)
+        self.stages.append(entry)  # in start order, parents first
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry["seconds"] = time.perf_counter() - t0
+            self._stack.pop()
+            if memory:
+                # Inner stages reset the peak: carry their peaks upwards.
+                peak = max(tracemalloc.get_traced_memory()[1], entry.pop("_max"))
+                entry["peak_mb"] = round((peak - base) / 2**20, 2)
+                if self._stack:
+                    self._stack[-1]["_max"] = max(self._stack[-1].get("_max", 0), peak)
+
+    def mark(self, name):
+        """Seconds since the run started; also recorded as stage ``name``
+        (from the start of the run) when enabled."""
+        seconds = time.perf_counter() - self._start
+        if self.enabled:
+            self.stages.append({"stage": name, "depth": 0, "seconds": seconds})
+        return seconds
+
+    def record(self, **extra):
+        """The finished run as a log record."""
+        return {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "kind": self.kind,
+            "level": self.level,
+            "seconds": time.perf_counter() - self._start,
+            "stages": self.stages,
+            **extra,
+        }
+
+    def finish(self, path, **extra):
+        """Append the run to the JSONL log at ``path``; return the record."""
+        if not self.enabled:
+            return None
+        rec = self.record(**extra)
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        line = json.dumps(rec, ensure_ascii=False, default=str)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with _lock, open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            pass  # read-only deployment: the panel still shows the rerun
+        return rec
+
+
+def read_log(path, last=1000):
+    """The ``last`` records of the JSONL log (unreadable lines skipped)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()[-last:]
+    except OSError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def percentiles(records, kind="rerun"):
+    """Runs, p50 and p95 (ms) per stage, and for the whole run as "totale"."""
+    rows = []
+    for rec in records:
+        if rec.get("kind") != kind:
+            continue
+        rows.append(("totale", rec["seconds"]))
+        rows.extend((s["stage"], s["seconds"]) for s in rec.get("stages", []))
+    if not rows:
+        return pd.DataFrame(columns=["Fase", "Esecuzioni", "p50 ms", "p95 ms"])
+    df = pd.DataFrame(rows, columns=["Fase", "s"])
+    out = df.groupby("Fase", sort=False)["s"].agg(
+        Esecuzioni="count",
+        p50=lambda s: s.quantile(0.5) * 1000,
+        p95=lambda s: s.quantile(0.95) * 1000,
+    )
+    out = out.rename(columns={"p50": "p50 ms", "p95": "p95 ms"}).round(1)
+    return out.sort_values("p95 ms", ascending=False).reset_index()
+
+
+def stages_frame(stages):
+    """This run's stages, indented by nesting, for display."""
+    return pd.DataFrame({
+        "Fase": ["  " * s["depth"] + s["stage"] for s in stages],
+        "ms": [round(s["seconds"] * 1000, 1) for s in stages],
+        "MB picco": [s.get("peak_mb") for s in stages],
+    })
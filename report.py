@@ -0,0 +1,151 @@
+"""Headless reports: the dashboard metrics for many slices at once.
+
+    python report.py --window 2025-01-01:2025-03-31 --window 2025-04-01:2025-06-30 \\
+        --every-corso --out report.json
+
+A slice is a date window (whole days, both included; the whole period when
+no window is given) crossed with one corso (all corsi when none is given).
+Metrics come from metrics.py, as in the dashboard. Slices run in parallel
+in a process pool: each worker reads the Parquet-cached exports and builds
+the indexes once, then computes the slices it is handed.
+
+JSON output holds one object per slice; Parquet output is one long table
+with a row per slice, metric and (for per-corso tables) corso.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+import dataset
+import metrics
+
+_engine = None
+
+
+def _init_worker(deal_file, lead_file):
+    global _engine
+    deals = dataset.load_export(deal_file, "deals")
+    leads = dataset.load_export(lead_file, "leads")
+    _engine = metrics.Engine(deals, leads)
+
+
+def _run_slice(spec):
+    start, end, corso = spec
+    out = _engine.report([corso] if corso else [], [], start, end)
+    return {"start": start, "end": end, "corso": corso, **out}
+
+
+def parse_window(text):
+    """``"YYYY-MM-DD:YYYY-MM-DD"`` as a pair of whole-day timestamps."""
+    try:
+        start, end = (pd.Timestamp(part) for part in text.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"finestra non valida: {text!r} (atteso INIZIO:FINE)")
+    if end < start:
+        raise argparse.ArgumentTypeError(f"finestra non valida: {text!r} (fine prima dell'inizio)")
+    return start.floor("D"), end.floor("D")
+
+
+def monthly_windows(deals, leads):
+    """One window per calendar month with lead/deal entries."""
+    dates = pd.concat([deals["DATA INGRESSO LEAD"], leads["DATA ENTRATA"]]).dropna()
+    # Months present in the data only: a stray old date must not add
+    # decades of empty windows.
+    months = sorted(dates.dt.to_period("M").unique())
+    return [(m.start_time, m.end_time.floor("D")) for m in months]
+
+
+def json_value(value):
+    """``value`` made JSON-ready: frames as lists of records, dates as ISO days."""
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient="records", force_ascii=False))
+    if isinstance(value, pd.Timestamp):
+        return value.date().isoformat()
+    if isinstance(value, dict):
+        return {k: json_value(v) for k, v in value.items()}
+    return value
+
+
+def write_json(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([json_value(r) for r in results], f, ensure_ascii=False, indent=2)
+
+
+def long_table(results):
+    """Every slice's metrics as rows of (slice, metric, CORSI, value)."""
+    rows = []
+    for r in results:
+        key = {"start": r["start"], "end": r["end"], "corso": r["corso"]}
+        for name, value in r.items():
+            if name in key:
+                continue
+            if isinstance(value, pd.DataFrame):
+                for _, rec in value.iterrows():
+                    for col in value.columns.drop("CORSI"):
+                        rows.append({**key, "metric": f"{name}.{col}", "CORSI": rec["CORSI"], "value": rec[col]})
+            elif isinstance(value, dict):
+                for sub, v in value.items():
+                    rows.append({**key, "metric": f"{name}.{sub}", "CORSI": None, "value": v})
+            else:
+                rows.append({**key, "metric": name, "CORSI": None, "value": value})
+    out = pd.DataFrame(rows, columns=["start", "end", "corso", "metric", "CORSI", "value"])
+    out["value"] = pd.to_numeric(out["value"]).astype("float64")
+    return out
+
+
+def write_parquet(results, path):
+    long_table(results).to_parquet(path, index=False)
+
+
+WRITERS = {".json": write_json, ".parquet": write_parquet}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--data-dir", type=Path, default=dataset.DATA_DIR)
+    parser.add_argument("--window", type=parse_window, action="append", default=[],
+                        metavar="INIZIO:FINE", help="finestra di date (ripetibile)")
+    parser.add_argument("--monthly", action="store_true", help="una finestra per mese di calendario")
+    parser.add_argument("--corso", action="append", default=[], help="corso (ripetibile)")
+    parser.add_argument("--every-corso", action="store_true", help="una slice per ogni corso")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="processi in parallelo")
+    parser.add_argument("--out", type=Path, required=True, help="file .json o .parquet")
+    args = parser.parse_args(argv)
+
+    writer = WRITERS.get(args.out.suffix.lower())
+    if writer is None:
+        parser.error("--out deve finire in .json o .parquet")
+    deal_file = dataset.latest_export(dataset.DEAL_PATTERN, args.data_dir)
+    lead_file = dataset.latest_export(dataset.LEAD_PATTERN, args.data_dir)
+
+    # Converted once here, so the workers only read the Parquet cache.
+    deals = dataset.load_export(deal_file, "deals")
+    leads = dataset.load_export(lead_file, "leads")
+
+    windows = list(args.window)
+    if args.monthly:
+        windows += monthly_windows(deals, leads)
+    windows = windows or [(None, None)]
+    corsi = list(args.corso)
+    if args.every_corso:
+        all_corsi = set(deals["CORSI"].dropna()) | set(leads["CORSI"].dropna())
+        corsi += sorted(all_corsi - set(corsi))
+    corsi = corsi or [None]
+    specs = [(start, end, corso) for start, end in windows for corso in corsi]
+    del deals, leads
+
+    jobs = max(1, min(args.jobs or 1, len(specs)))
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(deal_file, lead_file)) as pool:
+        # A few batches per worker: fewer round trips, still balanced.
+        results = list(pool.map(_run_slice, specs, chunksize=max(1, len(specs) // (jobs * 4))))
+    writer(results, args.out)
+    print(f"{len(results)} slice scritte in {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
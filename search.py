@@ -0,0 +1,133 @@
+"""Inverted index behind the search boxes of the "Dettaglio dati" tab.
+
+The index is built once per data load over the text columns. Every column
+is factorized first, so each distinct value is tokenized only once, and a
+token maps to the value codes that contain it. Rows are looked up through a
+code-sorted permutation, so a query only touches the rows it returns.
+
+Query syntax: whitespace separated terms, all of which must match. A term
+is a prefix (``ross`` matches "Rossi") and can be scoped to one field with
+``field:value``, e.g. ``commerciale:rossi corso:web``.
+"""
+import bisect
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Search field -> columns it covers, in the raw and in the merged frames.
+FIELDS = {
+    "cognome": ["COGNOME", "COGNOME_lead", "COGNOME_deal"],
+    "nome": ["NOME", "NOME_lead", "NOME_deal"],
+    "email": ["EMAIL", "EMAIL_lead", "EMAIL_deal"],
+    "telefono": ["TELEFONO", "TELEFONO_lead", "TELEFONO_deal"],
+    "corso": ["CORSI", "CORSI_lead", "CORSI_deal"],
+    "commerciale": ["COMMERCIALE"],
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Lowercase and strip accents, so "Savané" is found by "savane"."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return _WORD.findall(normalize(text))
+
+
+class _ColumnIndex:
+    """Sorted token list over one column, with rows grouped by value code."""
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        postings = {}
+        for code, value in enumerate(uniques):
+            for token in set(tokenize(value)):
+                postings.setdefault(token, []).append(code)
+        self.tokens = sorted(postings)
+        self.token_codes = [np.asarray(postings[t], dtype=np.int64) for t in self.tokens]
+        # Row positions sorted by value code; rows of code c live in
+        # order[bounds[c]:bounds[c + 1]]. Missing values (-1) sort first.
+        self.order = np.argsort(codes, kind="stable")
+        self.bounds = np.searchsorted(codes[self.order], np.arange(len(uniques) + 1))
+
+    def prefix_rows(self, prefix):
+        lo = bisect.bisect_left(self.tokens, prefix)
+        hi = bisect.bisect_left(self.tokens, prefix + "\uffff")
+        if lo == hi:
+            return np.empty(0, dtype=np.int64)
+        codes = np.unique(np.concatenate(self.token_codes[lo:hi]))
+        # Gather the order[] slices of all matching codes in one pass.
+        starts = self.bounds[codes]
+        lengths = self.bounds[codes + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.order[offsets + np.arange(lengths.sum())]
+
+
+class SearchIndex:
+    """Field-scoped prefix index over the text columns of ``df``."""
+
+    def __init__(self, df):
+        self.index = df.index
+        self.fields = {}
+        for field, cols in FIELDS.items():
+            built = [_ColumnIndex(df[c]) for c in cols if c in df.columns]
+            if built:
+                self.fields[field] = built
+
+    def term_positions(self, field, prefix):
+        """Row positions where ``field`` (any field if None) has ``prefix``."""
+        fields = [field] if field else list(self.fields)
+        parts = [
+            col.prefix_rows(prefix)
+            for f in fields
+            for col in self.fields.get(f, [])
+        ]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def positions(self, query):
+        """Sorted row positions matching every term of ``query``."""
+        result = np.arange(len(self.index))
+        for field, token in parse(query):
+            rows = self.term_positions(field, token)
+            result = np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+
+def parse(query):
+    """``(field, token)`` pairs of ``query``; field is None when unscoped."""
+    terms = []
+    for term in query.split():
+        field, sep, value = term.partition(":")
+        field = normalize(field)
+        if not sep or field not in FIELDS:
+            # Unscoped, or not a known field: search the whole term as text.
+            field, value = None, term
+        terms.extend((field, token) for token in tokenize(value))
+    return terms
+
+
+def join_mask(query, sides):
+    """Mask of joined rows where every term of ``query`` matches on some side.
+
+    ``sides`` lists ``(index, positions)``: the SearchIndex of one joined
+    frame and, per joined row, the position of the row it came from in that
+    frame (-1 when the row has no such side).
+    """
+    n = len(sides[0][1])
+    mask = np.ones(n, dtype=bool)
+    for field, token in parse(query):
+        hit = np.zeros(n, dtype=bool)
+        for index, positions in sides:
+            # One spare slot at the end, so that position -1 reads False.
+            rows = np.zeros(len(index.index) + 1, dtype=bool)
+            rows[index.term_positions(field, token)] = True
+            hit |= rows[positions]
+        mask &= hit
+    return mask
@@ -0,0 +1,164 @@
+"""Loaded datasets published once per host as memory-mapped Arrow files.
+
+``st.cache_resource`` keeps one copy of the frames per server process, so
+every replica parses and holds its own. Here the first process to load a
+data version writes the frames as uncompressed Arrow IPC files under
+``<cache>/shared/<version>/``; every process then maps them read-only.
+Text and integer columns reference the mapped pages directly (one copy in
+the OS page cache for the whole host); only category codes and columns
+with missing numbers or dates are materialized per process.
+
+``CURRENT`` names the published version. Only :func:`publish` replaces
+it, atomically, after a new version is fully written, and never with a
+version older than the current one; processes still on an older version
+load the new one when their watcher (see watcher.py) sees the new exports,
+and map it if it is already published. A version is older than another
+when its folder was finished first. Publishing removes the finished
+versions older than the new one, never a ``*.tmp`` folder, which another
+process may still be writing.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+import dataset
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: without pyarrow every process keeps its own copy
+    pa = None
+
+SHARED_DIR = os.path.join(dataset.CACHE_DIR, "shared")
+
+# Address range of the file a frame was mapped from, in ``DataFrame.attrs``.
+MAPPED = "shared_mapped"
+
+
+def _pointer(shared_dir):
+    return os.path.join(shared_dir, "CURRENT")
+
+
+def current(shared_dir=SHARED_DIR):
+    """The published version, or None."""
+    try:
+        with open(_pointer(shared_dir), encoding="utf-8") as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _finished(shared_dir):
+    """Modification time of each published version folder, by version."""
+    out = {}
+    for entry in os.scandir(shared_dir):
+        if entry.is_dir() and not entry.name.endswith(".tmp"):
+            out[entry.name] = entry.stat().st_mtime
+    return out
+
+
+def _swap(shared_dir, version):
+    versions = _finished(shared_dir)
+    published = versions.get(version)
+    if published is None:
+        return  # removed already by the publisher of a newer version
+    latest = current(shared_dir)
+    if latest in versions and versions[latest] > published:
+        return  # a newer version is current already: no rollback
+    tmp = _pointer(shared_dir) + f".{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+    os.replace(tmp, _pointer(shared_dir))
+    # Mapped files stay readable after removal on POSIX; elsewhere the
+    # removal fails while a process still maps them, and is retried later.
+    for name, mtime in versions.items():
+        if mtime < published:
+            shutil.rmtree(os.path.join(shared_dir, name), ignore_errors=True)
+
+
+def attach(version, names, shared_dir=SHARED_DIR):
+    """Frames ``names`` of ``version`` mapped from the shared files, or None
+    if that version was not published."""
+    if pa is None:
+        return None
+    folder = os.path.join(shared_dir, version)
+    try:
+        frames = {}
+        for name in names:
+            source = pa.memory_map(os.path.join(folder, f"{name}.arrow"), "r")
+            df = pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+            source.seek(0)
+            mapped = source.read_buffer(source.size())
+            df.attrs[MAPPED] = (mapped.address, mapped.address + mapped.size)
+            frames[name] = df
+    except (OSError, pa.ArrowInvalid):
+        return None
+    return frames
+
+
+def _buffers(values):
+    """``(address, size)`` of the memory behind a column's values."""
+    chunked = getattr(values, "_pa_array", None)
+    if chunked is not None:
+        return [(b.address, b.size) for chunk in chunked.chunks for b in chunk.buffers() if b is not None]
+    try:
+        arr = np.asarray(values)
+    except (TypeError, ValueError):
+        return []
+    if arr.dtype == object:
+        return []
+    return [(arr.__array_interface__["data"][0], arr.nbytes)]
+
+
+def owned_nbytes(df):
+    """Memory of ``df`` owned by this process: what ``memory_usage`` reports,
+    less the pages its columns reference in a mapped shared file, which are
+    the OS page cache's and shared with every other process."""
+    total = int(df.memory_usage(deep=True, index=True).sum())
+    lo, hi = df.attrs.get(MAPPED, (0, 0))
+    if hi <= lo:
+        return total
+    for _, col in df.items():
+        total -= sum(size for address, size in _buffers(col.array) if lo <= address < hi)
+    return max(total, 0)
+
+
+def read_meta(version, shared_dir=SHARED_DIR):
+    """The ``meta`` published with ``version``, or None."""
+    try:
+        with open(os.path.join(shared_dir, version, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish(version, frames, shared_dir=SHARED_DIR, meta=None):
+    """Write ``frames`` (name → DataFrame) as ``version`` and make it current
+    unless a newer version is; ``meta`` (JSON-serializable) is stored next
+    to them.
+
+    Returns the frames mapped back from the shared files, or None when they
+    cannot be written (no pyarrow, read-only deployment).
+    """
+    if pa is None:
+        return None
+    folder = os.path.join(shared_dir, version)
+    if not os.path.isdir(folder):
+        tmp = f"{folder}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            for name, df in frames.items():
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                with pa.OSFile(os.path.join(tmp, f"{name}.arrow"), "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            if meta is not None:
+                with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                    json.dump(meta, f, ensure_ascii=False)
+            os.rename(tmp, folder)
+            _swap(shared_dir, version)
+        except OSError:
+            # Read-only, or another process published the same version first.
+            shutil.rmtree(tmp, ignore_errors=True)
+    return attach(version, list(frames), shared_dir)
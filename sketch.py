@@ -0,0 +1,108 @@
+"""Quantiles of days to close and contract value from mergeable sketches.
+
+The distribution of a value is kept as a DDSketch-style histogram: value
+``x`` falls in the bucket ``ceil(log(|x|) / log(GAMMA))``, so every value
+of a bucket is within ``RELATIVE_ACCURACY`` of the bucket's representative
+value, whatever the range of the data. Bucket boundaries are the same for
+every sketch, so merging sketches is summing their counts per bucket.
+
+:func:`build` turns the concluded deals of a data load into bucket counts
+per metric and month of entry: one small cube per breakdown (none, CORSI,
+PROVIDER, COMMERCIALE) plus one by CORSI and PROVIDER for the sidebar
+filters, each kept only when ``cube.MIN_GAIN`` times smaller than the
+bucketed values it counts (the values themselves answer otherwise, so the
+sketches never hold more than the values). ``cube.select`` applies the
+sidebar filters; quantiles of any filter set and breakdown are then read
+off the merged counts, never off the sorted raw rows.
+
+Metrics sketched per concluded deal: days from lead entry (``DATA
+INGRESSO LEAD``) to ``DATA ESITO``, and ``IMPORTO CONTRATTO``.
+"""
+import numpy as np
+import pandas as pd
+
+import cube
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# |x| below MIN_VALUE counts as 0; OFFSET keeps the bucket of the smallest
+# kept |x| above 0, so a key's sign is the value's sign and keys sort like
+# the values.
+MIN_VALUE = 1e-6
+OFFSET = int(np.ceil(-np.log(MIN_VALUE) / np.log(GAMMA))) + 1
+
+DIMS = ["CORSI", "PROVIDER", "COMMERCIALE"]
+DATE = "DATA INGRESSO LEAD"
+METRIC = "METRICA"
+KEY = "BUCKET"
+DAYS = "Giorni alla conclusione"
+AMOUNT = "Importo contratto"
+QUANTILES = [0.5, 0.9, 0.99]
+
+# Breakdowns with a cube of their own; the sidebar filters on CORSI and
+# PROVIDER use the cube holding both, or the rows.
+CUBES = [([METRIC, KEY], None)] + [([d, METRIC, KEY], None) for d in DIMS] + [
+    (["CORSI", "PROVIDER", METRIC, KEY], None),
+]
+
+
+def keys(values):
+    """Bucket key of each value (0 for values near zero)."""
+    values = np.asarray(values, dtype="float64")
+    mag = np.abs(values)
+    safe = np.where(mag >= MIN_VALUE, mag, 1.0)
+    idx = np.ceil(np.log(safe) / np.log(GAMMA)).astype("int64") + OFFSET
+    return np.where(mag >= MIN_VALUE, np.sign(values).astype("int64") * idx, 0)
+
+
+def values(keys):
+    """Representative value of each bucket key."""
+    keys = np.asarray(keys, dtype="int64")
+    idx = np.abs(keys) - OFFSET
+    mid = 2 * GAMMA ** idx.astype("float64") / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * mid)
+
+
+def build(deals, token=None):
+    """:class:`cube.Cubes` of the bucket counts of the concluded deals of
+    ``deals``, per metric; ``token`` as in cube.Cubes."""
+    won = deals[deals["IS_CONCLUSO"]]
+    dims = [d for d in DIMS if d in won.columns]
+    entry = won[DATE]
+    measures = {
+        DAYS: (won["DATA ESITO"] - entry).dt.days,
+        AMOUNT: won["IMPORTO CONTRATTO"],
+    }
+    parts = []
+    for name, measure in measures.items():
+        ok = measure.notna().to_numpy()
+        part = won.loc[ok, dims + [DATE]].copy()
+        part[METRIC] = name
+        part[KEY] = keys(measure[ok].to_numpy(dtype="float64"))
+        parts.append(part)
+    rows = pd.concat(parts, ignore_index=True)
+    rows[METRIC] = rows[METRIC].astype("category")
+    return cube.Cubes(rows, DATE, CUBES, [], token)
+
+
+def quantiles(cells, by=None, qs=QUANTILES):
+    """Count and quantiles ``qs`` of each metric of ``cells`` (from
+    ``cube.select`` on :func:`build`), merged over the other dimensions,
+    per value of ``by`` when given. One row per metric (and ``by`` value)
+    with columns ``N`` and ``p50``, ``p90``..."""
+    groups = ([by] if by else []) + [METRIC]
+    merged = (
+        cube.rollup(cells, groups + [KEY])
+        .sort_values(groups + [KEY], kind="stable", ignore_index=True)
+    )
+    g = merged.groupby(groups, observed=True, sort=False)[cube.N]
+    merged["_cum"] = g.cumsum()
+    merged["_total"] = g.transform("sum")
+    out = merged.groupby(groups, observed=True, sort=False)["_total"].first().rename(cube.N)
+    out = out.to_frame()
+    for q in qs:
+        # Lowest bucket holding the value of rank q·(n − 1), as DDSketch
+        hit = merged[merged["_cum"] > q * (merged["_total"] - 1)]
+        first = hit.groupby(groups, observed=True, sort=False)[KEY].first()
+        out[f"p{round(q * 100):g}"] = pd.Series(values(first.to_numpy()), index=first.index)
+    return out.reset_index()
@@ -0,0 +1,183 @@
+"""Optional SQLite backend for the sidebar filters and chart aggregations.
+
+The prepared exports are written once per data version to a local SQLite
+database (stdlib ``sqlite3``, no server) holding the columns the charts
+aggregate: the cube dimensions and sums, the entry date and the join key,
+indexed on CORSI, PROVIDER, STATO, the key and the date. Filtering and
+grouping then run in SQL and only the aggregated rows come back:
+:meth:`Store.cells` stands in for ``cube.select``, and each rollup, count,
+total or weekly series a chart or KPI asks of it is one indexed query
+returning just that chart's rows.
+
+Dates are stored as ISO text, which sorts like the dates themselves.
+"""
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+import cube
+import dataset
+
+SQLITE_DIR = os.path.join(dataset.CACHE_DIR, "sqlite")
+
+TABLES = {
+    "deals": {"date": "DATA INGRESSO LEAD", "key": "LEAD_ID",
+              "dims": cube.DEAL_DIMS, "sums": cube.DEAL_SUMS},
+    "leads": {"date": "DATA ENTRATA", "key": "ID LEAD",
+              "dims": cube.LEAD_DIMS, "sums": cube.LEAD_SUMS},
+}
+INDEXED = ["CORSI", "PROVIDER", "STATO"]
+
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _columns(kind, df):
+    spec = TABLES[kind]
+    dims = [c for c in spec["dims"] if c in df.columns]
+    sums = [c for c in spec["sums"] if c in df.columns]
+    return dims, sums
+
+
+def build(path, frames):
+    """Write ``frames`` (kind → prepared frame) to a new database at ``path``."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with closing(sqlite3.connect(tmp)) as conn:
+        for kind, df in frames.items():
+            spec = TABLES[kind]
+            dims, sums = _columns(kind, df)
+            out = df[[spec["key"], *dims, *sums]].copy()
+            out[spec["date"]] = df[spec["date"]].dt.strftime("%Y-%m-%d %H:%M:%S")
+            for col in dims:
+                out[col] = out[col].astype(object).where(out[col].notna(), None)
+            out.to_sql(kind, conn, index=False, chunksize=50_000)
+            for col in [spec["key"], spec["date"], *(c for c in INDEXED if c in dims)]:
+                conn.execute(f"CREATE INDEX {_q(f'{kind}_{col}')} ON {kind} ({_q(col)})")
+        conn.execute("ANALYZE")
+        conn.commit()
+    os.replace(tmp, path)
+
+
+def _where(kind, corsi=None, providers=None, start=None, end=None):
+    """SQL condition and parameters of the sidebar filters, as cube.select."""
+    clauses, params = [], []
+    if corsi:
+        clauses.append(f"CORSI IN ({', '.join('?' * len(corsi))})")
+        params.extend(corsi)
+    if providers:
+        clauses.append(f"PROVIDER IN ({', '.join('?' * len(providers))})")
+        params.extend(providers)
+    if start is not None and end is not None:
+        col = _q(TABLES[kind]["date"])
+        # Whole days, end included; undated rows are always kept.
+        clauses.append(f"({col} >= ? AND {col} < ? OR {col} IS NULL)")
+        params.extend([
+            pd.Timestamp(start).strftime("%Y-%m-%d"),
+            (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+        ])
+    return " AND ".join(clauses) or "1", params
+
+
+class Cells:
+    """The rows of one table passing some conditions, aggregated in SQL on
+    demand. Stands in for a cube cells frame: ``cube.rollup``, ``counts``,
+    ``total``, ``weekly`` and ``equal`` hand it their work."""
+
+    def __init__(self, store, kind, where, params):
+        self.store = store
+        self.kind = kind
+        self.where = where
+        self.params = list(params)
+
+    def __repr__(self):
+        # Identifies the result for figure caching (see figures.fingerprint).
+        return f"Cells({self.store.path!r}, {self.kind!r}, {self.where!r}, {self.params!r})"
+
+    def _counted(self):
+        return {cube.count_col(c): c for c in TABLES[self.kind]["sums"]}
+
+    def _agg(self, col):
+        if col == cube.N:
+            return "COUNT(*)"
+        if col in self._counted():
+            return f"COUNT({_q(self._counted()[col])})"
+        return f"TOTAL({_q(col)})"
+
+    def equal(self, col, value, keep=True):
+        """Rows where ``col`` is ``value`` (or, with ``keep`` false, is not:
+        missing values included, as ``!=`` in pandas)."""
+        op = "=" if keep else "IS NOT"
+        return Cells(self.store, self.kind, f"({self.where}) AND {_q(col)} {op} ?", self.params + [value])
+
+    def total(self, col=cube.N):
+        return self.store.query(
+            f"SELECT {self._agg(col)} AS v FROM {self.kind} WHERE {self.where}", self.params
+        )["v"].iloc[0]
+
+    def rollup(self, by, col=cube.N):
+        """``col`` summed per value of ``by`` (rows with a missing ``by``
+        dropped), ordered by ``by`` like a pandas groupby."""
+        by = [by] if isinstance(by, str) else list(by)
+        keys = ", ".join(_q(c) for c in by)
+        not_null = " AND ".join(f"{_q(c)} IS NOT NULL" for c in by)
+        out = self.store.query(
+            f"SELECT {keys}, {self._agg(col)} AS {_q(col)} FROM {self.kind} "
+            f"WHERE ({self.where}) AND {not_null} GROUP BY {keys} ORDER BY {keys}",
+            self.params,
+        )
+        for c in by:
+            out[c] = out[c].astype("str").astype("category")
+        counts = col == cube.N or col in self._counted()
+        return out.astype({col: "int64" if counts else "float64"})
+
+    def weekly(self, col=cube.N):
+        """``col`` summed per week of entry, dated by the week's Monday."""
+        date = _q(TABLES[self.kind]["date"])
+        monday = f"date(substr({date}, 1, 10), '-6 days', 'weekday 1')"
+        out = self.store.query(
+            f"SELECT {monday} AS Settimana, {self._agg(col)} AS {_q(col)} FROM {self.kind} "
+            f"WHERE ({self.where}) AND {date} IS NOT NULL GROUP BY 1 ORDER BY 1",
+            self.params,
+        )
+        out["Settimana"] = pd.to_datetime(out["Settimana"], format="%Y-%m-%d").astype("datetime64[us]")
+        return out
+
+
+class Store:
+    """Read-only queries on the database at ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+        self.uri = f"file:{path}?mode=ro"
+
+    def query(self, sql, params=()):
+        # One connection per query: sessions run on their own threads.
+        with closing(sqlite3.connect(self.uri, uri=True)) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def cells(self, kind, corsi=None, providers=None, start=None, end=None):
+        """:class:`Cells` of the rows matching the sidebar filters, the
+        counterpart of ``cube.select``."""
+        where, params = _where(kind, corsi, providers, start, end)
+        return Cells(self, kind, where, params)
+
+
+def open_store(version, frames, sqlite_dir=SQLITE_DIR):
+    """The :class:`Store` of data ``version``, written from ``frames`` the
+    first time."""
+    path = os.path.join(sqlite_dir, f"{version}.db")
+    if not os.path.exists(path):
+        os.makedirs(sqlite_dir, exist_ok=True)
+        build(path, frames)
+        for name in os.listdir(sqlite_dir):
+            if name.endswith(".db") and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(sqlite_dir, name))
+                except OSError:
+                    pass
+    return Store(path)
@@ -0,0 +1,189 @@
+"""Synthetic Deal / Lead exports for benchmarks.
+
+The frames have the columns of the raw CRM exports (including the ones the
+dashboard drops at load) with value mixes close to the real data: STATO,
+SOTTOSTATO, CORSI and PROVIDER frequencies, entry dates over five years,
+contract amounts, and a configurable share of deals whose ``LEAD_ID``
+matches a lead's ``ID LEAD``. Names, emails and phones are generated, never
+taken from real exports.
+"""
+import numpy as np
+import pandas as pd
+
+DEAL_STATI = {
+    "non interessato": 0.64, "promosso": 0.20, "sospeso": 0.067, "non valido": 0.059,
+    "respinto contabilità": 0.024, "concluso": 0.004, "da richiamare": 0.002,
+    "Non confermato": 0.002, "da confermare": 0.001, "confermato": 0.001,
+}
+LEAD_STATI = {
+    "Non confermato": 0.194, "non interessato": 0.182, "libero": 0.174,
+    "non valido": 0.168, "Chiuso": 0.142, "in lavorazione": 0.14,
+}
+SOTTOSTATI = {
+    "problemi economici": 0.22, "indeciso poca motivazione": 0.14,
+    "interessato richiamare più avanti": 0.12, "solo curiosità": 0.07,
+    "prezzo troppo alto": 0.07, "troppi impegni riproporre più avanti": 0.06,
+    "interessato ma non adesso più avanti": 0.03, "cerca un corso diverso": 0.03,
+    "no risposta subito": 0.04, "no criteri per consulenza": 0.03,
+    "chiuso attivate le procedure d'iscrizione": 0.02, "no e-learning solo aula": 0.02,
+    None: 0.15,
+}
+CORSI = {
+    "Sicurezza Informatica (CompTia Security+)": 0.15,
+    "Interior Design (Teoria e tecnica – Revit Architectural)": 0.12,
+    "Tecnico Informatico On-Line (CompTIA A+  + P.E.K.I.T IT DOCTOR)": 0.11,
+    "Disegno Meccanico (Autocad 2D – Inventor)": 0.09,
+    "Social Media & Leads Generation": 0.08,
+    "Segreteria Amministrativa": 0.08,
+    "Blender": 0.08,
+    "Web Developer Full Stack Front-end & Back-end": 0.06,
+    "Design & Digital Graphic": 0.06,
+    "Game Design and Development": 0.04,
+    "Il Linguaggio Java (Java SE OCP 11 DEVELOPER)": 0.03,
+    "Contabilità e Paghe": 0.03,
+    "Project Management": 0.02,
+    "Data Analyst": 0.02,
+    "Fotografia Digitale": 0.01,
+    None: 0.02,
+}
+PROVIDERS = {
+    "CULT ADV": 0.22, "E-LEAD": 0.14, "Trovaformazione": 0.12, "Bigdata": 0.10,
+    "Facebook": 0.10, "Triboo": 0.07, "Sito": 0.07, "Click Academy": 0.05,
+    "Google": 0.04, "ADSTRATEGYGLOBAL": 0.04, "ascendia": 0.03, "Tuttoformazione": 0.02,
+}
+PAGAMENTI = {
+    "Bonifico": 0.66, "Finanziamento Tasso zero": 0.25, "Finanziamento con interessi": 0.06,
+    "Soisy": 0.02, "Carta di credito": 0.01,
+}
+RATE = {1: 0.22, 3: 0.07, 6: 0.25, 12: 0.25, 24: 0.04, 30: 0.04, 8: 0.03, 2: 0.03, 18: 0.07}
+DOMAINS = ["gmail.com", "hotmail.it", "libero.it", "yahoo.it", "outlook.it", "virgilio.it"]
+
+_SYLLABLES = ["ma", "ri", "ro", "sa", "li", "to", "ni", "co", "ra", "ve", "bel", "gian",
+              "lu", "cci", "ti", "de", "fa", "no", "ran", "pe", "sso", "gal", "mo", "ca"]
+
+START = pd.Timestamp("2021-01-01")
+END = pd.Timestamp("2026-02-01")
+
+
+def _pick(rng, weights, n):
+    """``n`` values drawn with the given ``{value: weight}`` frequencies."""
+    values = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=float)
+    return values[rng.choice(len(values), n, p=p / p.sum())]
+
+
+def _words(rng, count, parts):
+    """``count`` made-up capitalized words of ``parts`` syllables."""
+    picks = rng.choice(_SYLLABLES, (count, parts))
+    return np.array(["".join(w).capitalize() for w in picks], dtype=object)
+
+
+def _people(rng, n):
+    surnames = _words(rng, 4000, 3)
+    names = _words(rng, 600, 2)
+    cognome = pd.Series(surnames[rng.integers(0, len(surnames), n)])
+    nome = pd.Series(names[rng.integers(0, len(names), n)])
+    email = (
+        nome.str.lower() + "." + cognome.str.lower()
+        + pd.Series(rng.integers(1, 999, n)).astype(str)
+        + "@" + pd.Series(np.array(DOMAINS, dtype=object)[rng.integers(0, len(DOMAINS), n)])
+    )
+    telefono = "3" + pd.Series(rng.integers(10**8, 10**9, n)).astype(str)
+    return cognome, nome, email, telefono
+
+
+def _entry_dates(rng, n):
+    span = (END - START).total_seconds()
+    return START + pd.to_timedelta(rng.uniform(0, span, n).astype("int64"), unit="s")
+
+
+def _lead_ids(rng, n):
+    """``n`` distinct lead ids, spread over a range wider than ``n``."""
+    return rng.permutation(3 * n)[:n] + 1
+
+
+def leads(n, seed=0):
+    """Raw LeadArchiveDatatable export with ``n`` rows."""
+    rng = np.random.default_rng(seed)
+    cognome, nome, email, telefono = _people(rng, n)
+    entrata = _entry_dates(rng, n)
+    return pd.DataFrame({
+        "ID": np.arange(1, n + 1),
+        "ID LEAD": _lead_ids(rng, n),
+        "COGNOME": cognome,
+        "NOME": nome,
+        "EMAIL": email,
+        "TELEFONO": telefono,
+        "STATO": _pick(rng, LEAD_STATI, n),
+        "SOTTOSTATO": _pick(rng, SOTTOSTATI, n),
+        "PROVIDER": _pick(rng, PROVIDERS, n),
+        "CORSI": _pick(rng, CORSI, n),
+        "COSTO LEAD": rng.choice([5.0, 10.0, 15.0, 20.0, 25.0], n),
+        "DATA ENTRATA": entrata,
+        "DATA USCITA": entrata.floor("D") + pd.Timedelta(days=1),
+        "NOTE": "x",
+    })
+
+
+def deals(n, lead_ids=None, match_rate=0.7, seed=1):
+    """Raw DealDatatable export with ``n`` rows.
+
+    A ``match_rate`` share of the deals takes its ``LEAD_ID`` from
+    ``lead_ids`` (the leads' ``ID LEAD``); the others match no lead.
+    """
+    rng = np.random.default_rng(seed)
+    cognome, nome, email, telefono = _people(rng, n)
+    stato = _pick(rng, DEAL_STATI, n)
+
+    lead_id = _lead_ids(rng, n) + 10**9  # outside any lead id range
+    if lead_ids is not None and len(lead_ids):
+        matched = rng.random(n) < match_rate
+        k = min(int(matched.sum()), len(lead_ids))
+        rows = np.flatnonzero(matched)[:k]
+        lead_id[rows] = rng.choice(np.asarray(lead_ids), k, replace=False)
+
+    ingresso = _entry_dates(rng, n)
+    days = rng.geometric(0.3, n) - 1
+    esito = (ingresso + pd.to_timedelta(days, unit="D")).floor("D")
+    esito = esito.where(rng.random(n) > 0.1)  # no outcome yet
+    appuntamento = ingresso.floor("D") + pd.to_timedelta(rng.integers(1, 10, n), unit="D")
+
+    # Contract fields are filled for the deals that reached an offer.
+    offered = np.isin(stato, ["concluso", "promosso", "respinto contabilità", "sospeso"])
+    importo = np.where(offered, rng.normal(2300, 350, n).clip(0).round(2), np.nan)
+    return pd.DataFrame({
+        "ID": np.arange(1, n + 1),
+        "LEAD_ID": lead_id,
+        "ANAGRAFICA_ID": rng.integers(1, 2 * n + 2, n),
+        "COGNOME": cognome,
+        "NOME": nome,
+        "EMAIL": email,
+        "TELEFONO": telefono,
+        "STATO": stato,
+        "SOTTOSTATO": _pick(rng, SOTTOSTATI, n),
+        "RICHIAMI": np.where(rng.random(n) < 0.2, rng.integers(1, 5, n), np.nan),
+        "OPERATORE": _pick(rng, {f"Operatore {i}": 1 / (i + 1) for i in range(45)}, n),
+        "COMMERCIALE": _pick(rng, {f"Commerciale {i}": 1 / (i + 1) for i in range(53)}, n),
+        "DATA INGRESSO LEAD": ingresso,
+        "DATA APPUNTAMENTI": appuntamento.where(rng.random(n) < 0.4),
+        "DATA FISSATO APPUNTAMENTO": ingresso.floor("D") + pd.Timedelta(days=1),
+        "DATA ESITO": esito,
+        "PROVIDER": _pick(rng, PROVIDERS, n),
+        "CORSI": _pick(rng, CORSI, n),
+        "IMPORTO CONTRATTO": importo,
+        "MODALITÀ PAGAMENTO": np.where(offered, _pick(rng, PAGAMENTI, n), None),
+        "RATE": np.where(offered, _pick(rng, RATE, n).astype(float), np.nan),
+        "IMPORTO ISCRIZIONE": np.where(offered, rng.choice([0.0, 190.0, 200.0], n), np.nan),
+        "QUOTA TRATTENUTA": "No",
+        "CONSULENZA IN PRESENZA": "No",
+        "NOTE": None,
+        "CAMPAGNA": "default",
+        "REGIONE": _pick(rng, {"Lombardia": 3, "Lazio": 2, "Emilia-Romagna": 1, "Veneto": 1}, n),
+    })
+
+
+def exports(n, match_rate=0.7, seed=0):
+    """``(deals, leads)`` raw exports of ``n`` rows each, linked by lead id."""
+    lead_frame = leads(n, seed=seed)
+    deal_frame = deals(n, lead_frame["ID LEAD"].to_numpy(), match_rate, seed=seed + 1)
+    return deal_frame, lead_frame
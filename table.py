@@ -0,0 +1,38 @@
+"""Server-side sorting and paging of the large data tables.
+
+Only the visible page of a table is materialized and sent to the browser.
+Sorting runs against :class:`SortIndex`: the rank of every row of a full
+frame in one column's order, computed on first use and kept for the data
+load. Ordering any selection of rows is then an integer argsort of the
+selection's ranks, with no comparisons of the values themselves.
+"""
+import numpy as np
+import pandas as pd
+
+# Sort key of a missing value (or a missing join side): always last.
+MISSING = np.iinfo(np.int64).max
+
+
+class SortIndex:
+    """Per-column ranks of the rows of ``df``: equal values share a rank."""
+
+    def __init__(self, df):
+        self.df = df
+        self._ranks = {}
+
+    def ranks(self, col):
+        if col not in self._ranks:
+            codes, _ = pd.factorize(self.df[col], sort=True)
+            self._ranks[col] = np.where(codes >= 0, codes, MISSING)
+        return self._ranks[col]
+
+    def keys(self, col, positions):
+        """Sort keys of the rows at ``positions`` (-1: no row, sorts last)."""
+        return np.where(positions >= 0, self.ranks(col)[positions], MISSING)
+
+
+def sort_order(keys, descending=False):
+    """Stable permutation sorting ``keys``; missing keys stay last."""
+    if descending:
+        keys = np.where(keys == MISSING, MISSING, -keys)
+    return np.argsort(keys, kind="stable")
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption("--slow", action="store_true", help="run the tests marked slow (1M-row data)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: large synthetic data, run with --slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--slow"):
+        return
+    skip = pytest.mark.skip(reason="slow: run with --slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def xlsx(tmp_path_factory):
+    """Small synthetic exports written as xlsx: kind → path."""
+    folder = tmp_path_factory.mktemp("exports")
+    deals, leads = synthetic.exports(200)
+    paths = {"deals": str(folder / "DealDatatable.xlsx"), "leads": str(folder / "LeadArchiveDatatable.xlsx")}
+    deals.to_excel(paths["deals"], index=False)
+    leads.to_excel(paths["leads"], index=False)
+    return paths
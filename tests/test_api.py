@@ -0,0 +1,89 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import api
+import dataset
+import datasets
+import join
+import linkage
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """API over synthetic exports where some deals were re-created with a
+    new LEAD_ID, so that the linkage finds fuzzy matches."""
+    folder = tmp_path_factory.mktemp("data")
+    cache = str(folder / ".cache")
+    deals, leads = synthetic.exports(2000)
+    rng = np.random.default_rng(3)
+    src = rng.choice(len(leads), 100, replace=False)
+    dst = rng.choice(len(deals), 100, replace=False)
+    for col in ["COGNOME", "NOME", "EMAIL", "TELEFONO", "CORSI"]:
+        deals.loc[dst, col] = leads[col].to_numpy()[src]
+    deals.loc[dst, "LEAD_ID"] += 10**10
+    deals.to_excel(folder / "DealDatatable.xlsx", index=False)
+    leads.to_excel(folder / "LeadArchiveDatatable.xlsx", index=False)
+
+    app = api.Api(str(folder), interval=0)
+    app.sources = lambda: datasets.discover(str(folder), cache)
+    httpd = api.serve(app, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}", folder, cache
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url, headers=None):
+    """Status, headers and parsed JSON body (None when empty)."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as resp:
+            status, head, body = resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as exc:
+        status, head, body = exc.code, exc.headers, exc.read()
+    return status, head, json.loads(body) if body else None
+
+
+def test_match_counts_leave_out_fuzzy_matches(server):
+    base, folder, cache = server
+    status, _, body = get(base + "/aggregates")
+    assert status == 200
+
+    deals = dataset.load_export(str(folder / "DealDatatable.xlsx"), "deals", cache)
+    leads = dataset.load_export(str(folder / "LeadArchiveDatatable.xlsx"), "leads", cache)
+    index = join.JoinIndex(leads, deals)
+    sel = index.select(np.arange(len(leads)), np.arange(len(deals)))
+    fuzzy = linkage.Linkage(leads, deals, index.pair_lead, index.pair_deal).pairs
+    assert len(fuzzy) > 0
+    assert body["n_both"] == sel.n_both
+    assert body["n_fuzzy"] == len(fuzzy)
+    assert body["n_only_lead"] == sel.n_only_lead - len(fuzzy)
+    assert body["n_only_deal"] == sel.n_only_deal - len(fuzzy)
+
+
+def test_etag_revalidation(server):
+    base = server[0]
+    status, head, body = get(base + "/aggregates?start=2022-01-01&end=2022-06-30")
+    assert status == 200 and body["filtri"]["start"].startswith("2022-01-01")
+    etag = head["ETag"]
+    status, _, body = get(base + "/aggregates?start=2022-01-01&end=2022-06-30", {"If-None-Match": etag})
+    assert (status, body) == (304, None)
+    status, head, _ = get(base + "/aggregates?start=2022-01-01&end=2022-07-31", {"If-None-Match": etag})
+    assert status == 200 and head["ETag"] != etag
+
+
+@pytest.mark.parametrize("path,status", [
+    ("/aggregates?start=2022-01-01", 400),
+    ("/aggregates?start=ieri&end=2022-01-01", 400),
+    ("/aggregates?start=2022-02-01&end=2022-01-01", 400),
+    ("/aggregates?dataset=nessuno", 404),
+    ("/altro", 404),
+])
+def test_errors(server, path, status):
+    got, _, body = get(server[0] + path)
+    assert got == status and body["errore"]
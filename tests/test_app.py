@@ -0,0 +1,23 @@
+import os
+import threading
+
+import dataset
+from conftest import ROOT
+
+
+def watchers():
+    return sum(t.name == "data-watcher" and t.is_alive() for t in threading.enumerate())
+
+
+def test_failed_first_load_leaves_no_watcher(tmp_path, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+
+    for name in ("DealDatatable.xlsx", "LeadArchiveDatatable.xlsx"):
+        (tmp_path / name).write_bytes(b"not a workbook")
+    monkeypatch.setattr(dataset, "DATA_DIR", str(tmp_path))
+    before = watchers()
+    for _ in range(3):
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+        at.run()
+        assert at.exception  # the load error reaches the page
+    assert watchers() == before
@@ -0,0 +1,53 @@
+import dataclasses
+import json
+import os
+
+import pandas as pd
+
+import cohort
+import dataset
+import synthetic
+
+
+def frames(n, seed):
+    deals, leads = synthetic.exports(n, seed=seed)
+    return dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+
+
+def changes(before, after, kind, base, sha256):
+    key = dataset.KEYS[kind]
+    old, new = before.copy(), after.copy()
+    old[dataset.ROW_HASH], new[dataset.ROW_HASH] = dataset.row_hashes(old), dataset.row_hashes(new)
+    inserted, updated, deleted = dataset.diff_export(old, new, key)
+    return dataset.Changeset(kind, inserted, updated, deleted, base=base, sha256=sha256)
+
+
+def test_updates_append_parts_and_match_a_rebuild(tmp_path):
+    deals, leads = frames(2000, 0)
+    first = [dataset.Changeset("deals", full=True, sha256="d0"), dataset.Changeset("leads", full=True, sha256="l0")]
+    cohort.load(leads, deals, first, "v0", str(tmp_path))
+    store = cohort._store_dir(str(tmp_path))
+    base_mtime = os.path.getmtime(os.path.join(store, "rows.parquet"))
+
+    new_deals = deals.copy()
+    concluded = new_deals.index[:300]
+    new_deals.loc[concluded, "STATO"] = "concluso"
+    new_deals.loc[concluded, "IS_CONCLUSO"] = True
+    new_deals.loc[concluded, "DATA ESITO"] = new_deals.loc[concluded, "DATA INGRESSO LEAD"] + pd.Timedelta(days=5)
+    new_leads = leads.iloc[100:]
+    update = [
+        changes(deals, new_deals, "deals", "d0", "d1"),
+        changes(leads, new_leads, "leads", "l0", "l1"),
+    ]
+    # As another process gets them, through the shared meta (see app.py)
+    update = [dataset.Changeset(**json.loads(json.dumps(dataclasses.asdict(ch)))) for ch in update]
+    got = cohort.load(new_leads, new_deals, update, "v1", str(tmp_path))
+
+    manifest = dataset._read_manifest(store)
+    assert manifest["incremental"] and manifest["parts"] == [1]
+    assert os.path.getmtime(os.path.join(store, "rows.parquet")) == base_mtime
+
+    want = cohort.Cohorts.build(new_leads, new_deals)
+    for c in (got, cohort.load(new_leads, new_deals, (), "v1", str(tmp_path))):
+        pd.testing.assert_frame_equal(c.matrix(), want.matrix())
+        assert len(c.rows) == len(want.rows)
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cube
+import dataset
+import synthetic
+
+
+def prepared(n):
+    deals, leads = synthetic.exports(n)
+    return dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+
+
+@pytest.fixture(scope="module")
+def small():
+    return prepared(200_000)
+
+
+def raw(df, date_col, corsi, providers, start, end, where=()):
+    """The rows the sidebar filters select, filtered with pandas."""
+    mask = pd.Series(True, index=df.index)
+    if corsi:
+        mask &= df["CORSI"].isin(corsi)
+    if providers:
+        mask &= df["PROVIDER"].isin(providers)
+    if start is not None:
+        day = df[date_col].dt.floor("D")
+        mask &= day.between(start, end) | day.isna()
+    for col, value, keep in where:
+        hit = (df[col] == value).fillna(False)
+        mask &= hit if keep else ~hit
+    return df[mask]
+
+
+def test_cells_fewer_than_rows(small):
+    deals, leads = small
+    assert cube.build_deals(deals).ncells < len(deals) / 3
+    assert cube.build_leads(leads).ncells < len(leads) / 5
+
+
+@pytest.mark.slow
+def test_cells_much_fewer_than_rows():
+    # The gain grows with the rows per month and breakdown.
+    deals, leads = prepared(1_000_000)
+    assert cube.build_deals(deals).ncells < len(deals) / 10
+    assert cube.build_leads(leads).ncells < len(leads) / 20
+
+
+@pytest.mark.parametrize("start,end", [
+    (None, None),
+    ("2021-03-17", "2022-08-02"),  # partial months at both ends
+    ("2022-05-01", "2022-05-31"),  # one whole month
+    ("2022-05-04", "2022-05-20"),  # inside a month
+])
+@pytest.mark.parametrize("corsi,providers", [((), ()), (("Blender",), ()), ((), ("Facebook",))])
+def test_rollups_match_the_raw_rows(small, start, end, corsi, providers):
+    deals, leads = small
+    if start is not None:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+    deal_cells = cube.select(cube.build_deals(deals), corsi, providers, start, end)
+    lead_cells = cube.select(cube.build_leads(leads), corsi, None, start, end)
+    cases = [
+        (deal_cells, deals, "DATA INGRESSO LEAD", providers, (), "STATO"),
+        (deal_cells, deals, "DATA INGRESSO LEAD", providers, (("STATO", cube.CONCLUSO, True),), "COMMERCIALE"),
+        (deal_cells, deals, "DATA INGRESSO LEAD", providers, (("STATO", cube.CONCLUSO, False),), "SOTTOSTATO"),
+        (deal_cells, deals, "DATA INGRESSO LEAD", providers, (("STATO", cube.CONCLUSO, False),), ["CORSI", "STATO"]),
+        (lead_cells, leads, "DATA ENTRATA", None, (), "PROVIDER"),
+        (lead_cells, leads, "DATA ENTRATA", None, (), ["CORSI", "STATO"]),
+    ]
+    for cells, df, date_col, prov, where, by in cases:
+        for w in where:
+            cells = cube.equal(cells, *w)
+        rows = raw(df, date_col, corsi, prov, start, end, where)
+        got = cube.rollup(cells, by).set_index(by)[cube.N]
+        want = rows.groupby(by, observed=True).size()
+        pd.testing.assert_series_equal(
+            got[got > 0].sort_index(), want[want > 0].sort_index().astype(got.dtype), check_names=False
+        )
+        assert cube.total(cells) == len(rows)
+
+    conclusi = cube.equal(deal_cells, "STATO", cube.CONCLUSO)
+    rows = raw(deals, "DATA INGRESSO LEAD", corsi, providers, start, end, (("STATO", cube.CONCLUSO, True),))
+    assert np.isclose(cube.total(conclusi, "IMPORTO CONTRATTO"), rows["IMPORTO CONTRATTO"].sum())
+
+    rows = raw(leads, "DATA ENTRATA", corsi, None, start, end)
+    want = rows.groupby(rows["DATA ENTRATA"].dt.to_period("W").dt.start_time).size()
+    assert cube.weekly(lead_cells)[cube.N].tolist() == want.tolist()
@@ -0,0 +1,94 @@
+import subprocess
+import sys
+import textwrap
+
+import pandas as pd
+import pytest
+from conftest import ROOT
+
+import dataset
+import synthetic
+
+
+def run_script(tmp_path, body):
+    """Run ``body`` as an unguarded ``__main__``, like the dashboard script
+    under Streamlit; return its stdout."""
+    script = tmp_path / "main.py"
+    script.write_text("print('main')\n" + textwrap.dedent(body))
+    done = subprocess.run(
+        [sys.executable, str(script)], cwd=ROOT, capture_output=True, text=True, timeout=300,
+        env={"PYTHONPATH": ROOT, "PATH": ""},
+    )
+    assert done.returncode == 0, done.stderr
+    return done.stdout
+
+
+def test_read_exports_from_unguarded_main(tmp_path, xlsx):
+    out = run_script(tmp_path, f"""
+        import dataset
+        parsed = dataset.read_exports({xlsx!r}, workers=2, min_bytes=0)
+        print(len(parsed["deals"]), len(parsed["leads"]))
+    """)
+    # The script body ran once: the workers did not re-import it.
+    assert out.split("\n")[:2] == ["main", "200 200"]
+
+
+def test_read_exports_matches_serial(tmp_path, xlsx, monkeypatch):
+    # As the Parquet copy of load_export gives it back.
+    serial = {}
+    for kind, path in xlsx.items():
+        dataset.read_export(path, kind).to_parquet(tmp_path / kind, index=False)
+        serial[kind] = pd.read_parquet(tmp_path / kind)
+
+    def parse_here(path, kind):
+        raise AssertionError("parsed in this process, not in a worker")
+
+    monkeypatch.setattr(dataset, "read_export", parse_here)
+    parallel = dataset.read_exports(xlsx, workers=2, min_bytes=0)
+    for kind in xlsx:
+        pd.testing.assert_frame_equal(parallel[kind], serial[kind])
+
+
+def test_read_exports_raises_the_parse_error(tmp_path, xlsx):
+    bad = tmp_path / "LeadArchiveDatatable.xlsx"
+    bad.write_bytes(b"not a workbook")
+    with pytest.raises(Exception, match="format"):
+        dataset.read_exports({"deals": xlsx["deals"], "leads": str(bad)}, workers=2, min_bytes=0)
+
+
+def sorted_rows(df, key):
+    df = df.drop(columns=dataset.ROW_HASH, errors="ignore")
+    return df.sort_values(key, ignore_index=True)
+
+
+@pytest.mark.parametrize("kind", ["deals", "leads"])
+def test_ingest_applies_only_the_changed_rows(tmp_path, kind):
+    key = dataset.KEYS[kind]
+    cache = str(tmp_path / "cache")
+    path = str(tmp_path / f"{kind}.xlsx")
+    export = synthetic.exports(200)[0 if kind == "deals" else 1]
+    export.to_excel(path, index=False)
+
+    df, changes = dataset.ingest(path, kind, cache)
+    assert changes.full
+    df, changes = dataset.ingest(path, kind, cache)
+    assert changes.empty and len(df) == 200
+
+    for n in range(dataset.MAX_DELTAS + 2):  # the last ones compact the deltas
+        updated = export[key].iloc[10 * n:10 * n + 3].tolist()
+        export.loc[export[key].isin(updated), "COGNOME"] = f"Rossi{n}"
+        deleted = export[key].iloc[-2:].tolist()
+        inserted = export.iloc[:2].copy()
+        inserted[key] = export[key].max() + [1, 2]
+        export = pd.concat([export[~export[key].isin(deleted)], inserted], ignore_index=True)
+        export.to_excel(path, index=False)
+
+        assert dataset.pending({kind: path}, cache_dir=cache) == {kind: path}
+        df, changes = dataset.ingest(path, kind, cache)
+        assert (sorted(changes.updated), sorted(changes.deleted)) == (sorted(updated), sorted(deleted))
+        assert sorted(changes.inserted) == inserted[key].tolist()
+        pd.testing.assert_frame_equal(
+            sorted_rows(df, key), sorted_rows(dataset.read_export(path, kind), key), check_dtype=False
+        )
+        assert len(dataset._read_manifest(dataset._store_dir(cache, kind))["deltas"]) <= dataset.MAX_DELTAS
+    assert dataset.pending({kind: path}, cache_dir=cache) == {}
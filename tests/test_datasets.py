@@ -0,0 +1,26 @@
+import pandas as pd
+import pytest
+
+import datasets
+import shared
+
+
+def test_cache_evicts_least_recently_used():
+    evicted = []
+    cache = datasets.DatasetCache(10, sizeof=len, on_evict=evicted.append)
+    cache.get("a", lambda: "aaaa")
+    cache.get("b", lambda: "bbbb")
+    cache.get("a", lambda: "never loaded")
+    cache.get("c", lambda: "cccc")
+    assert evicted == ["bbbb"]
+    assert cache.names == ["a", "c"]
+    assert cache.values() == ["aaaa", "cccc"]
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 3, 1)
+
+
+def test_mapped_frames_count_only_their_own_memory(tmp_path):
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"ID": range(10_000), "NOME": [f"nome {i}" for i in range(10_000)]})
+    mapped = shared.publish("v1", {"deals": df}, str(tmp_path))["deals"]
+    assert datasets.frames_nbytes([df]) == df.memory_usage(deep=True).sum()
+    assert datasets.frames_nbytes([mapped]) < df.memory_usage(deep=True).sum() / 10
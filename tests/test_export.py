@@ -0,0 +1,73 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import dataset
+import export
+import join
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def frames():
+    deals, leads = synthetic.exports(500)
+    return dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(export, "CHUNK_ROWS", 37)
+
+
+def test_csv_matches_a_single_to_csv(frames):
+    deals = frames[0]
+    rows = np.flatnonzero(deals["CORSI"] == "Blender")
+    want = deals.take(rows).to_csv(index=False).encode("utf-8")
+    assert export.write_csv(deals.take, rows) == want
+
+
+def test_parquet_has_one_row_group_per_chunk(frames):
+    deals = frames[0]
+    rows = np.arange(len(deals))
+    data = export.write_parquet(deals.take, rows)
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == -(-len(rows) // 37)
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(io.BytesIO(data)), deals.reset_index(drop=True), check_dtype=False, check_categorical=False
+    )
+
+
+def test_join_export_keeps_one_schema_across_chunks(frames):
+    # Chunks of matched rows only, then of one-sided rows: the missing side
+    # must not change the column types between row groups.
+    deals, leads = frames
+    sel = join.JoinIndex(leads, deals).select(np.arange(len(leads)), np.arange(len(deals)))
+    rows = np.arange(len(sel))
+    data = export.write_parquet(lambda r: sel.frame(rows=r), rows)
+    got = pd.read_parquet(io.BytesIO(data))
+    assert len(got) == len(sel)
+    assert export.write_csv(lambda r: sel.frame(rows=r), rows) == sel.frame().to_csv(index=False).encode("utf-8")
+
+
+def test_empty_selection(frames):
+    deals = frames[0]
+    rows = np.empty(0, dtype=np.int64)
+    assert export.write_csv(deals.take, rows).decode("utf-8").strip() == ",".join(deals.columns)
+    assert len(pd.read_parquet(io.BytesIO(export.write_parquet(deals.take, rows)))) == 0
+
+
+def test_cache_builds_once_and_drops_the_oldest():
+    cache = export.ExportCache(max_bytes=10)
+    built = []
+
+    def build(value):
+        built.append(value)
+        return value
+
+    assert cache.get("a", lambda: build(b"123456")) == b"123456"
+    assert cache.get("a", lambda: build(b"other")) == b"123456"
+    cache.get("b", lambda: build(b"7890ab"))
+    assert cache.get("a", lambda: build(b"again")) == b"again"
+    assert built == [b"123456", b"7890ab", b"again"]
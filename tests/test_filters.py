@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+import filters
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def frames():
+    deals, leads = synthetic.exports(5000)
+    deals, leads = dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+    # Undated rows pass any date filter.
+    deals.loc[::50, "DATA INGRESSO LEAD"] = pd.NaT
+    leads.loc[::50, "DATA ENTRATA"] = pd.NaT
+    return deals, leads
+
+
+def masked(df, date_col, values, start, end):
+    """The copy-and-mask filtering the indexes replace."""
+    mask = pd.Series(True, index=df.index)
+    for col, selected in values.items():
+        if selected:
+            mask &= df[col].isin(selected)
+    if start is not None:
+        dates = df[date_col]
+        mask &= ((dates >= start) & (dates < end + pd.Timedelta(days=1))) | dates.isna()
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.mark.parametrize("corsi,providers,start,end", [
+    ([], [], None, None),
+    (["Blender"], [], None, None),
+    ([], ["CULT ADV", "E-LEAD"], None, None),
+    (["Blender", "Data Analyst", "nessuno"], ["CULT ADV"], None, None),
+    ([], [], "2022-03-17", "2022-03-17"),
+    (["Blender"], ["CULT ADV"], "2021-01-01", "2023-06-30"),
+    ([], [], "2099-01-01", "2099-12-31"),
+])
+def test_select_rows_matches_the_masks(frames, corsi, providers, start, end):
+    deals, leads = frames
+    if start is not None:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+    deal_pos, lead_pos = filters.select_rows(filters.build(deals, leads), corsi, providers, start, end)
+    np.testing.assert_array_equal(
+        deal_pos, masked(deals, "DATA INGRESSO LEAD", {"CORSI": corsi, "PROVIDER": providers}, start, end)
+    )
+    np.testing.assert_array_equal(lead_pos, masked(leads, "DATA ENTRATA", {"CORSI": corsi}, start, end))
@@ -0,0 +1,39 @@
+import json
+import os
+import shutil
+
+from test_dataset import run_script
+
+import history
+import synthetic
+
+
+def test_read_states_from_unguarded_main(tmp_path, xlsx):
+    paths = [str(tmp_path / f"DealDatatable{i}.xlsx") for i in range(2)]
+    for path in paths:
+        shutil.copy(xlsx["deals"], path)
+    cache = str(tmp_path / "cache")
+    out = run_script(tmp_path, f"""
+        import history
+        states = history.read_states({paths!r}, {cache!r}, workers=2)
+        print([len(s) for s in states])
+    """)
+    assert out.split("\n")[:2] == ["main", "[200, 200]"]
+    states = history.read_states(paths, cache, workers=2)
+    assert all(s.equals(states[0]) for s in states)
+
+
+def test_parallel_load_records_every_snapshot(tmp_path):
+    deals = synthetic.exports(200)[0]
+    folder = tmp_path / "exports"
+    folder.mkdir()
+    for i in range(8):
+        deals.loc[i, "STATO"] = "Concluso"  # a content of its own per snapshot
+        deals.to_excel(folder / f"DealDatatable{i}.xlsx", index=False)
+    cache = str(tmp_path / "cache")
+    snaps = history.snapshots(data_dir=str(folder), cache_dir=cache)
+    history.load(snaps, cache, workers=8)
+    with open(os.path.join(cache, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    assert sorted(index) == sorted(s["path"] for s in snaps)
+    assert not [n for n in os.listdir(cache) if n.endswith(".tmp")]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+import join
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def frames():
+    deals, leads = synthetic.exports(2000)
+    return dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+
+
+def canonical(df):
+    """Rows in one order, whatever order the join produced them in."""
+    keys = ["_merge", join.LEFT_ON, join.RIGHT_ON, "ID_lead", "ID_deal"]
+    return df.sort_values(keys, ignore_index=True)[sorted(df.columns)]
+
+
+@pytest.mark.parametrize("corsi", [None, ["Blender", "Data Analyst"]])
+def test_selection_matches_an_outer_merge(frames, corsi):
+    deals, leads = frames
+    lead_pos, deal_pos = np.arange(len(leads)), np.arange(len(deals))
+    if corsi:
+        lead_pos = np.flatnonzero(leads["CORSI"].isin(corsi))
+        deal_pos = np.flatnonzero(deals["CORSI"].isin(corsi))
+    sel = join.JoinIndex(leads, deals).select(lead_pos, deal_pos)
+
+    want = leads.iloc[lead_pos].merge(
+        deals.iloc[deal_pos], left_on=join.LEFT_ON, right_on=join.RIGHT_ON,
+        how="outer", indicator=True, suffixes=join.SUFFIXES,
+    )
+    got = sel.frame()
+    assert (sel.n_both, sel.n_only_lead, sel.n_only_deal) == tuple(
+        (want["_merge"] == m).sum() for m in (join.BOTH, join.LEFT_ONLY, join.RIGHT_ONLY)
+    )
+    pd.testing.assert_frame_equal(canonical(got), canonical(want), check_dtype=False, check_categorical=False)
+
+    both = sel.both(["ID LEAD", "STATO_deal"])
+    want = want[want["_merge"] == join.BOTH]
+    assert list(both.columns) == ["ID LEAD", "STATO_deal"]
+    assert sorted(both["ID LEAD"]) == sorted(want["ID LEAD"])
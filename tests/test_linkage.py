@@ -0,0 +1,25 @@
+import pandas as pd
+
+import linkage
+
+
+def frame(key, rows):
+    cols = ["COGNOME", "NOME", "EMAIL", "TELEFONO", "CORSI"]
+    df = pd.DataFrame(rows, columns=cols)
+    df.insert(0, key, range(len(df)))
+    return df
+
+
+def test_name_and_corso_link_without_contacts():
+    leads = frame(linkage.LEAD_KEY, [
+        ("Rossi", "Anna", None, None, "Blender"),
+        ("Bianchi", "Luca", "luca@example.it", None, "Blender"),
+        ("Verdi", "Marta", None, None, "Blender"),
+    ])
+    deals = frame(linkage.DEAL_KEY, [
+        ("Rossi", "Anna", None, None, "Blender"),
+        ("Neri", "Paolo", "luca@example.it", None, "Blender"),
+        ("Verdi", "Marta", None, None, "Segreteria Amministrativa"),
+    ])
+    pairs = linkage.Linkage(leads, deals).pairs
+    assert list(zip(pairs["lead"], pairs["deal"], pairs["criteri"])) == [(0, 0, "nome + corso")]
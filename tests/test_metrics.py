@@ -0,0 +1,101 @@
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+import metrics
+import report
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def frames():
+    deals, leads = synthetic.exports(20_000, match_rate=0.7)
+    return dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+
+
+@pytest.fixture(scope="module")
+def engine(frames):
+    return metrics.Engine(*frames)
+
+
+def pandas_report(deals, leads, corsi, start, end):
+    """The metrics as app.py computed them inline, on filtered copies."""
+    if corsi:
+        deals, leads = deals[deals["CORSI"].isin(corsi)], leads[leads["CORSI"].isin(corsi)]
+    if start is not None:
+        until = end + pd.Timedelta(days=1)
+        d, l = deals["DATA INGRESSO LEAD"], leads["DATA ENTRATA"]
+        deals = deals[((d >= start) & (d < until)) | d.isna()]
+        leads = leads[((l >= start) & (l < until)) | l.isna()]
+    won = deals[deals["STATO"] == metrics.CONCLUSO]
+    merged = leads.merge(deals, left_on="ID LEAD", right_on="LEAD_ID", how="outer",
+                         indicator=True, suffixes=("_lead", "_deal"))
+    both = merged[merged["_merge"] == "both"]
+    both_won = both[both["STATO_deal"] == metrics.CONCLUSO]
+    days = (both_won["DATA ESITO"] - both_won["DATA ENTRATA"]).dt.days.dropna()
+    per_corso = deals.groupby("CORSI", observed=True).size()
+    won_per_corso = won.groupby("CORSI", observed=True).size().reindex(per_corso.index, fill_value=0)
+    return {
+        "n_leads": len(leads),
+        "n_deals": len(deals),
+        "n_conclusi": len(won),
+        "tasso": len(won) / len(deals) * 100 if len(deals) else 0.0,
+        "fatturato": won["IMPORTO CONTRATTO"].sum(),
+        "n_both": len(both),
+        "funnel": {"Lead Totali": len(leads), "Lead con Deal": len(both), "Vendite Concluse": len(both_won)},
+        "avg_days": days.mean() if len(days) else None,
+        "conversione": (per_corso, won_per_corso),
+    }
+
+
+@pytest.mark.parametrize("corsi,start,end", [
+    ((), None, None),
+    (("Blender", "Data Analyst"), None, None),
+    ((), "2021-03-17", "2022-08-02"),
+    (("Blender",), "2022-01-01", "2022-12-31"),
+])
+def test_report_matches_the_inline_pandas(frames, engine, corsi, start, end):
+    if start is not None:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+    got = engine.report(corsi, (), start, end)
+    want = pandas_report(*frames, corsi, start, end)
+    for name in ("n_leads", "n_deals", "n_conclusi", "n_both", "funnel"):
+        assert got[name] == want[name], name
+    assert got["tasso"] == pytest.approx(want["tasso"])
+    assert got["fatturato"] == pytest.approx(want["fatturato"])
+    assert got["avg_days"] == pytest.approx(want["avg_days"])
+    per_corso, won_per_corso = want["conversione"]
+    conv = got["conversione_corsi"].set_index("CORSI")
+    assert conv["Deal Totali"].to_dict() == per_corso.to_dict()
+    assert conv["Conclusi"].to_dict() == won_per_corso.to_dict()
+    # Every unmatched row is either only-lead, only-deal or half a fuzzy pair.
+    assert got["n_only_lead"] + got["n_fuzzy"] == want["n_leads"] - want["n_both"]
+
+
+def test_report_outputs(engine, tmp_path):
+    results = [
+        {"start": s, "end": e, "corso": c, **engine.report([c] if c else [], [], s, e)}
+        for s, e in [(pd.Timestamp("2022-01-01"), pd.Timestamp("2022-01-31"))]
+        for c in (None, "Blender")
+    ]
+    report.write_json(results, tmp_path / "out.json")
+    data = json.loads((tmp_path / "out.json").read_text(encoding="utf-8"))
+    assert [r["corso"] for r in data] == [None, "Blender"]
+    assert data[0]["start"] == "2022-01-01" and data[1]["n_deals"] == results[1]["n_deals"]
+
+    long = report.long_table(results)
+    assert set(long["metric"]) >= {"n_deals", "funnel.Lead Totali", "conversione_corsi.Tasso %"}
+    n_deals = long[(long["metric"] == "n_deals") & long["corso"].isna()]["value"]
+    assert n_deals.tolist() == [results[0]["n_deals"]]
+    assert np.issubdtype(long["value"].dtype, np.floating)
+
+
+def test_parse_window():
+    assert report.parse_window("2024-01-01:2024-03-31") == (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-03-31"))
+    for bad in ("2024-01-01", "2024-03-31:2024-01-01", "ieri:oggi"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            report.parse_window(bad)
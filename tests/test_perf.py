@@ -0,0 +1,37 @@
+import tracemalloc
+
+import pytest
+
+import perf
+
+
+@pytest.mark.parametrize("url,env,level", [
+    (None, None, None),
+    ("time", None, "time"),
+    ("memory", None, "time"),  # a viewer never turns tracing on
+    (None, "memory", "memory"),
+    ("1", "memory", "time"),
+])
+def test_request_level(url, env, level):
+    assert perf.request_level(url, env) == level
+
+
+def test_memory_recorder_stops_the_tracing_it_started(tmp_path):
+    assert not tracemalloc.is_tracing()
+    rec = perf.Recorder("memory")
+    with rec.stage("alloc"):
+        data = [0] * 100_000
+    assert tracemalloc.is_tracing()
+    run = rec.finish(str(tmp_path / "perf.jsonl"))
+    assert not tracemalloc.is_tracing()
+    assert run["stages"][0]["peak_mb"] > 0
+    del data
+
+
+def test_memory_recorder_leaves_outside_tracing_alone(tmp_path):
+    tracemalloc.start()
+    try:
+        perf.Recorder("memory").finish(str(tmp_path / "perf.jsonl"))
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
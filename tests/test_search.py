@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+import join
+import search
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def frames():
+    deals, leads = synthetic.exports(2000)
+    deals, leads = dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+    deals.loc[7, "COGNOME"] = "Savané"
+    return deals, leads
+
+
+def scan(df, query):
+    """Row-by-row reference: every term is a prefix of a word of one of
+    its field's columns (any field when unscoped)."""
+    mask = pd.Series(True, index=df.index)
+    for field, token in search.parse(query):
+        cols = [c for f, cs in search.FIELDS.items() if field in (None, f) for c in cs if c in df.columns]
+        hit = pd.Series(False, index=df.index)
+        for col in cols:
+            hit |= df[col].map(
+                lambda v: pd.notna(v) and any(w.startswith(token) for w in search.tokenize(v))
+            ).astype(bool)
+        mask &= hit
+    return np.flatnonzero(mask.to_numpy())
+
+
+QUERIES = ["ross", "savane", "commerciale:commerciale corso:blender", "gmail 34", "corso:web nome:m", "zzzz"]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_positions_match_a_row_scan(frames, query):
+    for df in frames:
+        np.testing.assert_array_equal(search.SearchIndex(df).positions(query), scan(df, query))
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_join_mask_matches_a_scan_of_the_merged_rows(frames, query):
+    deals, leads = frames
+    sel = join.JoinIndex(leads, deals).select(np.arange(len(leads)), np.arange(len(deals)))
+    mask = search.join_mask(query, [
+        (search.SearchIndex(leads), sel.lead_pos),
+        (search.SearchIndex(deals), sel.deal_pos),
+    ])
+    # The merged frame carries each field on both sides (COGNOME_lead...).
+    want = np.zeros(len(sel), dtype=bool)
+    want[scan(sel.frame(), query)] = True
+    np.testing.assert_array_equal(mask, want)
@@ -0,0 +1,43 @@
+import json
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import shared
+
+pytest.importorskip("pyarrow")
+
+FRAMES = {"deals": pd.DataFrame({"ID": [1, 2]})}
+
+
+def test_publish_removes_only_older_finished_versions(tmp_path):
+    shared_dir = str(tmp_path)
+    shared.publish("v1", FRAMES, shared_dir)
+    writing = tmp_path / f"v0.{os.getpid() + 1}.tmp"
+    writing.mkdir()
+    time.sleep(0.01)
+    shared.publish("v2", FRAMES, shared_dir)
+    assert shared.current(shared_dir) == "v2"
+    assert not (tmp_path / "v1").exists()
+    assert writing.exists()
+
+
+def test_older_version_does_not_roll_back_current(tmp_path):
+    shared_dir = str(tmp_path)
+    shared.publish("v2", FRAMES, shared_dir)
+    (tmp_path / "v1").mkdir()
+    os.utime(tmp_path / "v1", (0, 0))
+    shared._swap(shared_dir, "v1")
+    assert shared.current(shared_dir) == "v2"
+    assert (tmp_path / "v2").exists()
+
+
+def test_attach_leaves_current_alone(tmp_path):
+    shared_dir = str(tmp_path)
+    shared.publish("v1", FRAMES, shared_dir)
+    (tmp_path / "CURRENT").write_text(json.dumps({"version": "v9"}))
+    frames = shared.attach("v1", ["deals"], shared_dir)
+    assert frames["deals"].equals(FRAMES["deals"])
+    assert shared.current(shared_dir) == "v9"
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cube
+import dataset
+import sketch
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def deals():
+    return dataset.prepare_deals(synthetic.exports(200_000)[0])
+
+
+def test_sketches_never_hold_more_than_the_values(deals):
+    sk = sketch.build(deals)
+    assert sk.ncells <= len(sk.df)
+
+
+@pytest.mark.parametrize("min_gain", [cube.MIN_GAIN, 0])  # values / cubes
+def test_quantiles_within_relative_accuracy(deals, monkeypatch, min_gain):
+    monkeypatch.setattr(cube, "MIN_GAIN", min_gain)
+    sk = sketch.build(deals)
+    start, end = pd.Timestamp("2021-03-17"), pd.Timestamp("2023-08-02")
+    out = sketch.quantiles(cube.select(sk, ["Blender"], None, start, end), "PROVIDER")
+
+    won = deals[deals["IS_CONCLUSO"] & (deals["CORSI"] == "Blender")]
+    day = won["DATA INGRESSO LEAD"].dt.floor("D")
+    won = won[day.between(start, end) | day.isna()]
+    days = (won["DATA ESITO"] - won["DATA INGRESSO LEAD"]).dt.days
+    for _, row in out[out[sketch.METRIC] == sketch.DAYS].iterrows():
+        values = days[won["PROVIDER"] == row["PROVIDER"]].dropna().to_numpy()
+        assert row[cube.N] == len(values)
+        for q in sketch.QUANTILES:
+            want = np.quantile(values, q, method="lower")
+            got = row[f"p{round(q * 100):g}"]
+            assert abs(got - want) <= sketch.RELATIVE_ACCURACY * max(abs(want), 1) + 1e-9
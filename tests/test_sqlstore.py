@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from test_cube import raw
+
+import cube
+import dataset
+import sqlstore
+import synthetic
+
+
+@pytest.fixture(scope="module")
+def stored(tmp_path_factory):
+    deals, leads = synthetic.exports(20_000)
+    deals, leads = dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+    deals.loc[::97, "DATA INGRESSO LEAD"] = pd.NaT
+    folder = str(tmp_path_factory.mktemp("sqlite"))
+    store = sqlstore.open_store("v-test", {"deals": deals, "leads": leads}, folder)
+    return store, deals, leads, folder
+
+
+@pytest.mark.parametrize("corsi,providers,start,end", [
+    ((), (), None, None),
+    (("Blender", "Data Analyst"), (), None, None),
+    ((), ("CULT ADV",), "2021-03-17", "2022-08-02"),
+    (("Blender",), (), "2022-05-04", "2022-05-04"),
+])
+def test_cells_match_the_raw_rows(stored, corsi, providers, start, end):
+    store, deals, leads, _ = stored
+    if start is not None:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+    deal_cells = store.cells("deals", list(corsi), list(providers), start, end)
+    lead_cells = store.cells("leads", list(corsi), None, start, end)
+    cases = [
+        (deal_cells, deals, "DATA INGRESSO LEAD", providers, (), "STATO"),
+        (deal_cells, deals, "DATA INGRESSO LEAD", providers, (("STATO", cube.CONCLUSO, True),), "COMMERCIALE"),
+        (deal_cells, deals, "DATA INGRESSO LEAD", providers, (("STATO", cube.CONCLUSO, False),), ["CORSI", "SOTTOSTATO"]),
+        (lead_cells, leads, "DATA ENTRATA", None, (), "PROVIDER"),
+    ]
+    for cells, df, date_col, prov, where, by in cases:
+        for w in where:
+            cells = cube.equal(cells, *w)
+        rows = raw(df, date_col, corsi, prov, start, end, where)
+        got = cube.rollup(cells, by).set_index(by)[cube.N]
+        want = rows.groupby(by, observed=True).size()
+        assert got[got > 0].to_dict() == want[want > 0].to_dict()
+        assert cube.total(cells) == len(rows)
+
+    rows = raw(deals, "DATA INGRESSO LEAD", corsi, providers, start, end, (("STATO", cube.CONCLUSO, True),))
+    conclusi = cube.equal(deal_cells, "STATO", cube.CONCLUSO)
+    assert np.isclose(cube.total(conclusi, "IMPORTO CONTRATTO"), rows["IMPORTO CONTRATTO"].sum())
+
+    rows = raw(leads, "DATA ENTRATA", corsi, None, start, end)
+    want = rows.groupby(rows["DATA ENTRATA"].dt.to_period("W").dt.start_time).size()
+    assert cube.weekly(lead_cells)[cube.N].tolist() == want.tolist()
+
+
+def test_open_store_reuses_the_database_of_a_version(stored):
+    store, deals, leads, folder = stored
+    again = sqlstore.open_store("v-test", {"deals": deals.iloc[:0], "leads": leads.iloc[:0]}, folder)
+    assert cube.total(again.cells("deals")) == len(deals)
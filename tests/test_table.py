@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset
+import join
+import synthetic
+import table
+
+
+@pytest.fixture(scope="module")
+def frames():
+    deals, leads = synthetic.exports(2000)
+    deals, leads = dataset.prepare_deals(deals), dataset.prepare_leads(leads)
+    deals.loc[::9, "COGNOME"] = None
+    return deals, leads
+
+
+@pytest.mark.parametrize("col", ["COGNOME", "STATO", "DATA INGRESSO LEAD", "IMPORTO CONTRATTO", "LEAD_ID"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_sorted_selection_matches_sort_values(frames, col, descending):
+    deals = frames[0]
+    rows = np.flatnonzero(deals["CORSI"] != "Blender")
+    order = table.sort_order(table.SortIndex(deals).keys(col, rows), descending)
+    want = deals.iloc[rows].sort_values(col, ascending=not descending, kind="stable", na_position="last")
+    np.testing.assert_array_equal(rows[order], deals.index.get_indexer(want.index))
+
+
+def test_missing_join_side_sorts_last(frames):
+    deals, leads = frames
+    sel = join.JoinIndex(leads, deals).select(np.arange(len(leads)), np.arange(len(deals)))
+    side, col, pos = sel.source("STATO_deal")
+    assert (side, col) == ("deal", "STATO")
+    merged = sel.frame(["STATO_deal"])["STATO_deal"]
+    for descending in (False, True):
+        order = table.sort_order(table.SortIndex(deals).keys(col, pos), descending)
+        want = merged.sort_values(ascending=not descending, kind="stable", na_position="last")
+        np.testing.assert_array_equal(order, want.index.to_numpy())
@@ -0,0 +1,90 @@
+import os
+import time
+
+import pytest
+
+import watcher
+
+PATTERNS = ["DealDatatable*.xlsx", "LeadArchiveDatatable*.xlsx"]
+
+
+def write(folder, name, text, age=0):
+    path = folder / name
+    path.write_text(text)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+class Build:
+    """Records its calls; raises while ``fail`` is set."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, deal_file, lead_file):
+        self.calls.append((os.path.basename(deal_file), os.path.basename(lead_file)))
+        if self.fail:
+            raise ValueError("export incompleto")
+        return self.calls[-1]
+
+
+def test_get_builds_once_and_check_swaps_new_exports(tmp_path):
+    write(tmp_path, "DealDatatable.xlsx", "a", age=60)
+    write(tmp_path, "LeadArchiveDatatable.xlsx", "a")
+    build = Build()
+    w = watcher.Watcher(build, PATTERNS, str(tmp_path), interval=0)
+    assert w.get() == ("DealDatatable.xlsx", "LeadArchiveDatatable.xlsx")
+    assert not w.check() and len(build.calls) == 1
+
+    write(tmp_path, "DealDatatable (2).xlsx", "b")
+    assert w.check()
+    assert w.get() == ("DealDatatable (2).xlsx", "LeadArchiveDatatable.xlsx")
+
+
+def test_failed_build_keeps_the_data_and_retries_on_change(tmp_path):
+    write(tmp_path, "DealDatatable.xlsx", "a")
+    write(tmp_path, "LeadArchiveDatatable.xlsx", "a")
+    build = Build()
+    w = watcher.Watcher(build, PATTERNS, str(tmp_path), interval=0)
+    first = w.get()
+
+    build.fail = True
+    write(tmp_path, "LeadArchiveDatatable.xlsx", "in copia")
+    assert not w.check()
+    assert w.get() is first and isinstance(w.error, ValueError)
+    assert not w.check() and len(build.calls) == 2  # same files: no retry
+
+    build.fail = False
+    write(tmp_path, "LeadArchiveDatatable.xlsx", "copiato")  # another size: retried
+    assert w.check() and w.error is None and len(build.calls) == 3
+
+
+def test_first_load_error_is_raised(tmp_path):
+    w = watcher.Watcher(Build(), PATTERNS, str(tmp_path), interval=0)
+    with pytest.raises(FileNotFoundError):
+        w.get()
+
+
+def test_background_thread_reloads_and_stops(tmp_path):
+    write(tmp_path, "DealDatatable.xlsx", "a", age=60)
+    write(tmp_path, "LeadArchiveDatatable.xlsx", "a")
+    build = Build()
+    w = watcher.Watcher(build, PATTERNS, str(tmp_path), interval=0.05).start()
+    w.get()
+    write(tmp_path, "DealDatatable (2).xlsx", "b")
+    deadline = time.time() + 10
+    while w.data[0] != "DealDatatable (2).xlsx" and time.time() < deadline:
+        time.sleep(0.02)
+    assert w.data[0] == "DealDatatable (2).xlsx"
+
+    w.refresh()
+    deadline = time.time() + 10
+    while len(build.calls) < 3 and time.time() < deadline:
+        time.sleep(0.02)
+    assert len(build.calls) == 3
+
+    w.stop()
+    w._thread.join(5)
+    assert not w._thread.is_alive()
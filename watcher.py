@@ -0,0 +1,117 @@
+"""Background reload of the dashboard data when new exports arrive.
+
+A :class:`Watcher` polls the data directory from a daemon thread. When the
+newest Deal / Lead export changes (path, modification time or size), it
+builds the new dataset in that thread and then swaps it in with a single
+assignment: reruns keep reading the previous dataset until the new one is
+complete, so no session waits on a reload and no two sessions parse the
+same files. Only the very first load, before any dataset exists, happens
+on the request path.
+
+An export that fails to load (typically still being copied) keeps the
+previous dataset in place; it is retried as soon as its size or
+modification time changes.
+"""
+import os
+import threading
+import time
+
+import dataset
+
+
+def signature(patterns, data_dir=dataset.DATA_DIR):
+    """``(path, mtime_ns, size)`` of the newest file for each pattern; None
+    when a pattern matches no file."""
+    out = []
+    for pattern in patterns:
+        try:
+            path = dataset.latest_export(pattern, data_dir)
+            stat = os.stat(path)
+        except OSError:
+            return None
+        out.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(out)
+
+
+class Watcher:
+    """Keeps ``build(*paths)`` of the newest exports matching ``patterns``.
+
+    ``interval`` is the polling period in seconds; with 0 the data only
+    changes on :meth:`refresh`.
+    """
+
+    def __init__(self, build, patterns, data_dir=dataset.DATA_DIR, interval=10.0):
+        self.build = build
+        self.patterns = patterns
+        self.data_dir = data_dir
+        self.interval = interval
+        self.data = None  # result of the last successful build
+        self.error = None  # exception of the last failed build
+        self.loaded_at = None
+        self._signature = None  # exports ``data`` was built from
+        self._failed = None  # exports the last failed build was given
+        self._force = False
+        self._stopped = False
+        self._lock = threading.Lock()  # one build at a time
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="data-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """End the polling thread (the data stays readable)."""
+        self._stopped = True
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                self.check()
+            except Exception as exc:  # keep watching whatever happens
+                self.error = exc
+
+    def check(self):
+        """Build and swap in the data if the newest exports changed (or a
+        refresh was requested). True when new data was swapped in."""
+        sig = signature(self.patterns, self.data_dir)
+        with self._lock:
+            force, self._force = self._force, False
+            if sig is None:
+                self.error = FileNotFoundError(os.path.join(self.data_dir, self.patterns[0]))
+                return False
+            if not force and sig in (self._signature, self._failed):
+                return False
+            try:
+                data = self.build(*(path for path, _, _ in sig))
+            except Exception as exc:
+                self.error, self._failed = exc, sig
+                return False
+            self.data, self.error, self._signature, self._failed = data, None, sig, None
+            self.loaded_at = time.time()
+            return True
+
+    def refresh(self):
+        """Rebuild from the current exports in the background thread."""
+        self._force = True
+        self._wake.set()
+
+    @property
+    def busy(self):
+        return self._lock.locked()
+
+    def get(self):
+        """The current data; the first call builds it. Raises the build error
+        while no data was ever loaded."""
+        if self.data is None:
+            self.check()
+            if self.data is None:
+                raise self.error
+        return self.data